@@ -0,0 +1,84 @@
+"""
+Single-writer executors for rooms
+
+Every change to a room's game state goes through its actor: network readers
+only parse messages and submit commands, and the actor applies them one at
+a time in submission order. A room's players, market and turn order are
+therefore only ever touched by one thread (or one task), so rooms need no
+locks and never contend with each other.
+"""
+
+import asyncio
+import queue
+import threading
+from connection import write_batch
+
+_STOP = object()  # Queue sentinel: finish what is queued, then exit
+
+
+class RoomActor:
+    """Thread that runs one room's commands in order"""
+    def __init__(self, name):
+        self.name = name
+        self.commands = queue.SimpleQueue()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name=f"room-{name}", daemon=True)
+        self.thread.start()
+    
+    def submit(self, func, *args):
+        """Queue func(*args) to run on the actor"""
+        if not self.stopped:
+            self.commands.put((func, args))
+    
+    def stop(self):
+        """Stop once the commands already queued have run"""
+        self.stopped = True
+        self.commands.put(_STOP)
+    
+    def run(self):
+        """Take every command that is waiting and run them as one write batch"""
+        while True:
+            commands = [self.commands.get()]
+            while not self.commands.empty():
+                commands.append(self.commands.get_nowait())
+            
+            with write_batch():
+                for command in commands:
+                    if command is _STOP:
+                        return
+                    self.execute(command)
+    
+    def execute(self, command):
+        func, args = command
+        try:
+            func(*args)
+        except Exception as e:
+            print(f"[room {self.name}] Error handling command {func.__name__}: {e}")
+    
+    def queue_depth(self):
+        """Number of commands waiting to run"""
+        return self.commands.qsize()
+
+
+class AsyncRoomActor(RoomActor):
+    """Task on the server's event loop that runs one room's commands in order"""
+    def __init__(self, name):
+        self.name = name
+        self.commands = asyncio.Queue()
+        self.stopped = False
+        self.task = asyncio.get_running_loop().create_task(self.run())
+    
+    def submit(self, func, *args):
+        if not self.stopped:
+            self.commands.put_nowait((func, args))
+    
+    def stop(self):
+        self.stopped = True
+        self.commands.put_nowait(_STOP)
+    
+    async def run(self):
+        while True:
+            command = await self.commands.get()
+            if command is _STOP:
+                return
+            self.execute(command)
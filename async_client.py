@@ -0,0 +1,355 @@
+"""
+asyncio client API for the game server
+
+AsyncGameClient speaks the same framed protocol as the other clients but
+needs no thread per connection, so one process can drive hundreds of games
+at once (bench.py does). It follows redirects from workers and the room
+directory, applies game_state patches (asking for a resync when it loses
+track) and turns every server message into a GameEvent:
+    
+    client = AsyncGameClient('127.0.0.1', 8888)
+    await client.join('Ann')
+    async for event in client.events():
+        if event.type == 'game_state' and client.is_my_turn:
+            await client.draw_hand()
+            while client.hand:
+                await client.play_card(0)
+            await client.finish_turn()
+        elif event.type == 'game_end':
+            break
+    await client.close()
+
+The action methods return the server's reply once it has arrived, and when
+the action changed the game, once the new state has been applied too, so
+client.state is already up to date. The server silently ignores actions out
+of turn, so those raise GameError instead of waiting for an answer, and so
+do actions still unanswered when the player's turn times out.
+"""
+
+import asyncio
+import collections
+import socket
+from codec import JSON_ENCODING
+from protocol import (
+    COMPRESSION_ZLIB, FRAMED_PROTOCOL, PROTOCOL_VERSION, RECV_SIZE, FrameCompressor, FrameDecoder,
+    ProtocolError, apply_patch, compression_dictionary, dictionary_id, encode_message
+)
+
+# Event types: every server message type, except that a game_state_patch is
+# applied first and surfaces as 'game_state' (or 'spectator_state' when
+# watching) with the full patched state as its data, 'ping' heartbeats are
+# answered without surfacing, and 'closed' ends the stream when the
+# connection goes away.
+STATE_EVENTS = ('game_state', 'spectator_state')
+
+
+class GameError(Exception):
+    """The server refused a request, or the client could not make it"""
+    pass
+
+
+class GameEvent:
+    """One message from the server; data is the message dict itself, or for
+    a state event the full state (client.state) with any patch applied"""
+    __slots__ = ('type', 'data')
+    
+    def __init__(self, type, data):
+        self.type = type
+        self.data = data
+    
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+    
+    def __getitem__(self, key):
+        return self.data[key]
+    
+    def __repr__(self):
+        return f"GameEvent({self.type!r}, {self.data!r})"
+
+
+class AsyncGameClient:
+    """One player's (or spectator's) connection to a game server"""
+    def __init__(self, host='localhost', port=8888, encoding=JSON_ENCODING, compression=False):
+        self.host = host
+        self.port = port
+        self.encoding = encoding  # Encoding requested for server messages ('json' or 'binary')
+        self.compression = compression  # Ask for zlib stream compression (see protocol.py)
+        self.compressor = None  # Compresses what we send, once the server agreed
+        self.bytes_sent = 0  # Wire bytes, after any compression
+        self.bytes_received = 0
+        self.protocol = PROTOCOL_VERSION
+        self.reader = None
+        self.writer = None
+        self.reader_task = None
+        self.connected = False
+        
+        self.player_index = None
+        self.player_name = None
+        self.room_id = None
+        self.spectating = False
+        self.state = {}  # Latest game_state (or spectator_state), patches applied
+        self.state_version = 0
+        self.resync_requested = False
+        
+        self.event_queue = asyncio.Queue()
+        self.pending = collections.deque()  # [reply types, future, reply, expects state] per request in flight
+    
+    @property
+    def is_my_turn(self):
+        return bool(self.state.get('is_your_turn'))
+    
+    @property
+    def hand(self):
+        return self.state.get('player', {}).get('hand', [])
+    
+    @property
+    def market(self):
+        return self.state.get('market', {}).get('available_cards', [])
+    
+    async def connect(self):
+        """Open the connection and start reading from it"""
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connected = True
+        self.reader_task = asyncio.create_task(self.read_messages(self.reader))
+    
+    async def close(self, final=True):
+        """Close the connection; events() then ends after what was already
+        received, unless final is False (moving to another server)"""
+        writer = self.writer
+        self.drop_connection(final)
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+    
+    async def join(self, name, room=None):
+        """Take a seat and return the join_success event.
+        
+        room is an existing room id, 'create' for a new private room, or
+        None to be matched with the next waiting player.
+        """
+        message = {'type': 'join', 'name': name, 'protocol': PROTOCOL_VERSION, 'encoding': self.encoding}
+        if room:
+            message['room'] = room
+        return await self.send_join(message)
+    
+    async def spectate(self, room):
+        """Watch an existing room without a seat; returns the join_success event"""
+        message = {'type': 'join', 'role': 'spectator', 'room': room,
+                   'protocol': PROTOCOL_VERSION, 'encoding': self.encoding}
+        return await self.send_join(message)
+    
+    async def send_join(self, message):
+        if self.compression:
+            message['compression'] = COMPRESSION_ZLIB
+            message['compression_dict'] = dictionary_id(compression_dictionary())
+        while True:
+            if not self.connected:
+                await self.connect()
+            reply = await self.request(message, ('join_success', 'redirect'))
+            if reply.type == 'join_success':
+                return reply
+            
+            # Another worker or node hosts the room: move there and join again
+            await self.close(final=False)
+            self.host = reply.get('host') or self.host
+            self.port = reply['port']
+            if reply.get('room'):
+                message = dict(message, room=reply['room'])
+    
+    async def play_card(self, card_index):
+        """Play a card from hand; returns the card_played event"""
+        return await self.act({'type': 'play_card', 'card_index': card_index}, ('card_played',))
+    
+    async def buy_card(self, card_index):
+        """Buy a card from the market; returns the card_bought event"""
+        return await self.act({'type': 'buy_card', 'card_index': card_index}, ('card_bought',))
+    
+    async def draw_hand(self, hand_size=5):
+        """Draw cards into hand; returns the cards_drawn event"""
+        return await self.act({'type': 'draw_hand', 'hand_size': hand_size}, ('cards_drawn',))
+    
+    async def finish_turn(self):
+        """End the turn; returns turn_finished, or game_end if that was the last turn"""
+        return await self.act({'type': 'finish_turn'}, ('turn_finished', 'game_end'))
+    
+    async def request_status(self):
+        """Ask for a full state; returns it as an event once applied"""
+        return await self.request({'type': 'get_status'}, STATE_EVENTS, expects_state=False)
+    
+    async def act(self, message, reply_types):
+        if not self.is_my_turn:
+            raise GameError("It's not your turn!")
+        return await self.request(message, reply_types, expects_state=True)
+    
+    async def request(self, message, reply_types, expects_state=False):
+        """Send a message and wait for its reply (and the state it causes).
+        
+        Commands on one connection are answered in order, so replies are
+        matched to requests first-in first-out; an 'error' answers the
+        oldest request and is raised as GameError.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.send(message)
+        self.pending.append([reply_types, future, None, expects_state])
+        reply = await future
+        if reply.type == 'error':
+            raise GameError(reply.get('message'))
+        return reply
+    
+    def send(self, message):
+        """Queue a message for the server without waiting for an answer"""
+        if not self.connected:
+            raise ConnectionError("not connected to the server")
+        # Every command tells the server which state version we are looking at
+        if message.get('type') != 'join':
+            message['state_version'] = self.state_version
+        data = encode_message(message, self.protocol)
+        if self.compressor is not None:
+            data = self.compressor.compress_frame(data)
+        self.bytes_sent += len(data)
+        self.writer.write(data)
+    
+    async def events(self):
+        """Iterate over server events until the connection closes"""
+        while True:
+            event = await self.event_queue.get()
+            if event.type == 'closed':
+                return
+            yield event
+    
+    async def next_event(self, *event_types, timeout=None):
+        """Wait for the next event of one of the given types, skipping others"""
+        while True:
+            event = await asyncio.wait_for(self.event_queue.get(), timeout)
+            if event.type == 'closed':
+                raise ConnectionError("server closed the connection")
+            if not event_types or event.type in event_types:
+                return event
+    
+    async def read_messages(self, reader):
+        decoder = FrameDecoder()
+        if self.compression:
+            decoder.enable_compression(compression_dictionary())  # The server may compress from join_success on
+        try:
+            while True:
+                data = await reader.read(RECV_SIZE)
+                if not data:
+                    break
+                self.bytes_received += len(data)
+                for message in decoder.messages(data):
+                    if message is not None:
+                        self.handle_message(message)
+        except (ConnectionError, ProtocolError) as e:
+            print(f"Connection to {self.host}:{self.port} failed: {e}")
+        finally:
+            if self.reader is reader:
+                self.drop_connection()
+    
+    def drop_connection(self, final=True):
+        """Forget the current connection and fail whatever was waiting on it"""
+        if self.reader_task is not None and self.reader_task is not asyncio.current_task():
+            self.reader_task.cancel()
+        was_connected = self.connected
+        self.reader = self.writer = self.reader_task = None
+        self.connected = False
+        self.compressor = None  # A new connection negotiates again
+        while self.pending:
+            future = self.pending.popleft()[1]
+            if not future.done():
+                future.set_exception(ConnectionError("connection to the server closed"))
+        if was_connected and final:
+            self.event_queue.put_nowait(GameEvent('closed', {}))
+    
+    def handle_message(self, message):
+        """Update the client's view from one message and queue its event"""
+        msg_type = message.get('type')
+        
+        if msg_type == 'ping':
+            # Heartbeat: answering tells the server we are alive, even when idle
+            if self.connected:
+                self.send({'type': 'pong'})
+            return
+        
+        if msg_type == 'join_success':
+            self.room_id = message.get('room_id')
+            self.protocol = message.get('protocol') or FRAMED_PROTOCOL
+            self.encoding = message.get('encoding', JSON_ENCODING)
+            if message.get('compression') == COMPRESSION_ZLIB:
+                self.compressor = FrameCompressor(compression_dictionary())
+            self.spectating = message.get('role') == 'spectator'
+            if not self.spectating:
+                self.player_index = message.get('player_index')
+                self.player_name = message.get('player_name')
+        
+        elif msg_type == 'turn_timeout' and message.get('player_index') == self.player_index:
+            self.fail_pending_actions("Your turn timed out")
+        
+        elif msg_type in STATE_EVENTS:
+            self.state = message
+            self.state_version = message.get('version', 0)
+            self.resync_requested = False
+        
+        elif msg_type == 'game_state_patch':
+            if message.get('base') != self.state_version:
+                # Missed an update: ask once for a full snapshot
+                if not self.resync_requested:
+                    self.resync_requested = True
+                    self.send({'type': 'resync'})
+                return
+            apply_patch(self.state, message.get('ops', []))
+            self.state_version = self.state['version'] = message.get('version')
+            msg_type = self.state.get('type', 'game_state')
+            message = self.state  # The event carries the whole state, not the patch
+        
+        event = GameEvent(msg_type, message)
+        self.resolve_pending(event)
+        self.event_queue.put_nowait(event)
+    
+    def resolve_pending(self, event):
+        """Answer the oldest request in flight if this event completes it"""
+        if not self.pending:
+            return
+        entry = self.pending[0]
+        reply_types, future, reply, expects_state = entry
+        
+        if reply is None:
+            if event.type != 'error' and event.type not in reply_types:
+                return
+            if expects_state and event.type not in ('error', 'game_end') and self.changes_state(event):
+                entry[2] = event  # Hold the reply until the state it caused arrives
+                return
+            reply = event
+        elif event.type not in STATE_EVENTS:
+            return
+        
+        self.pending.popleft()
+        if not future.done():
+            future.set_result(reply)
+    
+    def fail_pending_actions(self, reason):
+        """Raise GameError from every turn action still waiting for a reply.
+        
+        The server answers whatever it ran before a turn deadline ahead of
+        the turn_timeout, and drops anything that arrives after it, so no
+        reply is coming for these. Other requests keep their place.
+        """
+        error = GameEvent('error', {'type': 'error', 'message': reason})
+        waiting = collections.deque()
+        for entry in self.pending:
+            reply_types, future, reply, expects_state = entry
+            if not expects_state:
+                waiting.append(entry)
+            elif not future.done():
+                future.set_result(reply or error)  # A reply already in hand still counts
+        self.pending = waiting
+    
+    def changes_state(self, reply):
+        """Whether the server will follow this reply with a new state"""
+        if reply.type == 'cards_drawn':
+            # Drawing into a full hand (or from empty piles) changes nothing
+            return reply.get('hand_size') != len(self.hand)
+        return True
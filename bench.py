@@ -0,0 +1,295 @@
+"""
+Headless load generator for the game server
+
+Starts a number of bot clients built on AsyncGameClient, all in one
+asyncio loop. They quick-match into games and play them out (draw a
+hand, play every card, buy the best card they can afford, finish the turn)
+until game_end, then join again until the requested number of games is done.
+
+Reports the latency from sending an action to receiving the resulting
+game_state, games completed per second, and the server's CPU time and RSS
+(read from /proc, so that part needs Linux). By default the server is started
+on a free local port for the run:
+    
+    python3 bench.py --bots 50 --games 200
+    python3 bench.py --bots 50 --games 200 --server-args="--async"
+    python3 bench.py --connect 127.0.0.1:8888 --server-pid 1234
+
+--piles skips the server and times the player's pile operations instead,
+for decks of growing size; drawing should cost the same at every size.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import time
+from async_client import AsyncGameClient, GameError
+from codec import JSON_ENCODING, BINARY_ENCODING
+
+STATE_TIMEOUT = 10.0  # Seconds a bot waits for any single reply before giving up
+PILE_SIZES = (10, 100, 1000, 10000, 100000)  # Deck sizes for --piles
+PILE_DRAWS = 50000  # Cards drawn per deck size
+
+
+class BenchStats:
+    """Results shared by every bot of one run"""
+    def __init__(self, games):
+        self.games_wanted = games
+        self.games_started = 0
+        self.games_done = 0
+        self.latencies = {}  # action -> list of seconds
+        self.errors = 0
+        self.bytes_received = 0  # On the wire, summed over every bot
+        self.bytes_sent = 0
+    
+    def claim_game(self):
+        """Reserve one more game for a bot pair to play, if any are left"""
+        if self.games_started >= self.games_wanted * 2:  # Counted per player
+            return False
+        self.games_started += 1
+        return True
+    
+    def record(self, action, seconds):
+        self.latencies.setdefault(action, []).append(seconds)
+
+
+class Bot:
+    """One headless player, driving an AsyncGameClient"""
+    def __init__(self, name, host, port, stats, encoding=JSON_ENCODING, compression=False):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.stats = stats
+        self.encoding = encoding
+        self.compression = compression
+    
+    async def run(self):
+        """Play games until the run has enough of them"""
+        while self.stats.claim_game():
+            client = AsyncGameClient(self.host, self.port, self.encoding, self.compression)
+            try:
+                await self.play_game(client)
+            except (asyncio.TimeoutError, ConnectionError, OSError, GameError) as e:
+                self.stats.errors += 1
+                print(f"{self.name}: {type(e).__name__} {e}")
+            finally:
+                await client.close()
+                self.stats.bytes_received += client.bytes_received
+                self.stats.bytes_sent += client.bytes_sent
+    
+    async def play_game(self, client):
+        await asyncio.wait_for(client.join(self.name), STATE_TIMEOUT)
+        while True:
+            event = await client.next_event('game_state', 'game_end', timeout=STATE_TIMEOUT)
+            if event.type == 'game_end':
+                break
+            if client.is_my_turn and await self.take_turn(client):
+                break
+        self.stats.games_done += 1
+    
+    async def take_turn(self, client):
+        """Play one turn; returns True if it ended the game"""
+        await self.act('draw_hand', client.draw_hand(5))
+        while client.hand:
+            await self.act('play_card', client.play_card(0))
+        
+        power = client.state['player']['turn_power']
+        affordable = [(card['cost'], i) for i, card in enumerate(client.market)
+                      if card and card['cost'] <= power]
+        if affordable:
+            await self.act('buy_card', client.buy_card(max(affordable)[1]))
+        
+        reply = await self.act('finish_turn', client.finish_turn())
+        return reply.type == 'game_end'
+    
+    async def act(self, action, request):
+        """Time one action from sending it to having the game_state it produced"""
+        sent = time.perf_counter()
+        reply = await asyncio.wait_for(request, STATE_TIMEOUT)
+        if reply.type != 'game_end':
+            self.stats.record(action, time.perf_counter() - sent)
+        return reply
+
+
+def process_tree(pid):
+    """pid and all of its descendants (worker processes), from /proc"""
+    pids = [pid]
+    for current in pids:
+        try:
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def process_usage(pid):
+    """(CPU seconds, RSS bytes) summed over a process and its children"""
+    ticks = os.sysconf('SC_CLK_TCK')
+    cpu = 0.0
+    rss = 0
+    for current in process_tree(pid):
+        try:
+            with open(f'/proc/{current}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / ticks  # utime + stime
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return cpu, rss
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, server_args):
+    """Run server.py on localhost for the benchmark and wait until it accepts.
+    
+    The server gets a process group of its own, so stop_server can reach
+    its worker processes as well.
+    """
+    command = [sys.executable, 'server.py', '127.0.0.1', str(port)] + shlex.split(server_args)
+    server = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              start_new_session=True)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    stop_server(server, signal.SIGKILL)
+    raise RuntimeError("server did not start listening")
+
+
+def stop_server(server, signum=signal.SIGTERM):
+    """Signal the server's whole process group (workers included) and wait for it"""
+    try:
+        os.killpg(server.pid, signum)
+    except ProcessLookupError:
+        pass  # Already gone
+    server.wait()
+
+
+async def run_bots(host, port, bots, stats, encoding, compression):
+    players = [Bot(f'Bot{i}', host, port, stats, encoding, compression) for i in range(bots)]
+    await asyncio.gather(*(player.run() for player in players))
+
+
+def pile_benchmark(sizes=PILE_SIZES, draws=PILE_DRAWS):
+    """Time Player.draw_card, reshuffles included, and calculate_total_wp by deck size"""
+    from objects.catalog import get_catalog
+    from objects.player import Player
+    
+    definitions = get_catalog().definitions
+    print(f"  {'deck size':>9} {'ns/draw':>9} {'us/total_wp':>12}")
+    with open(os.devnull, 'w') as devnull:
+        for size in sizes:
+            player = Player('Bench', random.Random(size))
+            player.add_to_deck([definitions[i % len(definitions)] for i in range(size)], player.discard_pile)
+            stdout, sys.stdout = sys.stdout, devnull  # Player narrates every draw
+            try:
+                start = time.perf_counter()
+                for _ in range(draws):
+                    player.draw_card()
+                    if len(player.hand) == 5:  # Play the hand: it goes to the discard pile
+                        player.discard_pile.extend(player.hand)
+                        player.hand.clear()
+                draw_time = (time.perf_counter() - start) / draws
+                
+                rounds = max(100, 100000 // size)
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    player.calculate_total_wp()
+                wp_time = (time.perf_counter() - start) / rounds
+            finally:
+                sys.stdout = stdout
+            print(f"  {size:>9} {draw_time * 1e9:>9.0f} {wp_time * 1e6:>12.2f}")
+
+
+def report(stats, elapsed, usage_before, usage_after):
+    games = stats.games_done // 2  # Each game is counted by both of its players
+    print(f"\nGames completed: {games} in {elapsed:.2f}s ({games / elapsed:.1f} games/s)")
+    if stats.errors:
+        print(f"Bot errors: {stats.errors}")
+    actions = sum(len(values) for values in stats.latencies.values())
+    if actions:
+        print(f"Wire bytes per action: {stats.bytes_received / actions:.0f} received, "
+              f"{stats.bytes_sent / actions:.0f} sent (all players, {stats.bytes_received + stats.bytes_sent} in total)")
+    
+    print("\nAction -> game_state latency (ms):")
+    print(f"  {'action':<12} {'count':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for action, values in sorted(stats.latencies.items()):
+        print(f"  {action:<12} {len(values):>7} " + " ".join(
+            f"{percentile(values, q) * 1000:>8.2f}" for q in (0.5, 0.95, 0.99, 1.0)))
+    
+    if usage_before is not None and usage_after is not None:
+        cpu = usage_after[0] - usage_before[0]
+        print(f"\nServer CPU: {cpu:.2f}s ({cpu / elapsed * 100:.0f}% of one core), "
+              f"RSS: {usage_after[1] / (1 << 20):.1f} MiB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the game server with headless bots")
+    parser.add_argument('--bots', type=int, default=20, help="Bots playing at the same time (default: 20)")
+    parser.add_argument('--games', type=int, default=50, help="Games to play in total (default: 50)")
+    parser.add_argument('--encoding', choices=(JSON_ENCODING, BINARY_ENCODING), default=JSON_ENCODING)
+    parser.add_argument('--compression', action='store_true', help="Ask for zlib stream compression")
+    parser.add_argument('--server-args', default='', help="Extra arguments for the server started by the benchmark")
+    parser.add_argument('--connect', metavar='HOST:PORT', help="Benchmark an already running server instead")
+    parser.add_argument('--server-pid', type=int, help="PID of that server, to report its CPU and RSS")
+    parser.add_argument('--piles', action='store_true',
+                        help="Micro-benchmark the player's pile operations instead of a server")
+    args = parser.parse_args(argv)
+    
+    if args.piles:
+        pile_benchmark()
+        return
+    
+    server = None
+    if args.connect:
+        host, _, port = args.connect.rpartition(':')
+        port = int(port)
+        pid = args.server_pid
+    else:
+        host, port = '127.0.0.1', free_port()
+        server = start_server(port, args.server_args)
+        pid = server.pid
+        print(f"Started server.py {args.server_args} on port {port} (pid {pid})".replace('  ', ' '))
+    
+    stats = BenchStats(args.games)
+    try:
+        usage_before = process_usage(pid) if pid else None
+        start = time.perf_counter()
+        asyncio.run(run_bots(host, port, args.bots, stats, args.encoding, args.compression))
+        elapsed = time.perf_counter() - start
+        usage_after = process_usage(pid) if pid else None
+        report(stats, elapsed, usage_before, usage_after)
+    except KeyboardInterrupt:
+        print("\nBenchmark interrupted")
+    finally:
+        if server is not None:
+            stop_server(server)
+
+
+if __name__ == "__main__":
+    main()
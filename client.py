@@ -10,10 +10,11 @@ class GameClient:
         self.market = None
         self.game_running = True
     
-    def start_game(self):
+    def start_game(self, player_name=None):
         """Start the game and initialize player"""
         print("=== Welcome to Rogue Deck Builder! ===")
-        player_name = input("Enter your player name: ").strip()
+        if player_name is None:
+            player_name = input("Enter your player name: ").strip()
         if not player_name:
             player_name = "Player"
         
@@ -35,7 +36,7 @@ class GameClient:
                 Card(4, "Magic Shield", 2, 2, 1, 1, "Item", False, True, "Block 4 damage"),
                 Card(5, "Power Crystal", 4, 3, 3, 1, "Treasure", False, True, "Generate extra power")
             ]
-            self.player.draw_pile = basic_cards
+            self.player.add_to_deck(basic_cards, self.player.draw_pile)
         
         # Load market cards from the same JSON file
         if os.path.exists(cards_json_path):
@@ -241,7 +242,7 @@ class GameClient:
         print(f"\\nYou have {self.player.turn_power} power to spend")
         self.market.show_available_cards()
         
-        if not self.market.available_cards:
+        if not any(self.market.available_cards):
             print("No cards available for purchase!")
             return
         
@@ -251,7 +252,7 @@ class GameClient:
                 print("Purchase cancelled")
                 return
             
-            if 0 <= card_index < len(self.market.available_cards):
+            if 0 <= card_index < len(self.market.available_cards) and self.market.available_cards[card_index]:
                 card_name = self.market.available_cards[card_index].getName()
                 success = self.player.buy_card(self.market, card_index)
                 if success:
@@ -277,14 +278,10 @@ class GameClient:
         
         # Show final deck composition
         print(f"\\nFinal Deck Composition:")
-        all_cards = self.player.hand + self.player.draw_pile + self.player.discard_pile
-        print(f"Total cards in deck: {len(all_cards)}")
+        print(f"Total cards in deck: {self.player.deck_size}")
         
         # Count unique cards
-        card_counts = {}
-        for card in all_cards:
-            card_name = card.getName()
-            card_counts[card_name] = card_counts.get(card_name, 0) + 1
+        card_counts = self.player.count_cards_by_name()
         
         print("\\nCards in your deck:")
         for card_name, count in sorted(card_counts.items()):
@@ -295,11 +292,17 @@ class GameClient:
         input("\\nPress Enter to exit...")
 
 
-def main():
+def main(argv=None):
     """Main function"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Single player Rogue Deck Builder")
+    parser.add_argument('--name', help="Player name (asked for when not given)")
+    args = parser.parse_args(argv)
+    
     try:
         client = GameClient()
-        client.start_game()
+        client.start_game(args.name)
     except KeyboardInterrupt:
         print("\\n\\nGame interrupted. Goodbye!")
     except Exception as e:
@@ -0,0 +1,401 @@
+"""
+Compact binary encoding for the busiest server -> client messages
+
+The payload of a frame is either a JSON document (always starting with '{')
+or one of the binary layouts below, which start with a small integer tag.
+Decoding therefore never needs to know what was negotiated; the 'encoding'
+field of 'join' only decides what the server sends. Any message without a
+binary layout, or with values that don't fit its fields, is sent as JSON.
+
+Layouts (all integers big-endian, str = uint16 length + UTF-8 bytes):
+  game_state    tag, version I, current_player b, is_your_turn ?, room_id str,
+                player: name str, hand cards, hand/draw/discard sizes H,
+                        turn_power i, total_wp i
+                opponent: name str, hand/draw/discard sizes H, turn_power i, total_wp i
+                market: cards, market_draw_pile_size H
+  card_played   tag, player_index B, success ?, player_name str
+  card_bought   tag, player_index B, success ?, card_index B, player_name str, card_name str
+  turn_finished tag, finished_player B, next_player B, next_player_name str
+  game_end      tag, score count B, scores, winner   (score: index B, final_wp i, name str)
+  game_state_patch
+                tag, base I, version I, op count B, ops
+                (op: kind B, path id B [+ str if 0xFF], list index b (-1: none), value)
+
+Patch paths are ids into STATE_PATHS with an optional trailing list index
+('market.available_cards.2'). Patch values carry a type byte: None, False,
+True, int i, str, card, or a list of values.
+
+A card list is a uint16 count followed by cards; a card is name str,
+power h, cost h, wp h, ability str. A name length of 0xFFFF marks an empty
+slot (None).
+"""
+
+import json
+import struct
+
+JSON_ENCODING = 'json'
+BINARY_ENCODING = 'binary'
+ENCODINGS = (JSON_ENCODING, BINARY_ENCODING)
+
+TAG_GAME_STATE = 1
+TAG_CARD_PLAYED = 2
+TAG_CARD_BOUGHT = 3
+TAG_TURN_FINISHED = 4
+TAG_GAME_END = 5
+TAG_GAME_STATE_PATCH = 6
+
+# Dotted game_state paths that patches refer to by index
+STATE_PATHS = (
+    'current_player', 'is_your_turn',
+    'player.name', 'player.hand', 'player.hand_size', 'player.draw_pile_size',
+    'player.discard_pile_size', 'player.turn_power', 'player.total_wp',
+    'opponent.name', 'opponent.hand_size', 'opponent.draw_pile_size',
+    'opponent.discard_pile_size', 'opponent.turn_power', 'opponent.total_wp',
+    'market.available_cards', 'market.market_draw_pile_size',
+)
+_PATH_IDS = {path: i for i, path in enumerate(STATE_PATHS)}
+_PATH_OTHER = 0xFF
+_OPS = ('set', 'del', 'ins', 'ext')
+_OP_IDS = {op: i for i, op in enumerate(_OPS)}
+
+_U16 = struct.Struct('!H')
+_CARD_STATS = struct.Struct('!hhh')  # power, cost, wp
+_STATE_HEADER = struct.Struct('!BIb?')  # tag, version, current_player, is_your_turn
+_PILES = struct.Struct('!HHHii')  # hand, draw, discard sizes, turn_power, total_wp
+_PLAYED = struct.Struct('!BB?')  # tag, player_index, success
+_BOUGHT = struct.Struct('!BB?B')  # tag, player_index, success, card_index
+_TURN = struct.Struct('!BBB')  # tag, finished_player, next_player
+_SCORE = struct.Struct('!Bi')  # player_index, final_wp
+_PATCH_HEADER = struct.Struct('!BIIB')  # tag, base, version, op count
+_OP_HEADER = struct.Struct('!BB')  # op kind, path id
+_INDEX = struct.Struct('!b')
+_INT = struct.Struct('!Bi')  # value type, value
+_NONE = 0xFFFF
+
+
+def negotiate_encoding(requested):
+    """Pick the encoding to send with; requested may be one name or a preference list"""
+    if isinstance(requested, str):
+        requested = [requested]
+    for encoding in requested or ():
+        if encoding in ENCODINGS:
+            return encoding
+    return JSON_ENCODING
+
+
+class _Reader:
+    """Cursor over a binary payload"""
+    def __init__(self, payload):
+        self.payload = payload
+        self.offset = 0
+    
+    def unpack(self, layout):
+        values = layout.unpack_from(self.payload, self.offset)
+        self.offset += layout.size
+        return values
+    
+    def string(self):
+        (length,) = self.unpack(_U16)
+        if length == _NONE:
+            return None
+        start = self.offset
+        self.offset += length
+        return self.payload[start:self.offset].decode('utf-8')
+
+
+def _pack_str(out, text):
+    data = text.encode('utf-8')
+    if len(data) >= _NONE:
+        raise ValueError("string too long for binary encoding")
+    out += _U16.pack(len(data))
+    out += data
+
+
+def _pack_cards(out, cards):
+    out += _U16.pack(len(cards))
+    for card in cards:
+        if card is None:
+            out += _U16.pack(_NONE)
+            continue
+        _pack_str(out, card['name'])
+        out += _CARD_STATS.pack(card['power'], card['cost'], card['wp'])
+        _pack_str(out, card['ability'])
+
+
+def _read_cards(reader):
+    # Hot path for game_state: unpack inline instead of through reader methods
+    payload = reader.payload
+    offset = reader.offset
+    unpack_u16 = _U16.unpack_from
+    unpack_stats = _CARD_STATS.unpack_from
+    (count,) = unpack_u16(payload, offset)
+    offset += 2
+    cards = []
+    for _ in range(count):
+        (length,) = unpack_u16(payload, offset)
+        offset += 2
+        if length == _NONE:
+            cards.append(None)
+            continue
+        name = payload[offset:offset + length].decode('utf-8')
+        offset += length
+        power, cost, wp = unpack_stats(payload, offset)
+        offset += 6
+        (length,) = unpack_u16(payload, offset)
+        offset += 2
+        ability = payload[offset:offset + length].decode('utf-8')
+        offset += length
+        cards.append({'name': name, 'power': power, 'cost': cost, 'wp': wp, 'ability': ability})
+    reader.offset = offset
+    return cards
+
+
+def _encode_game_state(message):
+    out = bytearray(_STATE_HEADER.pack(
+        TAG_GAME_STATE, message['version'], message['current_player'], message['is_your_turn']
+    ))
+    _pack_str(out, message['room_id'])
+    
+    player = message['player']
+    _pack_str(out, player['name'])
+    _pack_cards(out, player['hand'])
+    out += _PILES.pack(player['hand_size'], player['draw_pile_size'], player['discard_pile_size'],
+                       player['turn_power'], player['total_wp'])
+    
+    opponent = message['opponent']
+    _pack_str(out, opponent['name'])
+    out += _PILES.pack(opponent['hand_size'], opponent['draw_pile_size'], opponent['discard_pile_size'],
+                       opponent['turn_power'], opponent['total_wp'])
+    
+    market = message['market']
+    _pack_cards(out, market['available_cards'])
+    out += _U16.pack(market['market_draw_pile_size'])
+    return out
+
+
+def _decode_game_state(reader):
+    _, version, current_player, is_your_turn = reader.unpack(_STATE_HEADER)
+    room_id = reader.string()
+    
+    player = {'name': reader.string(), 'hand': _read_cards(reader)}
+    (player['hand_size'], player['draw_pile_size'], player['discard_pile_size'],
+     player['turn_power'], player['total_wp']) = reader.unpack(_PILES)
+    
+    opponent = {'name': reader.string()}
+    (opponent['hand_size'], opponent['draw_pile_size'], opponent['discard_pile_size'],
+     opponent['turn_power'], opponent['total_wp']) = reader.unpack(_PILES)
+    
+    available_cards = _read_cards(reader)
+    (market_draw_pile_size,) = reader.unpack(_U16)
+    return {
+        'type': 'game_state',
+        'room_id': room_id,
+        'current_player': current_player,
+        'is_your_turn': is_your_turn,
+        'player': player,
+        'opponent': opponent,
+        'market': {
+            'available_cards': available_cards,
+            'market_draw_pile_size': market_draw_pile_size
+        },
+        'version': version
+    }
+
+
+def _encode_card_played(message):
+    out = bytearray(_PLAYED.pack(TAG_CARD_PLAYED, message['player_index'], message['success']))
+    _pack_str(out, message['player_name'])
+    return out
+
+
+def _decode_card_played(reader):
+    _, player_index, success = reader.unpack(_PLAYED)
+    return {
+        'type': 'card_played',
+        'player_index': player_index,
+        'player_name': reader.string(),
+        'success': success
+    }
+
+
+def _encode_card_bought(message):
+    out = bytearray(_BOUGHT.pack(TAG_CARD_BOUGHT, message['player_index'], message['success'],
+                                 message['card_index']))
+    _pack_str(out, message['player_name'])
+    _pack_str(out, message['card_name'])
+    return out
+
+
+def _decode_card_bought(reader):
+    _, player_index, success, card_index = reader.unpack(_BOUGHT)
+    return {
+        'type': 'card_bought',
+        'player_index': player_index,
+        'card_index': card_index,
+        'player_name': reader.string(),
+        'card_name': reader.string(),
+        'success': success
+    }
+
+
+def _encode_turn_finished(message):
+    out = bytearray(_TURN.pack(TAG_TURN_FINISHED, message['finished_player'], message['next_player']))
+    _pack_str(out, message['next_player_name'])
+    return out
+
+
+def _decode_turn_finished(reader):
+    _, finished_player, next_player = reader.unpack(_TURN)
+    return {
+        'type': 'turn_finished',
+        'finished_player': finished_player,
+        'next_player': next_player,
+        'next_player_name': reader.string()
+    }
+
+
+def _pack_score(out, score):
+    out += _SCORE.pack(score['player_index'], score['final_wp'])
+    _pack_str(out, score['player_name'])
+
+
+def _read_score(reader):
+    player_index, final_wp = reader.unpack(_SCORE)
+    return {'player_index': player_index, 'player_name': reader.string(), 'final_wp': final_wp}
+
+
+def _encode_game_end(message):
+    scores = message['scores']
+    out = bytearray((TAG_GAME_END, len(scores)))
+    for score in scores:
+        _pack_score(out, score)
+    _pack_score(out, message['winner'])
+    return out
+
+
+def _decode_game_end(reader):
+    reader.offset = 2
+    count = reader.payload[1]
+    scores = [_read_score(reader) for _ in range(count)]
+    return {'type': 'game_end', 'scores': scores, 'winner': _read_score(reader)}
+
+
+# Value type bytes used inside patches
+_VALUE_NONE, _VALUE_FALSE, _VALUE_TRUE, _VALUE_INT, _VALUE_STR, _VALUE_CARD, _VALUE_LIST = range(7)
+
+
+def _pack_value(out, value):
+    if value is None:
+        out.append(_VALUE_NONE)
+    elif value is True or value is False:
+        out.append(_VALUE_TRUE if value else _VALUE_FALSE)
+    elif isinstance(value, int):
+        out += _INT.pack(_VALUE_INT, value)
+    elif isinstance(value, str):
+        out.append(_VALUE_STR)
+        _pack_str(out, value)
+    elif isinstance(value, dict):
+        out.append(_VALUE_CARD)
+        _pack_str(out, value['name'])
+        out += _CARD_STATS.pack(value['power'], value['cost'], value['wp'])
+        _pack_str(out, value['ability'])
+    elif isinstance(value, list):
+        out.append(_VALUE_LIST)
+        out += _U16.pack(len(value))
+        for item in value:
+            _pack_value(out, item)
+    else:
+        raise TypeError(f"can't encode {type(value).__name__} in a patch")
+
+
+def _read_value(reader):
+    kind = reader.payload[reader.offset]
+    reader.offset += 1
+    if kind == _VALUE_NONE:
+        return None
+    if kind in (_VALUE_FALSE, _VALUE_TRUE):
+        return kind == _VALUE_TRUE
+    if kind == _VALUE_INT:
+        reader.offset -= 1
+        return reader.unpack(_INT)[1]
+    if kind == _VALUE_STR:
+        return reader.string()
+    if kind == _VALUE_CARD:
+        name = reader.string()
+        power, cost, wp = reader.unpack(_CARD_STATS)
+        return {'name': name, 'power': power, 'cost': cost, 'wp': wp, 'ability': reader.string()}
+    if kind == _VALUE_LIST:
+        (count,) = reader.unpack(_U16)
+        return [_read_value(reader) for _ in range(count)]
+    raise ValueError(f"unknown patch value type {kind}")
+
+
+def _encode_game_state_patch(message):
+    ops = message['ops']
+    out = bytearray(_PATCH_HEADER.pack(TAG_GAME_STATE_PATCH, message['base'], message['version'], len(ops)))
+    for op, path, value in ops:
+        base, _, index = path.rpartition('.')
+        if not index.isdigit():
+            base, index = path, None
+        path_id = _PATH_IDS.get(base, _PATH_OTHER)
+        out += _OP_HEADER.pack(_OP_IDS[op], path_id)
+        if path_id == _PATH_OTHER:
+            _pack_str(out, base)
+        out += _INDEX.pack(-1 if index is None else int(index))
+        _pack_value(out, value)
+    return out
+
+
+def _decode_game_state_patch(reader):
+    _, base, version, count = reader.unpack(_PATCH_HEADER)
+    ops = []
+    for _ in range(count):
+        op_id, path_id = reader.unpack(_OP_HEADER)
+        path = reader.string() if path_id == _PATH_OTHER else STATE_PATHS[path_id]
+        (index,) = reader.unpack(_INDEX)
+        if index >= 0:
+            path = f"{path}.{index}"
+        ops.append([_OPS[op_id], path, _read_value(reader)])
+    return {'type': 'game_state_patch', 'base': base, 'version': version, 'ops': ops}
+
+
+_ENCODERS = {
+    'game_state': _encode_game_state,
+    'card_played': _encode_card_played,
+    'card_bought': _encode_card_bought,
+    'turn_finished': _encode_turn_finished,
+    'game_end': _encode_game_end,
+    'game_state_patch': _encode_game_state_patch,
+}
+
+_DECODERS = {
+    TAG_GAME_STATE: _decode_game_state,
+    TAG_CARD_PLAYED: _decode_card_played,
+    TAG_CARD_BOUGHT: _decode_card_bought,
+    TAG_TURN_FINISHED: _decode_turn_finished,
+    TAG_GAME_END: _decode_game_end,
+    TAG_GAME_STATE_PATCH: _decode_game_state_patch,
+}
+
+
+def encode_payload(message, encoding=JSON_ENCODING):
+    """Serialize a message dict into a frame payload"""
+    if encoding == BINARY_ENCODING:
+        encoder = _ENCODERS.get(message.get('type'))
+        if encoder is not None:
+            try:
+                return bytes(encoder(message))
+            except (KeyError, TypeError, ValueError, struct.error):
+                pass  # Doesn't fit the fixed layout; JSON can carry anything
+    return json.dumps(message, separators=(',', ':')).encode('utf-8')
+
+
+def decode_payload(payload):
+    """Parse one frame payload into a message dict (None if it isn't one)"""
+    try:
+        if payload and payload[0] in _DECODERS:
+            return _DECODERS[payload[0]](_Reader(payload))
+        message = json.loads(payload)
+    except (ValueError, UnicodeDecodeError, IndexError, struct.error):
+        return None
+    return message if isinstance(message, dict) else None
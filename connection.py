@@ -0,0 +1,404 @@
+import asyncio
+import socket
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from codec import JSON_ENCODING, negotiate_encoding
+from protocol import (
+    COMPRESSION_ZLIB, LEGACY_PROTOCOL, FRAMED_PROTOCOL, FrameCompressor, FrameDecoder, JsonStreamDecoder,
+    compression_dictionary, decode_payload, dictionary_id, encode_message, is_legacy_stream, negotiate_protocol
+)
+
+# Socket write policy: Nagle is always off, because messages are already
+# coalesced in each connection's outbox and written with one sendmsg/writev
+# per handled command. There is nothing left for the kernel to batch, so
+# TCP_CORK isn't used and every flush goes out immediately.
+TCP_NODELAY = True
+IOV_MAX = 1024  # Most buffers a single sendmsg() accepts on Linux
+SEND_TIMEOUT = 10.0  # Seconds a writer may stay blocked before the client counts as gone
+
+# What to do when a client reads slower than its outbox fills up
+OVERFLOW_COLLAPSE = 'collapse'  # Drop queued game_state updates, send one fresh snapshot
+OVERFLOW_DISCONNECT = 'disconnect'  # Drop the client
+OVERFLOW_POLICIES = (OVERFLOW_COLLAPSE, OVERFLOW_DISCONNECT)
+DEFAULT_QUEUE_LIMIT = 256  # Messages; one command queues at most a handful per client
+
+STATE_MESSAGES = ('game_state', 'game_state_patch', 'spectator_state')  # Superseded by any newer one
+
+_thread_state = threading.local()
+
+
+def configure_socket(sock):
+    """Apply the write policy above to a connected TCP socket"""
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if TCP_NODELAY else 0)
+    except OSError:
+        pass  # Not a TCP socket (e.g. a socketpair in tests)
+
+
+@contextmanager
+def write_batch():
+    """Hold back socket flushes made on this thread until the block ends.
+    
+    Everything one command produces (a broadcast plus a game_state for each
+    player) then reaches each client as a single write.
+    """
+    if getattr(_thread_state, 'batch', None) is not None:
+        yield  # Already inside a batch; the outer one flushes
+        return
+    batch = _thread_state.batch = []
+    try:
+        yield
+    finally:
+        _thread_state.batch = None
+        for connection in batch:
+            connection.flush()
+
+
+class Connection:
+    """Server-side state for one client, independent of the transport.
+    
+    The wire protocol is picked from the first byte the client sends (see
+    protocol.py). Outgoing messages are encoded into a bounded outbox that
+    a per-connection writer drains on its own, so the code producing them
+    never waits on a slow client. Subclasses provide the writer.
+    """
+    def __init__(self, address, queue_limit=DEFAULT_QUEUE_LIMIT, overflow_policy=OVERFLOW_COLLAPSE,
+                 on_state_dropped=None, on_compressed=None):
+        self.address = address
+        self.outbox = []  # (encoded frame, is state update) waiting for the writer
+        self.outbox_lock = threading.Lock()
+        self.queue_limit = queue_limit
+        self.overflow_policy = overflow_policy
+        self.on_state_dropped = on_state_dropped  # Called with this connection after a collapse
+        self.closed = False
+        self.protocol = None  # Unknown until the first bytes arrive
+        self.encoding = JSON_ENCODING  # How messages to this client are serialized
+        self.decoder = None  # FrameDecoder or JsonStreamDecoder, picked by the first byte
+        self.compression = None  # COMPRESSION_ZLIB once negotiated
+        self.compressor = None  # Its FrameCompressor, used only by the writer
+        self.on_compressed = on_compressed  # Called with (bytes before, bytes after) per compressed write
+        
+        # Liveness, looked after by the server's heartbeat timer
+        self.last_seen = time.monotonic()  # When bytes last arrived
+        self.answers_heartbeats = False  # Whether the client ever answered a ping
+        self.heartbeat = None  # Its pending Timer
+        
+        # Outbound queue counters
+        self.peak_queue_depth = 0
+        self.dropped_messages = 0
+        self.collapses = 0
+        
+        # Delta game_state tracking (protocol 3)
+        self.state_version = 0  # Version of the last game_state sent
+        self.last_state = None  # The state that version describes
+        self.acked_version = 0  # Last version the client reported having
+    
+    def feed(self, data):
+        """Decode received bytes into a list of message dicts"""
+        self.last_seen = time.monotonic()
+        if self.protocol is None:
+            if is_legacy_stream(data[:1]):
+                self.protocol = LEGACY_PROTOCOL
+                self.decoder = JsonStreamDecoder()
+            else:
+                self.protocol = FRAMED_PROTOCOL
+                self.decoder = FrameDecoder()
+        
+        messages = []
+        for payload in self.decoder.feed(data):
+            message = decode_payload(payload)
+            if message is None:
+                print(f"Invalid JSON from {self.address}: {bytes(payload)[:200]!r}")
+                continue
+            messages.append(message)
+        return messages
+    
+    def negotiate(self, requested, encoding=None, compression=None, compression_dict=None):
+        """Settle protocol version, encoding and compression from what 'join' asked for.
+        
+        Framing itself is fixed by the first byte the client sent, so a
+        framed connection never drops back to the legacy protocol, and only
+        framed connections can switch away from JSON or compress. Compression
+        needs the client to hold the same preset dictionary as we do.
+        """
+        if self.protocol is not None and self.protocol >= FRAMED_PROTOCOL:
+            self.protocol = max(FRAMED_PROTOCOL, negotiate_protocol(requested))
+            self.encoding = negotiate_encoding(encoding)
+            zdict = compression_dictionary()
+            if (compression == COMPRESSION_ZLIB and compression_dict == dictionary_id(zdict)
+                    and self.compressor is None):
+                self.decoder.enable_compression(zdict)
+                self.compressor = FrameCompressor(zdict)
+                self.compression = COMPRESSION_ZLIB
+        return self.protocol
+    
+    def record_ack(self, version):
+        """Remember the state version a client says it has.
+        
+        A version we never sent means the client lost track, so the next
+        game_state goes out as a full snapshot.
+        """
+        if not isinstance(version, int):
+            return
+        self.acked_version = version
+        if version > self.state_version:
+            self.last_state = None
+    
+    def send(self, message):
+        """Serialize a message in this connection's protocol, queue it and return its size"""
+        data = encode_message(message, self.protocol or FRAMED_PROTOCOL, self.encoding)
+        self.queue(data, message.get('type') in STATE_MESSAGES)
+        return len(data)
+    
+    def queue(self, data, is_state=False):
+        """Add encoded bytes to the outbox and make sure the writer will see them.
+        
+        A full outbox means the client stopped keeping up. Under the collapse
+        policy every queued state update is thrown away, since one fresh full
+        snapshot (queued by on_state_dropped) replaces them all; other messages
+        are kept. If that frees nothing, or under the disconnect policy, the
+        client is dropped.
+        """
+        if self.closed:
+            return
+        
+        collapsed = False
+        overflow = False
+        with self.outbox_lock:
+            if len(self.outbox) >= self.queue_limit and self.overflow_policy == OVERFLOW_COLLAPSE:
+                kept = [entry for entry in self.outbox if not entry[1]]
+                self.dropped_messages += len(self.outbox) - len(kept)
+                self.outbox = kept
+                self.collapses += 1
+                collapsed = True
+            
+            if len(self.outbox) >= self.queue_limit:
+                overflow = True
+            elif collapsed and is_state:
+                self.dropped_messages += 1  # Superseded by the snapshot too
+            else:
+                self.outbox.append((data, is_state))
+            depth = len(self.outbox)
+            if depth > self.peak_queue_depth:
+                self.peak_queue_depth = depth
+        
+        if overflow:
+            print(f"Outbound queue for {self.address} is full; disconnecting slow client")
+            self.dropped_messages += 1
+            self.abort()
+            return
+        if collapsed:
+            print(f"Outbound queue for {self.address} is full; collapsing game_state updates")
+            self.last_state = None  # The next game_state has to be a full snapshot
+            if self.on_state_dropped is not None:
+                self.on_state_dropped(self)
+        if depth == 1:
+            self.schedule_flush()
+    
+    def take_outbox(self):
+        """Remove and return every queued frame"""
+        with self.outbox_lock:
+            entries, self.outbox = self.outbox, []
+        return [data for data, _ in entries]
+    
+    def wire_frames(self, frames):
+        """Frames as they go on the wire: compressed, if negotiated.
+        
+        Only the writer calls this, right before writing, so frames enter
+        the compression stream in send order and none that a collapse later
+        drops from the outbox has been compressed.
+        """
+        compressor = self.compressor
+        if compressor is None:
+            return frames
+        wire = [compressor.compress_frame(frame) for frame in frames]
+        if self.on_compressed is not None:
+            self.on_compressed(sum(len(frame) for frame in frames), sum(len(frame) for frame in wire))
+        return wire
+    
+    def queue_depth(self):
+        """Number of messages waiting for the writer"""
+        return len(self.outbox)
+    
+    def queue_stats(self):
+        """Outbound queue counters for this connection"""
+        with self.outbox_lock:
+            depth = len(self.outbox)
+            queued_bytes = sum(len(data) for data, _ in self.outbox)
+        return {
+            'queue_depth': depth,
+            'queued_bytes': queued_bytes,
+            'peak_queue_depth': self.peak_queue_depth,
+            'dropped_messages': self.dropped_messages,
+            'collapses': self.collapses
+        }
+    
+    def schedule_flush(self):
+        """Arrange for flush() to run once the current command is handled"""
+        self.flush()
+    
+    def flush(self):
+        """Wake the writer so it sends everything queued"""
+        raise NotImplementedError
+    
+    def close(self):
+        """Close the connection once everything queued has been written"""
+        raise NotImplementedError
+    
+    def abort(self):
+        """Close the connection right away, dropping anything queued"""
+        raise NotImplementedError
+    
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.address}>"
+
+
+class SocketConnection(Connection):
+    """Connection served by a blocking socket.
+    
+    The handler thread only reads; a writer thread per connection drains the
+    outbox, so a client that stops reading blocks nobody but its own writer.
+    """
+    def __init__(self, client_socket, address, **options):
+        super().__init__(address, **options)
+        self.socket = client_socket
+        self.wakeup = threading.Condition(self.outbox_lock)
+        configure_socket(client_socket)
+        try:
+            # Bounds how long the writer can hang on a client that stopped reading
+            seconds = int(SEND_TIMEOUT)
+            timeval = struct.pack('ll', seconds, int((SEND_TIMEOUT - seconds) * 1e6))
+            client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, timeval)
+        except (OSError, AttributeError):
+            pass
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+    
+    def schedule_flush(self):
+        """Join the current thread's write batch, or wake the writer right away"""
+        batch = getattr(_thread_state, 'batch', None)
+        if batch is None:
+            self.flush()
+        elif self not in batch:
+            batch.append(self)
+    
+    def flush(self):
+        with self.wakeup:
+            self.wakeup.notify()
+    
+    def write_loop(self):
+        """Writer thread: one sendmsg per wakeup until the connection closes"""
+        while True:
+            with self.wakeup:
+                while not self.outbox and not self.closed:
+                    self.wakeup.wait()
+                entries, self.outbox = self.outbox, []
+            
+            if not entries:
+                break  # Closed and fully drained
+            try:
+                self.sendmsg_all(self.wire_frames([data for data, _ in entries]))
+            except OSError as e:
+                if not self.closed:
+                    print(f"Failed to send to {self.address}: {e}")
+                break
+        
+        self.abort()
+    
+    def sendmsg_all(self, frames):
+        """sendmsg() may write only part of the buffers; keep going until done"""
+        if not hasattr(self.socket, 'sendmsg'):
+            self.socket.sendall(b''.join(frames))
+            return
+        views = [memoryview(frame) for frame in frames]
+        start = 0
+        while start < len(views):
+            sent = self.socket.sendmsg(views[start:start + IOV_MAX])
+            while start < len(views) and sent >= len(views[start]):
+                sent -= len(views[start])
+                start += 1
+            if sent:
+                views[start] = views[start][sent:]
+    
+    def close(self):
+        """Let the writer finish what is queued; it then shuts the socket down,
+        which also wakes up the handler thread's recv"""
+        with self.wakeup:
+            self.closed = True
+            self.wakeup.notify()
+    
+    def wait_closed(self):
+        """Called by the handler thread once it stops reading: wait for the
+        writer to finish, then release the socket"""
+        self.close()
+        self.writer.join()
+        try:
+            self.socket.close()
+        except OSError:
+            pass
+    
+    def abort(self):
+        with self.wakeup:
+            self.closed = True
+            self.outbox = []
+            self.wakeup.notify()
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class StreamConnection(Connection):
+    """Connection served by an asyncio StreamReader/StreamWriter pair.
+    
+    A drain task per connection moves the outbox into the transport and
+    awaits drain(), so a slow client's backlog waits in its own bounded
+    outbox instead of piling up in the transport buffer.
+    """
+    def __init__(self, reader, writer, **options):
+        super().__init__(writer.get_extra_info('peername'), **options)
+        self.reader = reader
+        self.writer = writer
+        self.ready = asyncio.Event()
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            configure_socket(sock)
+        self.drain_task = asyncio.get_running_loop().create_task(self.drain_outbox())
+    
+    def flush(self):
+        """Wake the drain task. It runs after the current callback, so every
+        message queued while handling the received data (one command or
+        several coalesced ones) goes out in the same writelines() call."""
+        self.ready.set()
+    
+    async def drain_outbox(self):
+        """Drain task: one writelines() per wakeup, then wait for the socket"""
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                frames = self.take_outbox()
+                if frames:
+                    self.writer.writelines(self.wire_frames(frames))
+                    await self.writer.drain()
+                elif self.closed:
+                    break
+        except (ConnectionError, OSError) as e:
+            if not self.closed:
+                print(f"Failed to send to {self.address}: {e}")
+        finally:
+            self.closed = True
+            self.writer.close()
+    
+    def close(self):
+        self.closed = True
+        self.ready.set()
+    
+    def abort(self):
+        self.closed = True
+        with self.outbox_lock:
+            self.outbox = []
+        self.writer.transport.abort()
+        self.ready.set()
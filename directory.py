@@ -0,0 +1,265 @@
+"""
+Room directory for running the game on several server nodes
+
+Game servers started with --directory keep a connection to the directory
+open. On it they register their address and rooms, report each room they
+open or close, and send their load every few seconds. A node whose
+connection drops is forgotten together with its rooms.
+
+Clients connect to the directory exactly as if it were a game server and
+send their usual 'join'. The directory answers with the same 'redirect' a
+worker sends (see workers.py): the node that hosts the requested room, or
+for quick match and 'create' the least-loaded node (preferring one where a
+quick-match player is already waiting). MultiplayerClient follows it and
+repeats the join there.
+
+Run it with:  python3 directory.py [host] [port]
+"""
+
+import asyncio
+import queue
+import socket
+import threading
+import time
+from protocol import FRAMED_PROTOCOL, FrameDecoder, ProtocolError, RECV_SIZE, encode_message
+
+DEFAULT_DIRECTORY_PORT = 8880
+REPORT_INTERVAL = 2.0  # Seconds between load reports from a game server
+RETRY_INTERVAL = 5.0  # Seconds before a game server tries to reach the directory again
+
+
+def parse_address(text, default_port=DEFAULT_DIRECTORY_PORT):
+    """Split 'host:port' (or just 'host') into a (host, port) tuple"""
+    host, separator, port = text.rpartition(':')
+    if not separator:
+        return text, default_port
+    return host, int(port)
+
+
+class Node:
+    """A game server process as seen by the directory"""
+    def __init__(self, host, port, writer):
+        self.host = host
+        self.port = port
+        self.writer = writer
+        self.rooms = set()
+        self.connections = 0
+        self.waiting = 0  # Players waiting in the node's quick-match room
+    
+    @property
+    def address(self):
+        return f"{self.host}:{self.port}"
+
+
+class DirectoryServer:
+    """Keeps track of which node hosts which room and how busy each node is"""
+    def __init__(self, host='0.0.0.0', port=DEFAULT_DIRECTORY_PORT):
+        self.host = host
+        self.port = port
+        self.nodes = {}  # address -> Node
+        self.room_nodes = {}  # room_id -> Node
+    
+    def start_server(self):
+        """Run the directory until interrupted"""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("\nDirectory interrupted by user")
+    
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        print(f"Room directory started on {self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+    
+    async def handle_connection(self, reader, writer):
+        """Serve one game server (many messages) or one client lookup"""
+        decoder = FrameDecoder()
+        node = None
+        try:
+            while True:
+                data = await reader.read(RECV_SIZE)
+                if not data:
+                    break
+                for message in decoder.messages(data):
+                    if message is None:
+                        continue
+                    node = self.process_message(message, writer, node)
+                await writer.drain()
+        except (ConnectionError, ProtocolError) as e:
+            print(f"Directory connection error: {e}")
+        except Exception as e:
+            print(f"Error handling directory message: {e}")
+        finally:
+            if node is not None:
+                self.remove_node(node)
+            writer.close()
+    
+    def process_message(self, message, writer, node):
+        """Apply one message and return the node this connection registered, if any"""
+        msg_type = message.get('type')
+        
+        if msg_type == 'register':
+            host = message.get('host') or writer.get_extra_info('peername')[0]
+            node = Node(host, message.get('port'), writer)
+            if node.address in self.nodes:
+                self.remove_node(self.nodes[node.address])
+            self.nodes[node.address] = node
+            for room_id in message.get('rooms', []):
+                self.add_room(node, room_id)
+            self.update_load(node, message)
+            print(f"Node {node.address} registered with {len(node.rooms)} rooms ({len(self.nodes)} nodes)")
+        
+        elif node is not None and msg_type == 'room_opened':
+            self.add_room(node, message.get('room'))
+        
+        elif node is not None and msg_type == 'room_closed':
+            room_id = message.get('room')
+            node.rooms.discard(room_id)
+            if self.room_nodes.get(room_id) is node:
+                del self.room_nodes[room_id]
+        
+        elif node is not None and msg_type == 'load':
+            self.update_load(node, message)
+        
+        elif msg_type == 'join':
+            self.send(writer, self.route_join(message.get('room')))
+        
+        return node
+    
+    def add_room(self, node, room_id):
+        node.rooms.add(room_id)
+        self.room_nodes[room_id] = node
+    
+    def update_load(self, node, message):
+        node.connections = message.get('connections', node.connections)
+        node.waiting = message.get('waiting', node.waiting)
+    
+    def remove_node(self, node):
+        """Forget a node that went away, with all of its rooms"""
+        if self.nodes.get(node.address) is node:
+            del self.nodes[node.address]
+        for room_id in node.rooms:
+            if self.room_nodes.get(room_id) is node:
+                del self.room_nodes[room_id]
+        print(f"Node {node.address} left ({len(self.nodes)} nodes)")
+    
+    def route_join(self, room_id):
+        """Build the reply to a client's join: a redirect or an error"""
+        if room_id and room_id != 'create':
+            node = self.room_nodes.get(str(room_id))
+            if node is None:
+                return {'type': 'error', 'message': f"Room {room_id} not found"}
+        else:
+            node = self.least_loaded_node(quick_match=not room_id)
+            if node is None:
+                return {'type': 'error', 'message': "No game servers available"}
+            if not room_id:
+                # Until the node reports again, assume this player either paired
+                # with the one waiting there or is now the one waiting
+                node.waiting = 1 - node.waiting
+            node.connections += 1  # Likewise, so a burst of joins spreads out
+        
+        return {
+            'type': 'redirect',
+            'room': room_id if room_id != 'create' else None,
+            'host': node.host,
+            'port': node.port
+        }
+    
+    def least_loaded_node(self, quick_match=False):
+        """Node with the fewest connections; for quick match, one with a waiting player first"""
+        if not self.nodes:
+            return None
+        if quick_match:
+            waiting = [node for node in self.nodes.values() if node.waiting]
+            if waiting:
+                return min(waiting, key=lambda node: node.connections)
+        return min(self.nodes.values(), key=lambda node: node.connections)
+    
+    def send(self, writer, message):
+        writer.write(encode_message(message, FRAMED_PROTOCOL))
+
+
+class DirectoryPublisher:
+    """Game server side: keeps this node registered with the directory.
+    
+    publish() never blocks the caller; a background thread owns the socket,
+    sends queued room events, reports load every REPORT_INTERVAL seconds and
+    registers again from scratch whenever it had to reconnect.
+    """
+    def __init__(self, address, node_info, load_report):
+        self.address = address
+        self.node_info = node_info  # Callable returning the 'register' message fields
+        self.load_report = load_report  # Callable returning the 'load' message fields
+        self.events = queue.SimpleQueue()
+        self.socket = None
+        self.running = False
+    
+    def start(self):
+        self.running = True
+        threading.Thread(target=self.run, name="directory", daemon=True).start()
+    
+    def stop(self):
+        self.running = False
+        self.events.put(None)
+    
+    def publish(self, message):
+        """Queue a room event for the directory"""
+        self.events.put(message)
+    
+    def run(self):
+        next_report = 0
+        while self.running:
+            if self.socket is None and not self.connect():
+                time.sleep(RETRY_INTERVAL)
+                continue
+            try:
+                timeout = max(0, next_report - time.monotonic())
+                try:
+                    message = self.events.get(timeout=timeout)
+                except queue.Empty:
+                    message = dict(self.load_report(), type='load')
+                    next_report = time.monotonic() + REPORT_INTERVAL
+                if message is not None:
+                    self.socket.sendall(encode_message(message, FRAMED_PROTOCOL))
+            except OSError as e:
+                print(f"Lost connection to room directory: {e}")
+                self.socket.close()
+                self.socket = None
+        
+        if self.socket is not None:
+            self.socket.close()
+    
+    def connect(self):
+        """Connect and register; room events queued meanwhile are covered by the room list"""
+        try:
+            sock = socket.create_connection(self.address, timeout=RETRY_INTERVAL)
+            sock.settimeout(None)
+            while not self.events.empty():
+                self.events.get_nowait()
+            register = dict(self.node_info(), **self.load_report())
+            register['type'] = 'register'
+            sock.sendall(encode_message(register, FRAMED_PROTOCOL))
+        except OSError as e:
+            print(f"Room directory {self.address[0]}:{self.address[1]} unavailable: {e}")
+            return False
+        self.socket = sock
+        print(f"Registered with room directory at {self.address[0]}:{self.address[1]}")
+        return True
+
+
+def main():
+    """Run the room directory"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Room directory for multi-node Rogue Deck Builder servers")
+    parser.add_argument('host', nargs='?', default='0.0.0.0', help="IP address to bind to (default: 0.0.0.0)")
+    parser.add_argument('port', nargs='?', type=int, default=DEFAULT_DIRECTORY_PORT,
+                        help=f"Port to listen on (default: {DEFAULT_DIRECTORY_PORT})")
+    args = parser.parse_args()
+    DirectoryServer(args.host, args.port).start_server()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Finding game servers on the LAN (or a ZeroTier network) without typing IPs
+
+A server started with --announce listens on UDP port DISCOVERY_PORT. A
+client broadcasts one 'discover' datagram to every interface's broadcast
+address and each server answers it straight away with where to connect
+and how busy it is, so a search takes one round trip instead of waiting
+for periodic announcements. Datagrams are single JSON objects:
+
+    {"type": "discover", "game": "rogue-deck-builder"}
+    {"type": "announce", "game": "rogue-deck-builder", "name": "host",
+     "host": null, "port": 8888, "connections": 3, "waiting": 1}
+
+"host" is only set when the server is bound to one address; otherwise the
+client connects to the address the answer came from.
+"""
+
+import json
+import select
+import socket
+import threading
+import time
+from network_info import get_network_interfaces
+
+DISCOVERY_PORT = 8887
+DISCOVERY_TIMEOUT = 0.3  # Seconds a client collects answers for
+GAME_ID = 'rogue-deck-builder'  # Ignore datagrams of anything else using the port
+
+
+def encode_datagram(message):
+    return json.dumps(message, separators=(',', ':')).encode('utf-8')
+
+
+def decode_datagram(data):
+    """The message in a datagram of ours, or None for anything else"""
+    try:
+        message = json.loads(data.decode('utf-8'))
+    except ValueError:
+        return None
+    if not isinstance(message, dict) or message.get('game') != GAME_ID:
+        return None
+    return message
+
+
+class LanAnnouncer:
+    """Game server side: answers discovery queries from a background thread"""
+    def __init__(self, port, load_report, host=None, discovery_port=DISCOVERY_PORT):
+        self.port = port  # Game port clients should connect to
+        self.host = host  # Address the game server is bound to, None for all
+        self.load_report = load_report  # Callable returning 'connections' and 'waiting'
+        self.discovery_port = discovery_port
+        self.name = socket.gethostname()
+        self.socket = None
+        self.running = False
+    
+    def start(self):
+        """Bind the discovery port; returns False if that is impossible"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            # Broadcasts only reach sockets bound to the wildcard address
+            sock.bind(('', self.discovery_port))
+        except OSError as e:
+            print(f"LAN discovery unavailable on UDP port {self.discovery_port}: {e}")
+            sock.close()
+            return False
+        self.socket = sock
+        self.running = True
+        threading.Thread(target=self.run, name="announcer", daemon=True).start()
+        print(f"Answering LAN discovery on UDP port {self.discovery_port}")
+        return True
+    
+    def stop(self):
+        self.running = False
+        if self.socket is not None:
+            self.socket.close()
+    
+    def run(self):
+        while self.running:
+            try:
+                data, address = self.socket.recvfrom(2048)
+            except OSError:
+                break
+            message = decode_datagram(data)
+            if message is None or message.get('type') != 'discover':
+                continue
+            reply = {'type': 'announce', 'game': GAME_ID, 'name': self.name,
+                     'host': self.host, 'port': self.port}
+            reply.update(self.load_report())
+            try:
+                self.socket.sendto(encode_datagram(reply), address)
+            except OSError as e:
+                print(f"Could not answer discovery from {address[0]}: {e}")
+
+
+def broadcast_addresses():
+    """Where to send a query: every interface's broadcast address, the
+    limited broadcast address and this host itself"""
+    addresses = [interface['broadcast'] for interface in get_network_interfaces() if interface['broadcast']]
+    return list(dict.fromkeys(addresses + ['255.255.255.255', '127.0.0.1']))
+
+
+def discover_servers(timeout=DISCOVERY_TIMEOUT, discovery_port=DISCOVERY_PORT):
+    """Broadcast a query and collect answers for timeout seconds.
+    
+    Returns the servers found as dicts with host, port, name, connections
+    and waiting, in the order they answered.
+    """
+    servers = {}  # (name, port) -> server
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        query = encode_datagram({'type': 'discover', 'game': GAME_ID})
+        for address in broadcast_addresses():
+            try:
+                sock.sendto(query, (address, discovery_port))
+            except OSError:
+                pass  # No route on that interface
+        
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([sock], [], [], remaining)[0]:
+                break
+            try:
+                data, address = sock.recvfrom(2048)
+            except OSError:
+                break
+            message = decode_datagram(data)
+            if message is None or message.get('type') != 'announce':
+                continue
+            host = message.get('host') or address[0]
+            server = {
+                'host': host,
+                'port': message.get('port'),
+                'name': message.get('name', host),
+                'connections': message.get('connections', 0),
+                'waiting': message.get('waiting', 0)
+            }
+            # The same server answers on loopback and on its LAN address
+            key = (server['name'], server['port'])
+            if key not in servers or servers[key]['host'].startswith('127.'):
+                servers[key] = server
+    return list(servers.values())
@@ -1,9 +1,100 @@
 #!/usr/bin/env python3
+"""
+One entry point for every mode of the game:
+
+    python3 launcher.py                     # menu
+    python3 launcher.py single [--name Ann]
+    python3 launcher.py serve [host] [port] [--async ...]
+    python3 launcher.py join [--server HOST:PORT | --lan] [--name Ann] [--room ID]
+    python3 launcher.py bench [--bots 50 ...]
+    python3 launcher.py check-imports [--budget-scale 2]
+
+Arguments after the mode go to that mode's own main(). The chosen mode is
+imported only once it has been picked, in this same process, so starting
+a client costs one interpreter and only the modules that client needs.
+check-imports measures how long each mode takes to import in a fresh
+interpreter and fails when one goes over its budget, so a heavy import
+sneaking into the client path shows up before fleets of scripted clients
+pay for it. test_import_budget.py runs the same check as a unit test for CI.
+"""
 
 import sys
-import subprocess
 
-def main():
+# Mode -> (module, description); each module has a main(argv=None)
+MODES = {
+    'single': ('client', "Single player game"),
+    'serve': ('server', "Start multiplayer server"),
+    'join': ('multiplayer_client', "Join multiplayer game"),
+    'bench': ('bench', "Benchmark a server with headless bots")
+}
+
+# Milliseconds a fresh interpreter may spend importing each module, including
+# everything it imports; asyncio alone is most of the client's share
+IMPORT_BUDGETS = {
+    'launcher': 20,
+    'client': 40,
+    'multiplayer_client': 150,
+    'server': 200,
+    'bench': 170
+}
+
+
+def run_mode(mode, argv=()):
+    """Import a mode's module and run its main with the given arguments"""
+    import importlib
+    
+    module = importlib.import_module(MODES[mode][0])
+    return module.main(list(argv))
+
+
+def import_time(module):
+    """Cumulative import time of module in microseconds, measured in a fresh
+    interpreter started in this directory; raises RuntimeError if the import fails"""
+    import os
+    import subprocess
+    
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        # A failed import is timed as well, so its line alone proves nothing
+        raise RuntimeError(f"could not import {module}: {result.stderr.strip().splitlines()[-1:]}")
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module and not fields[2].startswith('  '):
+            return int(fields[1])
+    raise RuntimeError(f"could not import {module}: {result.stderr.strip().splitlines()[-1:]}")
+
+
+def check_imports(argv=()):
+    """Compare each module's import time against IMPORT_BUDGETS; returns the exit status"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(prog='launcher.py check-imports',
+                                     description="Check that every mode imports within its time budget")
+    parser.add_argument('--budget-scale', type=float, default=1.0,
+                        help="Multiply every budget, e.g. for slow CI machines (default: 1)")
+    parser.add_argument('--runs', type=int, default=3, help="Take the fastest of this many imports (default: 3)")
+    args = parser.parse_args(list(argv))
+    
+    over_budget = 0
+    print(f"{'module':<20} {'import ms':>10} {'budget ms':>10}")
+    for module, budget in IMPORT_BUDGETS.items():
+        budget *= args.budget_scale
+        try:
+            # The fastest run is the least disturbed by whatever else the machine is doing
+            milliseconds = min(import_time(module) for _ in range(max(1, args.runs))) / 1000
+        except RuntimeError as e:
+            over_budget += 1
+            print(f"{module:<20} {'FAILED':>10} {budget:>10.0f}  {e}")
+            continue
+        status = "" if milliseconds <= budget else "  OVER BUDGET"
+        over_budget += bool(status)
+        print(f"{module:<20} {milliseconds:>10.1f} {budget:>10.0f}{status}")
+    return 1 if over_budget else 0
+
+
+def menu():
     print("=== Rogue Deck Builder Launcher ===")
     print("1. Single Player Game")
     print("2. Start Multiplayer Server")
@@ -15,26 +106,43 @@ def main():
         
         if choice == '1':
             print("Starting single player game...")
-            subprocess.run([sys.executable, "singleplayer_client.py"])
-            break
-            
+            return run_mode('single')
+        
         elif choice == '2':
             print("Starting multiplayer server...")
             print("Players can connect using option 3")
-            subprocess.run([sys.executable, "server.py"])
-            break
-            
+            return run_mode('serve')
+        
         elif choice == '3':
             print("Connecting to multiplayer game...")
-            subprocess.run([sys.executable, "multiplayer_client.py"])
-            break
-            
+            return run_mode('join')
+        
         elif choice == '4':
             print("Goodbye!")
-            break
-            
+            return
+        
         else:
             print("Invalid choice. Please select 1-4.")
 
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv:
+        return menu()
+    
+    mode, rest = argv[0], argv[1:]
+    if mode in MODES:
+        return run_mode(mode, rest)
+    if mode == 'check-imports':
+        return check_imports(rest)
+    
+    print("usage: launcher.py [MODE] [ARGS...]")
+    print("\nModes (ARGS go to the mode; MODE --help lists them):")
+    for name, (module, description) in MODES.items():
+        print(f"  {name:<14} {description} ({module}.py)")
+    print(f"  {'check-imports':<14} Check that every mode imports within its time budget")
+    return 0 if mode in ('-h', '--help') else 2
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -1,84 +1,111 @@
-import socket
-import json
+import asyncio
 import threading
+import time
 import sys
+from async_client import AsyncGameClient, GameError
+from codec import JSON_ENCODING
 
 class MultiplayerClient:
-    def __init__(self, host='localhost', port=8888):
-        self.host = host
-        self.port = port
-        self.socket = None
-        self.connected = False
-        self.player_index = -1
-        self.player_name = ""
-        self.game_state = {}
-        self.is_my_turn = False
-        
+    """Terminal UI for the game on top of AsyncGameClient.
+    
+    The asyncio client runs on an event loop in one background thread, which
+    also prints every server event as it arrives; the input() loop hands
+    commands over to that thread.
+    """
+    def __init__(self, host='localhost', port=8888, encoding=JSON_ENCODING, compression=False):
+        self.client = AsyncGameClient(host, port, encoding, compression)
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = None
+    
+    @property
+    def connected(self):
+        return self.client.connected
+    
+    @property
+    def host(self):
+        return self.client.host
+    
+    @property
+    def port(self):
+        return self.client.port
+    
+    @property
+    def protocol(self):
+        return self.client.protocol
+    
+    @property
+    def room_id(self):
+        return self.client.room_id
+    
+    @property
+    def player_index(self):
+        return self.client.player_index
+    
+    @property
+    def player_name(self):
+        return self.client.player_name
+    
+    @property
+    def spectating(self):
+        return self.client.spectating
+    
+    @property
+    def game_state(self):
+        return self.client.state
+    
+    @property
+    def is_my_turn(self):
+        return self.client.is_my_turn
+    
     def connect_to_server(self):
         """Connect to the game server"""
+        if self.loop_thread is None:
+            self.loop_thread = threading.Thread(target=self.loop.run_forever, name="network", daemon=True)
+            self.loop_thread.start()
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
-            self.connected = True
+            self.run(self.client.connect())
             print(f"Connected to server at {self.host}:{self.port}")
-            
-            # Start listening for server messages
-            listener_thread = threading.Thread(target=self.listen_for_messages)
-            listener_thread.daemon = True
-            listener_thread.start()
-            
+            asyncio.run_coroutine_threadsafe(self.show_events(), self.loop)
             return True
         except Exception as e:
             print(f"Failed to connect to server: {e}")
             return False
     
-    def listen_for_messages(self):
-        """Listen for messages from the server"""
-        buffer = ""  # Buffer to accumulate partial messages
-        
-        while self.connected:
+    def run(self, coroutine):
+        """Run a client coroutine on the network thread and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+    
+    def submit(self, coroutine):
+        """Start a client request without waiting; failures are printed when they come back"""
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        future.add_done_callback(self.report_failure)
+    
+    def report_failure(self, future):
+        error = future.exception()
+        if isinstance(error, GameError):
+            print(f"Error: {error}")
+        elif error is not None:
+            print(f"Failed to send message: {error}")
+    
+    async def show_events(self):
+        """Print server events until the connection closes"""
+        async for event in self.client.events():
             try:
-                data = self.socket.recv(4096).decode('utf-8')
-                if not data:
-                    break
-                
-                buffer += data
-                
-                # Process all complete JSON messages in the buffer
-                while buffer:
-                    try:
-                        # Try to decode one JSON message
-                        message, idx = json.JSONDecoder().raw_decode(buffer)
-                        self.handle_server_message(message)
-                        
-                        # Remove processed message from buffer
-                        buffer = buffer[idx:].lstrip()
-                        
-                    except json.JSONDecodeError as e:
-                        # If we can't decode, we need more data
-                        # Check if the error is due to incomplete data vs invalid JSON
-                        if "Expecting" in str(e) or "Unterminated" in str(e):
-                            # Incomplete JSON, wait for more data
-                            break
-                        else:
-                            # Invalid JSON, skip the first character and try again
-                            buffer = buffer[1:]
-                            if not buffer:
-                                break
-                
+                self.handle_server_message(event)
             except Exception as e:
-                if self.connected:
-                    print(f"Error receiving message: {e}")
-                break
+                print(f"Error handling {event.type}: {e}")
     
-    def handle_server_message(self, message):
-        """Handle messages from the server"""
-        msg_type = message.get('type')
+    def handle_server_message(self, event):
+        """Show one server event; AsyncGameClient has already applied it"""
+        msg_type = event.type
+        message = event.data
+        
+        if msg_type == 'join_success' and self.spectating:
+            print(f"Watching room {self.room_id}")
         
-        if msg_type == 'join_success':
-            self.player_index = message.get('player_index')
-            self.player_name = message.get('player_name')
+        elif msg_type == 'join_success':
             print(f"Successfully joined as {self.player_name} (Player {self.player_index + 1})")
+            print(f"Room: {self.room_id} (share this id so a friend can join the same game)")
         
         elif msg_type == 'game_start':
             first_player = message.get('first_player')
@@ -87,12 +114,15 @@ class MultiplayerClient:
             print(f"\\n=== GAME STARTED! ===")
             print(f"Players: {', '.join(players)}")
             print(f"{first_player_name} goes first!")
+            if message.get('turn_time'):
+                print(f"Each turn is limited to {message['turn_time']:g} seconds")
         
         elif msg_type == 'game_state':
-            self.game_state = message
-            self.is_my_turn = message.get('is_your_turn', False)
             self.display_game_state()
         
+        elif msg_type == 'spectator_state':
+            self.display_spectator_state()
+        
         elif msg_type == 'card_played':
             player_name = message.get('player_name')
             if message.get('player_index') != self.player_index:
@@ -119,11 +149,24 @@ class MultiplayerClient:
                 opponent_name = self.game_state.get('opponent', {}).get('name', 'Opponent')
                 print(f"{opponent_name} drew cards (hand: {hand_size})")
         
+        elif msg_type == 'turn_timeout':
+            if message.get('player_index') == self.player_index:
+                print("You ran out of time!")
+            else:
+                print(f"{message.get('player_name')} ran out of time!")
+        
+        elif msg_type == 'player_left':
+            if message.get('player_index') != self.player_index:
+                print(f"{message.get('player_name')} left the game")
+        
         elif msg_type == 'game_end':
             self.handle_game_end(message)
         
-        elif msg_type == 'error':
-            print(f"Error: {message.get('message')}")
+        elif msg_type == 'redirect':
+            host = message.get('host') or self.host
+            print(f"Room is hosted by another server process, moving to {host}:{message.get('port')}")
+        
+        # Errors are printed by the request they answer (see report_failure)
     
     def display_game_state(self):
         """Display current game state"""
@@ -163,11 +206,33 @@ class MultiplayerClient:
         
         # Market status
         print(f"\\nMarket:")
-        print(f"  Available Cards: {len(market_data.get('available_cards', []))}")
+        print(f"  Available Cards: {sum(1 for card in market_data.get('available_cards', []) if card)}")
         print(f"  Market Draw Pile: {market_data.get('market_draw_pile_size', 0)} cards")
         
         print("="*60)
     
+    def display_spectator_state(self):
+        """Display the public view of a watched game"""
+        state = self.game_state
+        players = state.get('players', [])
+        print(f"\n{'='*60}")
+        print(f"ROOM {state.get('room_id')}" + ("" if state.get('game_started') else " (waiting for players)"))
+        print("="*60)
+        for i, player in enumerate(players):
+            marker = ">>>" if state.get('game_started') and i == state.get('current_player') else "   "
+            print(f"{marker} {player['name']}: {player['total_wp']} WP | Power: {player['turn_power']} | "
+                  f"Hand: {player['hand_size']} | Draw: {player['draw_pile_size']} | "
+                  f"Discard: {player['discard_pile_size']}")
+        
+        market = state.get('market', {})
+        print("\nMarket:")
+        for card in market.get('available_cards', []):
+            if card is None:
+                print("  (empty)")
+                continue
+            print(f"  {card['name']} - Cost: {card['cost']} | Power: {card['power']} | WP: {card['wp']}")
+        print(f"  Market draw pile: {market.get('market_draw_pile_size', 0)} cards")
+    
     def show_hand(self):
         """Display player's hand"""
         if not self.game_state:
@@ -191,92 +256,66 @@ class MultiplayerClient:
             return
         
         market_cards = self.game_state.get('market', {}).get('available_cards', [])
-        if not market_cards:
+        if not any(market_cards):
             print("No cards available in market!")
             return
         
         print("\\n=== MARKET ===")
         for i, card in enumerate(market_cards):
+            if card is None:
+                print(f"{i}: (empty)")
+                continue
             print(f"{i}: {card['name']} - Cost: {card['cost']} | Power: {card['power']} | WP: {card['wp']}")
             print(f"   Ability: {card['ability']}")
         
         market_pile_size = self.game_state.get('market', {}).get('market_draw_pile_size', 0)
         print(f"Market draw pile remaining: {market_pile_size} cards")
     
-    def send_to_server(self, message):
-        """Send a message to the server"""
-        if not self.connected:
-            print("Not connected to server!")
-            return False
+    def join_game(self, player_name, room=None):
+        """Join a game with a player name.
         
+        room is an existing room id, 'create' for a new private room, or
+        None to be matched with the next waiting player.
+        """
         try:
-            self.socket.send(json.dumps(message).encode('utf-8'))
+            self.run(self.client.join(player_name, room))
             return True
+        except GameError as e:
+            print(f"Error: {e}")
         except Exception as e:
-            print(f"Failed to send message: {e}")
-            return False
+            print(f"Failed to join: {e}")
+        return False
     
-    def join_game(self, player_name):
-        """Join the game with a player name"""
-        message = {
-            'type': 'join',
-            'name': player_name
-        }
-        return self.send_to_server(message)
+    def spectate(self, room):
+        """Watch an existing room without taking a seat"""
+        try:
+            self.run(self.client.spectate(room))
+            return True
+        except GameError as e:
+            print(f"Error: {e}")
+        except Exception as e:
+            print(f"Failed to join: {e}")
+        return False
     
     def play_card(self, card_index):
         """Play a card from hand"""
-        if not self.is_my_turn:
-            print("It's not your turn!")
-            return
-        
-        message = {
-            'type': 'play_card',
-            'card_index': card_index
-        }
-        self.send_to_server(message)
+        self.submit(self.client.play_card(card_index))
     
     def buy_card(self, card_index):
         """Buy a card from market"""
-        if not self.is_my_turn:
-            print("It's not your turn!")
-            return
-        
-        message = {
-            'type': 'buy_card',
-            'card_index': card_index
-        }
-        self.send_to_server(message)
+        self.submit(self.client.buy_card(card_index))
     
     def draw_hand(self, hand_size=5):
         """Draw cards for hand"""
-        if not self.is_my_turn:
-            print("It's not your turn!")
-            return
-        
-        message = {
-            'type': 'draw_hand',
-            'hand_size': hand_size
-        }
-        self.send_to_server(message)
+        self.submit(self.client.draw_hand(hand_size))
     
     def finish_turn(self):
         """Finish current turn"""
-        if not self.is_my_turn:
-            print("It's not your turn!")
-            return
-        
-        message = {
-            'type': 'finish_turn'
-        }
-        self.send_to_server(message)
+        self.submit(self.client.finish_turn())
     
     def request_status(self):
         """Request current game status"""
-        message = {
-            'type': 'get_status'
-        }
-        self.send_to_server(message)
+        self.submit(self.client.request_status())
     
     def handle_game_end(self, message):
         """Handle game end"""
@@ -301,9 +340,12 @@ class MultiplayerClient:
     
     def disconnect(self):
         """Disconnect from server"""
-        self.connected = False
-        if self.socket:
-            self.socket.close()
+        if not self.connected:
+            return
+        if threading.current_thread() is self.loop_thread:
+            self.loop.create_task(self.client.close())  # Called from an event handler
+        else:
+            self.run(self.client.close())
     
     def main_game_loop(self):
         """Main client game loop"""
@@ -379,16 +421,64 @@ class MultiplayerClient:
         
         self.disconnect()
 
-def main():
+def choose_lan_server():
+    """Search the LAN for servers started with --announce and let the user pick one"""
+    from discovery import discover_servers
+    
+    print("Searching the local network...")
+    servers = discover_servers()
+    if not servers:
+        print("No servers found (they need to be started with --announce)")
+        return None
+    
+    for i, server in enumerate(servers, 1):
+        waiting = ", a player is waiting" if server['waiting'] else ""
+        print(f"{i}. {server['name']} at {server['host']}:{server['port']} "
+              f"({server['connections']} connected{waiting})")
+    choice = input(f"Choose a server (1-{len(servers)}, blank to go back): ").strip()
+    if choice.isdigit() and 1 <= int(choice) <= len(servers):
+        return servers[int(choice) - 1]
+    return None
+
+def main(argv=None):
     """Main client function"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Multiplayer Rogue Deck Builder client")
+    parser.add_argument('--directory', metavar='HOST:PORT',
+                        help="Find the game server through a room directory instead of asking for an IP")
+    parser.add_argument('--spectate', metavar='ROOM', help="Watch a game instead of playing")
+    parser.add_argument('--compress', action='store_true',
+                        help="Compress game traffic (worth it on slow links such as VPNs)")
+    parser.add_argument('--server', metavar='HOST[:PORT]', help="Connect to this server without asking")
+    parser.add_argument('--lan', action='store_true',
+                        help="Connect to the first server found on the local network")
+    parser.add_argument('--name', help="Player name (asked for when not given)")
+    parser.add_argument('--room', help="Room id to join, or 'create' for a new room "
+                                       "(default: quick match; asked for when --name is not given)")
+    args = parser.parse_args(argv)
+    
     print("=== Multiplayer Connection Setup ===")
     
     # Get connection details
-    print("1. Connect to localhost (same computer)")
-    print("2. Connect to remote server (enter IP)")
+    choose_server = not (args.directory or args.server or args.lan)
+    if args.server:
+        from directory import parse_address
+        host, port = parse_address(args.server, 8888)
+    elif args.lan:
+        from discovery import discover_servers
+        servers = discover_servers()
+        if not servers:
+            print("No servers found on the local network (they need to be started with --announce)")
+            return
+        host, port = servers[0]['host'], servers[0]['port']
+    elif not args.directory:
+        print("1. Connect to localhost (same computer)")
+        print("2. Connect to remote server (enter IP)")
+        print("3. Find servers on the local network")
     
-    while True:
-        choice = input("Choose connection type (1-2): ").strip()
+    while choose_server:
+        choice = input("Choose connection type (1-3): ").strip()
         if choice == '1':
             host = 'localhost'
             port = 8888
@@ -410,16 +500,37 @@ def main():
             else:
                 port = 8888
             break
+        elif choice == '3':
+            server = choose_lan_server()
+            if server is None:
+                continue
+            host, port = server['host'], server['port']
+            break
         else:
-            print("Invalid choice! Please select 1 or 2.")
+            print("Invalid choice! Please select 1, 2 or 3.")
+    
+    if args.spectate:
+        player_name = "Spectator"
+        room = args.spectate
+    elif args.name:
+        player_name = args.name
+        room = args.room
+    else:
+        # Get player name
+        player_name = input("Enter your player name: ").strip()
+        if not player_name:
+            player_name = "Anonymous"
+        
+        # Pick a room: quick match, a new private room, or a friend's room id
+        room = args.room or input("Room id (blank = quick match, 'create' = new room): ").strip() or None
     
-    # Get player name
-    player_name = input("Enter your player name: ").strip()
-    if not player_name:
-        player_name = "Anonymous"
+    if args.directory:
+        # The directory answers our join with a redirect to the right server
+        from directory import parse_address
+        host, port = parse_address(args.directory)
     
     print(f"Connecting to {host}:{port} as {player_name}...")
-    client = MultiplayerClient(host, port)
+    client = MultiplayerClient(host, port, compression=args.compress)
     
     if not client.connect_to_server():
         print(f"Failed to connect to server at {host}:{port}")
@@ -429,8 +540,18 @@ def main():
         print("3. No firewall is blocking the connection")
         return
     
+    if args.spectate:
+        if client.spectate(room):
+            try:
+                while client.connected:
+                    time.sleep(0.5)
+            except KeyboardInterrupt:
+                pass
+        else:
+            print(f"Could not watch room {room}")
+    
     # Join the game immediately after connecting
-    if client.join_game(player_name):
+    elif client.join_game(player_name, room):
         print("Successfully connected! Waiting for game to start...")
         client.main_game_loop()
     else:
@@ -4,96 +4,128 @@ Network Information Tool for Rogue Deck Builder Server
 Helps identify the correct IP address for ZeroTier and local networks
 """
 
+import functools
 import socket
-import subprocess
-import platform
-import re
+import struct
 
-def get_network_interfaces():
-    """Get detailed network interface information"""
+try:
+    import fcntl  # Not available on Windows
+except ImportError:
+    fcntl = None
+
+# Linux ioctls that read one IPv4 setting of a named interface
+SIOCGIFADDR = 0x8915
+SIOCGIFBRDADDR = 0x8919
+SIOCGIFNETMASK = 0x891b
+
+
+def classify_interface(name):
+    """(type, priority) of an interface from its name; lower priority is preferred"""
+    lowered = name.lower()
+    if 'zt' in lowered:
+        return "ZeroTier VPN", 1  # Highest priority for ZeroTier
+    if name.startswith('wlan') or name.startswith('wifi'):
+        return "WiFi", 3
+    if name.startswith('eth') or name.startswith('enp'):
+        return "Ethernet", 2
+    if name.startswith('docker'):
+        return "Docker", 6
+    if name.startswith('br-'):
+        return "Bridge", 7
+    if 'tun' in lowered or 'vpn' in lowered:
+        return "VPN/Tunnel", 1
+    return "Unknown", 5
+
+
+def is_usable_ip(ip):
+    return not ip.startswith('127.') and not ip.startswith('169.254')
+
+
+def interface_ipv4(sock, name, request):
+    """One IPv4 address setting of an interface through ioctl, or None"""
+    try:
+        ifreq = fcntl.ioctl(sock.fileno(), request, struct.pack('256s', name[:15].encode()))
+    except OSError:
+        return None
+    return socket.inet_ntoa(ifreq[20:24])
+
+
+def ioctl_interfaces():
+    """Interfaces and their IPv4 addresses straight from the kernel (Linux)"""
     interfaces = []
-    
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for _, name in socket.if_nameindex():
+            ip = interface_ipv4(sock, name, SIOCGIFADDR)
+            if ip is None or not is_usable_ip(ip):
+                continue
+            interface_type, priority = classify_interface(name)
+            interfaces.append({
+                'name': name,
+                'ip': ip,
+                'netmask': interface_ipv4(sock, name, SIOCGIFNETMASK),
+                'broadcast': interface_ipv4(sock, name, SIOCGIFBRDADDR),
+                'type': interface_type,
+                'priority': priority
+            })
+    return interfaces
+
+
+def resolver_interfaces():
+    """Best effort without interface names: the host's addresses and the
+    one the default route would use (connecting a UDP socket sends nothing)"""
+    ips = []
     try:
-        # Try to get interface details using ip command (Linux)
-        result = subprocess.run(['ip', 'addr', 'show'], capture_output=True, text=True)
-        if result.returncode == 0:
-            current_interface = None
-            for line in result.stdout.split('\n'):
-                line = line.strip()
-                
-                # New interface line
-                if line and line[0].isdigit() and ':' in line:
-                    interface_name = line.split(':')[1].strip().split('@')[0]
-                    current_interface = interface_name
-                
-                # IP address line
-                elif 'inet ' in line and current_interface:
-                    ip_part = line.split('inet ')[1].split('/')[0]
-                    if not ip_part.startswith('127.') and not ip_part.startswith('169.254'):
-                        interface_type = "Unknown"
-                        priority = 5
-                        
-                        # Identify interface types with priorities
-                        if 'zt' in current_interface.lower():
-                            interface_type = "ZeroTier VPN"
-                            priority = 1  # Highest priority for ZeroTier
-                        elif current_interface.startswith('wlan') or current_interface.startswith('wifi'):
-                            interface_type = "WiFi"
-                            priority = 3
-                        elif current_interface.startswith('eth') or current_interface.startswith('enp'):
-                            interface_type = "Ethernet"
-                            priority = 2
-                        elif current_interface.startswith('docker'):
-                            interface_type = "Docker"
-                            priority = 6
-                        elif current_interface.startswith('br-'):
-                            interface_type = "Bridge"
-                            priority = 7
-                        elif 'tun' in current_interface.lower() or 'vpn' in current_interface.lower():
-                            interface_type = "VPN/Tunnel"
-                            priority = 1
-                        
-                        interfaces.append({
-                            'name': current_interface,
-                            'ip': ip_part,
-                            'type': interface_type,
-                            'priority': priority
-                        })
-        
-        # Fallback to hostname -I if no interfaces found
-        if not interfaces:
-            result = subprocess.run(['hostname', '-I'], capture_output=True, text=True)
-            if result.returncode == 0:
-                ips = result.stdout.strip().split()
-                for i, ip in enumerate(ips):
-                    if not ip.startswith('127.') and not ip.startswith('169.254'):
-                        interfaces.append({
-                            'name': f'interface{i}',
-                            'ip': ip,
-                            'type': 'Unknown',
-                            'priority': 5
-                        })
+        for info in socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET):
+            ips.append(info[4][0])
+    except OSError:
+        pass
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(("8.8.8.8", 80))
+            ips.append(sock.getsockname()[0])
+    except OSError:
+        pass
     
-    except Exception as e:
-        # Final fallback - basic socket method
+    interfaces = []
+    for ip in dict.fromkeys(ips):  # Unique, in order
+        if is_usable_ip(ip):
+            interfaces.append({
+                'name': 'default' if not interfaces else f'interface{len(interfaces)}',
+                'ip': ip,
+                'netmask': None,
+                'broadcast': None,
+                'type': 'Unknown',
+                'priority': 5
+            })
+    return interfaces
+
+
+@functools.lru_cache(maxsize=1)
+def _discover_interfaces():
+    interfaces = []
+    if fcntl is not None and hasattr(socket, 'if_nameindex'):
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            local_ip = s.getsockname()[0]
-            s.close()
-            if not local_ip.startswith('127.') and not local_ip.startswith('169.254'):
-                interfaces.append({
-                    'name': 'default',
-                    'ip': local_ip,
-                    'type': 'Unknown',
-                    'priority': 5
-                })
-        except:
+            interfaces = ioctl_interfaces()
+        except OSError:
             pass
+    if not interfaces:
+        interfaces = resolver_interfaces()
     
     # Sort by priority (lower number = higher priority)
     interfaces.sort(key=lambda x: x['priority'])
-    return interfaces
+    return tuple(interfaces)
+
+
+def get_network_interfaces(refresh=False):
+    """Get detailed network interface information.
+    
+    Asks the kernel directly (no 'ip' or 'hostname' subprocess) and caches
+    the answer for the life of the process; pass refresh=True after the
+    network changed, e.g. a VPN came up.
+    """
+    if refresh:
+        _discover_interfaces.cache_clear()
+    return [dict(interface) for interface in _discover_interfaces()]
 
 def is_zerotier_network(ip):
     """Check if an IP looks like it's from ZeroTier"""
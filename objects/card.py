@@ -20,7 +20,7 @@ class Card:
     
     def getCard (self):
         return self.card_index
-
+    
     def getPower (self):
         return self.power
     
@@ -48,3 +48,71 @@ class Card:
     def getAbility (self):
         return self.ability
 
+
+class CardDefinition:
+    """
+    One card type, shared by every copy of it: piles hold references to
+    the same CardDefinition instead of a Card per copy. Immutable and
+    slotted, with the same getters as Card.
+    """
+    __slots__ = ('card_index', 'name', 'power', 'cost', 'WP', 'count', 'card_type', 'isLegendary', 'isStart', 'ability')
+    
+    def __init__ (self, card_index, name, power, cost, WP, count, card_type, isLegendary, isStart, ability):
+        values = (card_index, name, power, cost, WP, count, card_type, isLegendary, isStart, ability)
+        for field, value in zip(self.__slots__, values):
+            object.__setattr__(self, field, value)
+    
+    @classmethod
+    def from_json(cls, card_data):
+        """Build a definition from one entry of cards.json"""
+        return cls(
+            card_data['card_index'],
+            card_data['name'],
+            card_data['power'],
+            card_data['cost'],
+            card_data['WP'],
+            card_data.get('count', 1),
+            card_data.get('card_type', ''),
+            card_data.get('isLegendary', False),
+            card_data.get('isStart', False),
+            card_data.get('ability', card_data.get('Ability', ''))
+        )
+    
+    def __setattr__ (self, field, value):
+        raise AttributeError(f"CardDefinition is shared by every copy and cannot change ({field})")
+    
+    def __delattr__ (self, field):
+        raise AttributeError(f"CardDefinition is shared by every copy and cannot change ({field})")
+    
+    def __repr__ (self):
+        return f"CardDefinition({self.card_index}, {self.name!r})"
+    
+    def getCard (self):
+        return self.card_index
+    
+    def getPower (self):
+        return self.power
+    
+    def getName (self):
+        return self.name
+    
+    def getCost (self):
+        return self.cost
+    
+    def getWP (self):
+        return self.WP
+    
+    def getCount(self):
+        return self.count
+    
+    def getCardType(self):
+        return self.card_type
+    
+    def getIsLegendary(self):
+        return self.isLegendary
+    
+    def getIsStart(self):
+        return self.isStart
+    
+    def getAbility (self):
+        return self.ability
@@ -0,0 +1,104 @@
+"""
+Process-wide card catalog
+
+cards.json is parsed once per process into a CardCatalog; rooms deal their
+players' starting decks and their market from it instead of reading the
+file on every join. The server calls reload_catalogs() every few seconds:
+when a cards file's mtime, size or inode changed, it is parsed again and
+the new catalog replaces the old one in a single assignment. Rooms keep the
+catalog they were created with, so only games that start afterwards see the
+new cards. A file that fails to parse leaves the previous catalog in place.
+"""
+
+import json
+import os
+import threading
+from objects.card import CardDefinition
+
+_catalogs = {}  # Absolute path -> CardCatalog currently in use
+_load_lock = threading.Lock()  # One parse at a time; readers never take it
+
+
+class CardCatalog:
+    """Card definitions from one version of a cards file"""
+    def __init__(self, cards_data, path=None, stamp=None):
+        self.path = path
+        self.stamp = stamp  # (mtime_ns, size, inode) of the file it was parsed from
+        self.definitions = tuple(CardDefinition.from_json(card_data) for card_data in cards_data)
+        self.starting = tuple(d for d in self.definitions if d.isStart)
+        self.market = tuple(d for d in self.definitions if not d.isStart)
+    
+    @staticmethod
+    def build_cards(definitions):
+        """A pile with count references to each definition"""
+        return [definition for definition in definitions for _ in range(definition.count)]
+    
+    def all_cards(self):
+        """Every card in the file, starting cards included"""
+        return self.build_cards(self.definitions)
+    
+    def starting_cards(self):
+        """A fresh, unshuffled starting deck"""
+        return self.build_cards(self.starting)
+    
+    def market_cards(self):
+        """A fresh, unshuffled market draw pile"""
+        return self.build_cards(self.market)
+    
+    def __len__(self):
+        return len(self.definitions)
+
+
+def file_stamp(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def load_catalog(path):
+    """Parse a cards file into a CardCatalog; raises OSError, ValueError or KeyError"""
+    stamp = file_stamp(path)
+    with open(path, 'r') as file:
+        json_data = json.load(file)
+    
+    # Handle both JSON structures: direct array or wrapped in "cards" key
+    cards_data = json_data["cards"] if "cards" in json_data else json_data
+    return CardCatalog(cards_data, path, stamp)
+
+
+def get_catalog(cards_file="cards.json"):
+    """The current catalog for a cards file, parsed on first use only"""
+    path = os.path.abspath(cards_file)
+    catalog = _catalogs.get(path)
+    if catalog is None:
+        with _load_lock:
+            catalog = _catalogs.get(path)
+            if catalog is None:
+                catalog = _catalogs[path] = _load_or_empty(path)
+    return catalog
+
+
+def _load_or_empty(path):
+    try:
+        catalog = load_catalog(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Failed to load cards from {path}: {e}")
+        return CardCatalog([], path)
+    print(f"Loaded {len(catalog)} card types from {path}")
+    return catalog
+
+
+def reload_catalogs():
+    """Swap in a new catalog for every cards file that changed on disk"""
+    with _load_lock:
+        for path, catalog in list(_catalogs.items()):
+            try:
+                if file_stamp(path) == catalog.stamp:
+                    continue
+                new_catalog = load_catalog(path)
+            except (OSError, ValueError, KeyError) as e:
+                if catalog.stamp is not None:
+                    print(f"Keeping the loaded cards, {path} failed to reload: {e}")
+                    catalog.stamp = None  # Report the broken file once; retried on every check
+                continue
+            _catalogs[path] = new_catalog
+            print(f"Reloaded {len(new_catalog)} card types from {path}; new games use them")
@@ -1,127 +1,95 @@
+import collections
 import json
 import random
-from objects.card import Card
+from objects.catalog import load_catalog
+
+MARKET_SLOTS = 5  # Cards on offer at once, unless a room asks for another number
 
 class Market:
-    def __init__(self):
+    """
+    A fixed row of slots: buying a card empties its slot (None) and restocking
+    fills empty slots in place, so every other card keeps its index.
+    """
+    def __init__(self, rng=None, slots=MARKET_SLOTS):
         """Initialize market with empty card pools"""
-        self.market_draw_pile = []  # Cards available to be put in market
-        self.available_cards = []   # 5 cards currently available for purchase
+        self.rng = rng or random  # Rooms pass their own random.Random
+        self.market_draw_pile = collections.deque()  # Cards available to be put in market, next one first
+        self.available_cards = [None] * slots  # Card per slot currently available for purchase, None when empty
         self.purchased_indices = [] # Track which slots were purchased this turn
+        self.version = 0            # Bumped on every change, so views of the market can be cached
+        
+    def load_market_cards(self, catalog):
+        """Fill the market draw pile from a CardCatalog's market cards"""
+        self.add_to_draw_pile(catalog.market_cards())
+        self.refill_market()
+    
+    def add_to_draw_pile(self, cards):
+        """Shuffle cards into the market draw pile"""
+        cards = list(self.market_draw_pile) + list(cards)
+        self.rng.shuffle(cards)  # Shuffled as a list: indexing a deque is O(n)
+        self.market_draw_pile = collections.deque(cards)
         
     def load_market_cards_from_json(self, json_file_path):
         """Load market cards from JSON file"""
         try:
-            with open(json_file_path, 'r') as file:
-                json_data = json.load(file)
-                
-            # Handle both JSON structures: direct array or wrapped in "cards" key
-            if "cards" in json_data:
-                cards_data = json_data["cards"]
-            else:
-                cards_data = json_data
-                
-            total_cards_loaded = 0
-            for card_data in cards_data:
-                # Add multiple copies based on count
-                count = card_data.get('count', 1)
-                for _ in range(count):
-                    card_copy = Card(
-                        card_data['card_index'],
-                        card_data['name'],
-                        card_data['power'],
-                        card_data['cost'],
-                        card_data['WP'],
-                        card_data.get('count', 1),
-                        card_data.get('card_type', ''),
-                        card_data.get('isLegendary', False),
-                        card_data.get('isStart', False),
-                        card_data.get('ability', card_data.get('Ability', ''))
-                    )
-                    self.market_draw_pile.append(card_copy)
-                    total_cards_loaded += 1
-            
-            # Shuffle market draw pile
-            random.shuffle(self.market_draw_pile)
-            print(f"Loaded {total_cards_loaded} total cards from {len(cards_data)} card types into market")
-            
-            # Fill initial available cards (5 cards)
-            self.refill_market()
-            
+            catalog = load_catalog(json_file_path)
         except FileNotFoundError:
             print(f"Market cards file {json_file_path} not found")
         except json.JSONDecodeError:
             print(f"Invalid JSON format in {json_file_path}")
         except KeyError as e:
             print(f"Missing required field in market card data: {e}")
+        else:
+            cards = catalog.all_cards()
+            self.add_to_draw_pile(cards)
+            print(f"Loaded {len(cards)} total cards from {len(catalog)} card types into market")
+            
+            # Fill initial available cards (5 cards)
+            self.refill_market()
     
     def load_market_cards_from_main_json(self, json_file_path):
         """Load only market cards (isStart: false) from main JSON file"""
         try:
-            with open(json_file_path, 'r') as file:
-                json_data = json.load(file)
-                
-            # Handle both JSON structures: direct array or wrapped in "cards" key
-            if "cards" in json_data:
-                cards_data = json_data["cards"]
-            else:
-                cards_data = json_data
-                
-            total_cards_loaded = 0
-            for card_data in cards_data:
-                # Only load cards NOT marked as starting cards
-                if card_data.get('isStart', False):
-                    continue
-                    
-                # Add multiple copies based on count
-                count = card_data.get('count', 1)
-                for _ in range(count):
-                    card_copy = Card(
-                        card_data['card_index'],
-                        card_data['name'],
-                        card_data['power'],
-                        card_data['cost'],
-                        card_data['WP'],
-                        card_data.get('count', 1),
-                        card_data.get('card_type', ''),
-                        card_data.get('isLegendary', False),
-                        card_data.get('isStart', False),
-                        card_data.get('ability', card_data.get('Ability', ''))
-                    )
-                    self.market_draw_pile.append(card_copy)
-                    total_cards_loaded += 1
-            
-            # Shuffle market draw pile
-            random.shuffle(self.market_draw_pile)
-            print(f"Loaded {total_cards_loaded} market cards from {json_file_path}")
-            
-            # Fill initial available cards (5 cards)
-            self.refill_market()
-            
+            catalog = load_catalog(json_file_path)
         except FileNotFoundError:
             print(f"Cards file {json_file_path} not found")
         except json.JSONDecodeError:
             print(f"Invalid JSON format in {json_file_path}")
         except KeyError as e:
             print(f"Missing required field in card data: {e}")
+        else:
+            self.load_market_cards(catalog)
+            print(f"Loaded {len(catalog.market_cards())} market cards from {json_file_path}")
     
     def refill_market(self):
-        """Fill available cards to 5 cards from market draw pile"""
-        while len(self.available_cards) < 5 and self.market_draw_pile:
-            new_card = self.market_draw_pile.pop(0)
-            self.available_cards.append(new_card)
+        """Fill every empty slot from the market draw pile"""
+        self.fill_slots(range(len(self.available_cards)))
+        self.version += 1
         
-        if len(self.available_cards) < 5:
-            print(f"Warning: Only {len(self.available_cards)} cards available in market (market draw pile exhausted)")
+        empty = self.available_cards.count(None)
+        if empty:
+            print(f"Warning: {empty} market slots empty (market draw pile exhausted)")
+    
+    def fill_slots(self, indices):
+        """Put the next cards of the draw pile into whichever of these slots are empty"""
+        filled = 0
+        for index in indices:
+            if self.available_cards[index] is None and self.market_draw_pile:
+                self.available_cards[index] = self.market_draw_pile.popleft()
+                filled += 1
+        return filled
     
     def show_available_cards(self):
         """Display all available cards for purchase"""
-        if not self.available_cards:
+        if not any(self.available_cards):
             print("No cards available in market!")
             return
             
         print(f"\n=== MARKET - Available Cards ===")
         for i, card in enumerate(self.available_cards):
+            if card is None:
+                print(f"{i}: (empty)")
+                continue
             print(f"{i}: {card.getName()} - Cost: {card.getCost()} | Power: {card.getPower()} | WP: {card.getWP()}")
             print(f"   Ability: {card.getAbility()}")
         print(f"Market draw pile remaining: {len(self.market_draw_pile)} cards")
@@ -129,7 +97,7 @@ class Market:
     
     def buy_card(self, card_index, player_power):
         """Buy a card from market if player has enough power"""
-        if card_index < 0 or card_index >= len(self.available_cards):
+        if not 0 <= card_index < len(self.available_cards) or self.available_cards[card_index] is None:
             print("Invalid card index!")
             return None, 0
         
@@ -140,38 +108,38 @@ class Market:
             print(f"Not enough power! Need {cost}, have {player_power}")
             return None, 0
         
-        # Remove card from available cards and mark slot for replacement
-        purchased_card = self.available_cards.pop(card_index)
+        # Empty the slot and mark it for replacement
+        self.available_cards[card_index] = None
         self.purchased_indices.append(card_index)
+        self.version += 1
         
-        print(f"Purchased {purchased_card.getName()} for {cost} power!")
-        return purchased_card, cost
+        print(f"Purchased {card.getName()} for {cost} power!")
+        return card, cost
     
     def replace_purchased_cards(self):
-        """Replace purchased card slots with new cards from market draw pile"""
-        cards_replaced = 0
-        
-        # Sort indices in reverse order to maintain correct positions when inserting
-        for index in sorted(self.purchased_indices, reverse=True):
-            if self.market_draw_pile and index <= len(self.available_cards):
-                new_card = self.market_draw_pile.pop(0)
-                self.available_cards.insert(index, new_card)
-                cards_replaced += 1
-        
-        # If we couldn't replace all cards, just refill from the end
-        while len(self.available_cards) < 5 and self.market_draw_pile:
-            new_card = self.market_draw_pile.pop(0)
-            self.available_cards.append(new_card)
-            cards_replaced += 1
+        """Refill the slots bought from this turn, in the order they were bought"""
+        cards_replaced = self.fill_slots(self.purchased_indices)
         
         # Clear purchased indices for next turn
         self.purchased_indices.clear()
         
         if cards_replaced > 0:
+            self.version += 1
             print(f"Market restocked with {cards_replaced} new cards")
         
         return cards_replaced
     
+    def filled_slot(self, position):
+        """Slot index of the position-th card on offer, skipping empty slots;
+        None if there is no such card"""
+        if position >= 0:
+            for index, card in enumerate(self.available_cards):
+                if card is not None:
+                    if position == 0:
+                        return index
+                    position -= 1
+        return None
+    
     def is_market_exhausted(self):
         """Check if market draw pile is empty (game end condition)"""
         return len(self.market_draw_pile) == 0
@@ -179,7 +147,7 @@ class Market:
     def get_market_status(self):
         """Get current market status"""
         return {
-            'available_cards_count': len(self.available_cards),
+            'available_cards_count': len(self.available_cards) - self.available_cards.count(None),
             'market_draw_pile_count': len(self.market_draw_pile),
             'purchased_this_turn': len(self.purchased_indices),
             'is_exhausted': self.is_market_exhausted()
@@ -1,16 +1,28 @@
 import json
 import os
 import random
-from objects.card import Card
+from objects.catalog import load_catalog
 
 class Player:
-    def __init__(self, name):
+    check_totals = False  # Debug: recompute the running totals on every read and compare
+    
+    def __init__(self, name, rng=None):
         """Initialize a player with name and empty decks"""
         self.name = name
+        self.rng = rng or random  # Rooms pass their own random.Random
         self.hand = []       # Cards currently in hand
-        self.draw_pile = []  # Cards to be drawn
+        self.draw_pile = []  # Cards to be drawn; the top of the pile is the end of the list
         self.discard_pile = [] # Cards that have been played/discarded
         self.turn_power = 0    # Power generated this turn from played cards
+        self.version = 0       # Bumped on every change, so views of the player can be cached
+        
+        # Running totals over the whole deck (hand + draw + discard), kept up to
+        # date as cards join or leave it; moving between piles changes none of them
+        self.deck_size = 0
+        self.total_wp = 0
+        self.total_power = 0
+        self.card_counts = {}  # Card (definition) -> copies in the deck
+        self.type_counts = {}  # card_type -> cards of that type in the deck
     
     def play_card(self, card_index):
         """Play a card from hand to discard pile and add its power/WP"""
@@ -28,6 +40,7 @@ class Player:
         
         # Add card's power to turn total
         self.turn_power += played_card.getPower()
+        self.version += 1
         
         print(f"{self.name} played {played_card.getName()} (Power: {played_card.getPower()}, WP: {played_card.getWP()})")
         print(f"Turn power: {self.turn_power}")
@@ -60,7 +73,8 @@ class Player:
         self.turn_power -= cost
         
         # Add purchased card to discard pile
-        self.discard_pile.append(purchased_card)
+        self.add_to_deck([purchased_card], self.discard_pile)
+        self.version += 1
         
         print(f"Added {purchased_card.getName()} to discard pile")
         print(f"Remaining power this turn: {self.turn_power}")
@@ -71,17 +85,18 @@ class Player:
         if not self.draw_pile:
             # If draw pile is empty, shuffle discard pile into draw pile
             if self.discard_pile:
-                self.draw_pile = self.discard_pile[:]
-                random.shuffle(self.draw_pile)  # Randomize the order
-                self.discard_pile.clear()
+                # Swap the (empty) draw pile and the discard pile instead of copying
+                self.draw_pile, self.discard_pile = self.discard_pile, self.draw_pile
+                self.rng.shuffle(self.draw_pile)  # Randomize the order
                 print("Shuffled discard pile into draw pile")
             else:
                 print("No cards available to draw")
                 return False
         
-        # Draw card from draw pile to hand
-        drawn_card = self.draw_pile.pop(0)
+        # Draw card from the top of the draw pile to hand
+        drawn_card = self.draw_pile.pop()
         self.hand.append(drawn_card)
+        self.version += 1
         print(f"{self.name} drew a card")
         return True
     
@@ -98,122 +113,107 @@ class Player:
     def end_turn(self):
         """Reset turn-specific states"""
         self.turn_power = 0
+        self.version += 1
         print(f"{self.name}'s turn ended")
     
+    def trash_card(self, card_index):
+        """Remove a card in hand from the game for good; returns it, or None"""
+        if card_index < 0 or card_index >= len(self.hand):
+            print(f"Invalid card index: {card_index}")
+            return None
+        
+        card = self.hand.pop(card_index)
+        self.remove_from_deck(card)
+        self.version += 1
+        print(f"{self.name} trashed {card.getName()}")
+        return card
+    
+    def add_to_deck(self, cards, pile):
+        """Put cards that join the deck (dealt or bought) on a pile and count them"""
+        pile.extend(cards)
+        for card in cards:
+            self.deck_size += 1
+            self.total_wp += card.getWP()
+            self.total_power += card.getPower()
+            self.card_counts[card] = self.card_counts.get(card, 0) + 1
+            card_type = card.getCardType()
+            self.type_counts[card_type] = self.type_counts.get(card_type, 0) + 1
+    
+    def remove_from_deck(self, card):
+        """Stop counting a card that left the deck (already taken off its pile)"""
+        self.deck_size -= 1
+        self.total_wp -= card.getWP()
+        self.total_power -= card.getPower()
+        for counts, key in ((self.card_counts, card), (self.type_counts, card.getCardType())):
+            counts[key] -= 1
+            if not counts[key]:
+                del counts[key]
+    
+    def verify_totals(self):
+        """Recompute every running total from the piles; raises AssertionError on a mismatch"""
+        recomputed = Player(self.name)
+        for pile in (self.hand, self.draw_pile, self.discard_pile):
+            recomputed.add_to_deck(pile, [])
+        for field in ('deck_size', 'total_wp', 'total_power', 'card_counts', 'type_counts'):
+            if getattr(self, field) != getattr(recomputed, field):
+                raise AssertionError(f"{self.name}: running {field} {getattr(self, field)!r} "
+                                     f"!= recomputed {getattr(recomputed, field)!r}")
+    
     def calculate_total_wp(self):
-        """Calculate total WP from all cards in player's deck (hand + draw + discard)"""
-        total_wp = 0
-        all_cards = self.hand + self.draw_pile + self.discard_pile
-        for card in all_cards:
-            total_wp += card.getWP()
-        return total_wp
+        """Total WP of all cards in player's deck (hand + draw + discard)"""
+        if self.check_totals:
+            self.verify_totals()
+        return self.total_wp
+    
+    def count_cards_by_name(self):
+        """Copies of each card name in the deck"""
+        if self.check_totals:
+            self.verify_totals()
+        counts = {}
+        for card, count in self.card_counts.items():
+            counts[card.getName()] = counts.get(card.getName(), 0) + count
+        return counts
+    
+    def load_starting_cards(self, catalog):
+        """Add a starting deck from a CardCatalog to the draw pile and shuffle it"""
+        self.add_to_deck(catalog.starting_cards(), self.draw_pile)
+        self.rng.shuffle(self.draw_pile)
+        self.version += 1
     
     def load_cards_from_json(self, json_file_path):
         """Load cards from JSON file and add to draw pile"""
         try:
-            with open(json_file_path, 'r') as file:
-                json_data = json.load(file)
-                
-            # Handle both JSON structures: direct array or wrapped in "cards" key
-            if "cards" in json_data:
-                cards_data = json_data["cards"]
-            else:
-                cards_data = json_data
-                
-            total_cards_loaded = 0
-            for card_data in cards_data:
-                # Create a card instance
-                card_template = Card(
-                    card_data['card_index'],
-                    card_data['name'],
-                    card_data['power'],
-                    card_data['cost'],
-                    card_data['WP'],
-                    card_data.get('count', 1),  # Default to 1 if count not specified
-                    card_data.get('ability', card_data.get('Ability', ''))  # Handle both 'ability' and 'Ability'
-                )
-                
-                # Add multiple copies based on count
-                count = card_data.get('count', 1)
-                for _ in range(count):
-                    # Create a new card instance for each copy
-                    card_copy = Card(
-                        card_data['card_index'],
-                        card_data['name'],
-                        card_data['power'],
-                        card_data['cost'],
-                        card_data['WP'],
-                        card_data.get('count', 1),
-                        card_data.get('card_type', ''),
-                        card_data.get('isLegendary', False),
-                        card_data.get('isStart', False),
-                        card_data.get('ability', card_data.get('Ability', ''))
-                    )
-                    self.draw_pile.append(card_copy)
-                    total_cards_loaded += 1
-            
-            print(f"Loaded {total_cards_loaded} total cards from {len(cards_data)} card types from {json_file_path}")
-            
-            # Shuffle the initial draw pile for randomized first draw
-            random.shuffle(self.draw_pile)
-            print("Initial draw pile shuffled for randomized starting hands")
-            
+            catalog = load_catalog(json_file_path)
         except FileNotFoundError:
             print(f"Cards file {json_file_path} not found")
         except json.JSONDecodeError:
             print(f"Invalid JSON format in {json_file_path}")
         except KeyError as e:
             print(f"Missing required field in card data: {e}")
+        else:
+            cards = catalog.all_cards()
+            self.add_to_deck(cards, self.draw_pile)
+            print(f"Loaded {len(cards)} total cards from {len(catalog)} card types from {json_file_path}")
+            
+            # Shuffle the initial draw pile for randomized first draw
+            self.rng.shuffle(self.draw_pile)
+            self.version += 1
+            print("Initial draw pile shuffled for randomized starting hands")
     
     def load_starting_cards_from_json(self, json_file_path):
         """Load only starting cards (isStart: true) from JSON file and add to draw pile"""
         try:
-            with open(json_file_path, 'r') as file:
-                json_data = json.load(file)
-                
-            # Handle both JSON structures: direct array or wrapped in "cards" key
-            if "cards" in json_data:
-                cards_data = json_data["cards"]
-            else:
-                cards_data = json_data
-                
-            total_cards_loaded = 0
-            for card_data in cards_data:
-                # Only load cards marked as starting cards
-                if not card_data.get('isStart', False):
-                    continue
-                    
-                # Add multiple copies based on count
-                count = card_data.get('count', 1)
-                for _ in range(count):
-                    # Create a new card instance for each copy
-                    card_copy = Card(
-                        card_data['card_index'],
-                        card_data['name'],
-                        card_data['power'],
-                        card_data['cost'],
-                        card_data['WP'],
-                        card_data.get('count', 1),
-                        card_data.get('card_type', ''),
-                        card_data.get('isLegendary', False),
-                        card_data.get('isStart', False),
-                        card_data.get('ability', card_data.get('Ability', ''))
-                    )
-                    self.draw_pile.append(card_copy)
-                    total_cards_loaded += 1
-            
-            print(f"Loaded {total_cards_loaded} starting cards from {json_file_path}")
-            
-            # Shuffle the initial draw pile for randomized first draw
-            random.shuffle(self.draw_pile)
-            print("Initial draw pile shuffled for randomized starting hands")
-            
+            catalog = load_catalog(json_file_path)
         except FileNotFoundError:
             print(f"Cards file {json_file_path} not found")
         except json.JSONDecodeError:
             print(f"Invalid JSON format in {json_file_path}")
         except KeyError as e:
             print(f"Missing required field in card data: {e}")
+        else:
+            self.load_starting_cards(catalog)
+            print(f"Loaded {len(catalog.starting_cards())} starting cards from {json_file_path}")
+            print("Initial draw pile shuffled for randomized starting hands")
     
     def show_hand(self):
         """Display all cards in hand with indices"""
@@ -0,0 +1,568 @@
+import random
+from objects.catalog import get_catalog
+from objects.player import Player
+from objects.market import MARKET_SLOTS, Market
+from protocol import DELTA_PROTOCOL, SLOT_PROTOCOL, diff_state
+
+class Room:
+    """One independent 2-player game hosted by the server.
+    
+    A room owns everything that used to live directly on GameServer: its
+    players, its market, whose turn it is and its own random generator, so
+    one server process can run many games side by side. Networking stays in
+    the server; the room only calls server.send_to_client(connection, message).
+    
+    Apart from reserve_seat/is_open, which the server calls under its
+    rooms_lock, every method is meant to run on the room's actor (see
+    actor.py), so game state has a single writer.
+    """
+    MAX_PLAYERS = 2
+    
+    def __init__(self, room_id, server, cards_file="cards.json", seed=None, market_slots=MARKET_SLOTS):
+        self.room_id = room_id
+        self.server = server
+        self.cards_file = cards_file
+        self.catalog = get_catalog(cards_file)  # Kept for the whole game, even if the file is reloaded
+        self.rng = random.Random(seed)
+        self.actor = None  # Executor for this room's commands, set by the server
+        self.seats_taken = 0  # Seats handed out by reserve_seat
+        
+        # Game state
+        self.players = []  # List of Player objects
+        self.client_connections = []  # Connection per seat (None once that player leaves)
+        self.player_names = []  # List of player names
+        self.spectators = []  # Connections watching the public view
+        self.public_state = None  # Last public view sent to spectators
+        self.public_version = 0  # Its version; spectator patches build on it
+        self.views = {}  # (section, owner) -> (owner version, built section); see cached_view
+        self.market = Market(self.rng, market_slots)
+        self.current_player_index = 0
+        self.turn_number = 0  # Counts turns, so a stale deadline can tell it is stale
+        self.turn_timer = None  # Deadline of the current turn when the server limits turn time
+        self.game_started = False
+        self.game_ended = False
+        
+        # Initialize market
+        self.initialize_market()
+    
+    def initialize_market(self):
+        """Initialize the market from the card catalog"""
+        try:
+            self.market.load_market_cards(self.catalog)
+        except Exception as e:
+            print(f"[room {self.room_id}] Failed to initialize market: {e}")
+    
+    def is_full(self):
+        """Check if every seat in the room is taken"""
+        return len(self.players) >= self.MAX_PLAYERS
+    
+    def is_open(self):
+        """Check if a new player can still take a seat"""
+        return self.seats_taken < self.MAX_PLAYERS
+    
+    def reserve_seat(self):
+        """Hand out the next seat index before the actor runs add_player"""
+        player_index = self.seats_taken
+        self.seats_taken += 1
+        return player_index
+    
+    def is_empty(self):
+        """Check if no connected player is left in the room and none is on the way.
+        
+        A seat reserved by the server but not yet filled by add_player counts
+        as a player, so the room is not closed under someone still joining.
+        """
+        if self.seats_taken > len(self.players):
+            return False
+        return all(connection is None for connection in self.client_connections)
+    
+    def add_player(self, connection, player_name):
+        """Seat a new player in the room and return their player index"""
+        player_index = len(self.players)
+        player = Player(player_name, self.rng)
+        try:
+            player.load_starting_cards(self.catalog)
+        except Exception as e:
+            print(f"[room {self.room_id}] Failed to load cards for {player_name}: {e}")
+        
+        self.players.append(player)
+        self.player_names.append(player_name)
+        self.client_connections.append(connection)
+        
+        # Send confirmation to client
+        response = {
+            'type': 'join_success',
+            'room_id': self.room_id,
+            'player_index': player_index,
+            'player_name': player_name,
+            'protocol': connection.protocol,
+            'encoding': connection.encoding,
+            'compression': connection.compression
+        }
+        self.send_to_client(connection, response)
+        
+        # Whoever left while this player's seat was still reserved
+        for index, other in enumerate(self.client_connections[:player_index]):
+            if other is None:
+                self.send_to_client(connection, {
+                    'type': 'player_left',
+                    'player_index': index,
+                    'player_name': self.players[index].name
+                })
+        
+        print(f"[room {self.room_id}] Player {player_name} joined as player {player_index}")
+        print(f"[room {self.room_id}] {len(self.players)}/{self.MAX_PLAYERS} players joined")
+        
+        # Start game when both players have joined
+        if self.is_full():
+            self.start_game()
+        return player_index
+    
+    def add_spectator(self, connection):
+        """Let a client watch the game without a seat"""
+        self.spectators.append(connection)
+        response = {
+            'type': 'join_success',
+            'room_id': self.room_id,
+            'role': 'spectator',
+            'players': list(self.player_names),
+            'protocol': connection.protocol,
+            'encoding': connection.encoding,
+            'compression': connection.compression
+        }
+        self.send_to_client(connection, response)
+        self.send_public_state(connection)
+        print(f"[room {self.room_id}] Spectator joined ({len(self.spectators)} watching)")
+    
+    def remove_connection(self, connection):
+        """Forget a disconnected client and tell the remaining player"""
+        if connection in self.spectators:
+            self.spectators.remove(connection)
+            return
+        if connection not in self.client_connections:
+            return
+        player_index = self.client_connections.index(connection)
+        self.client_connections[player_index] = None
+        
+        if not self.game_ended:
+            msg = {
+                'type': 'player_left',
+                'player_index': player_index,
+                'player_name': self.players[player_index].name
+            }
+            self.broadcast_to_all(msg)
+    
+    def process_client_message(self, connection, player_index, message):
+        """Process game messages from a player seated in this room"""
+        msg_type = message.get('type')
+        connection.record_ack(message.get('state_version'))
+        
+        if player_index is None:
+            # Spectators can only ask for the public view again
+            if msg_type in ('get_status', 'resync'):
+                self.send_public_state(connection)
+        
+        elif msg_type == 'play_card' and self.is_current_player(player_index):
+            self.handle_play_card(player_index, message.get('card_index'))
+        
+        elif msg_type == 'buy_card' and self.is_current_player(player_index):
+            card_index = message.get('card_index')
+            if connection.protocol < SLOT_PROTOCOL and isinstance(card_index, int):
+                card_index = self.market.filled_slot(card_index)  # It counted filled slots only
+            self.handle_buy_card(player_index, card_index)
+        
+        elif msg_type == 'finish_turn' and self.is_current_player(player_index):
+            self.handle_finish_turn(player_index)
+        
+        elif msg_type == 'draw_hand' and self.is_current_player(player_index):
+            self.handle_draw_hand(player_index, message.get('hand_size', 5))
+        
+        elif msg_type in ('get_status', 'resync'):
+            self.send_game_status(connection, player_index, full=True)
+    
+    def start_game(self):
+        """Start the game with both players"""
+        if self.is_full():
+            # Randomly select first player
+            self.current_player_index = self.rng.randint(0, 1)
+            self.game_started = True
+            
+            # Notify all players that game started
+            game_start_msg = {
+                'type': 'game_start',
+                'room_id': self.room_id,
+                'first_player': self.current_player_index,
+                'first_player_name': self.players[self.current_player_index].name,
+                'players': [player.name for player in self.players],
+                'turn_time': self.server.turn_time
+            }
+            self.broadcast_to_all(game_start_msg)
+            
+            print(f"[room {self.room_id}] Game started! {self.players[self.current_player_index].name} goes first")
+            
+            # Send initial game state
+            self.send_game_state_to_all()
+            self.start_turn_timer()
+        else:
+            print(f"[room {self.room_id}] Cannot start game - only {len(self.players)} players joined")
+    
+    def handle_play_card(self, player_index, card_index):
+        """Handle player playing a card"""
+        player = self.players[player_index]
+        
+        if isinstance(card_index, int) and 0 <= card_index < len(player.hand):
+            success = player.play_card(card_index)
+            if success:
+                # Broadcast card played to all players
+                msg = {
+                    'type': 'card_played',
+                    'player_index': player_index,
+                    'player_name': player.name,
+                    'success': True
+                }
+                self.broadcast_to_all(msg)
+                self.send_game_state_to_all()
+            else:
+                self.send_error(self.client_connections[player_index], "Failed to play card")
+        else:
+            self.send_error(self.client_connections[player_index], "Invalid card index")
+    
+    def handle_buy_card(self, player_index, card_index):
+        """Handle player buying a card from market"""
+        player = self.players[player_index]
+        
+        if (isinstance(card_index, int) and 0 <= card_index < len(self.market.available_cards)
+                and self.market.available_cards[card_index] is not None):
+            card = self.market.available_cards[card_index]  # Buying empties the slot
+            success = player.buy_card(self.market, card_index)
+            if success:
+                msg = {
+                    'type': 'card_bought',
+                    'player_index': player_index,
+                    'player_name': player.name,
+                    'card_index': card_index,
+                    'card_name': card.getName(),
+                    'success': True
+                }
+                self.broadcast_to_all(msg)
+                self.send_game_state_to_all()
+            else:
+                self.send_error(self.client_connections[player_index], "Failed to buy card")
+        else:
+            self.send_error(self.client_connections[player_index], "Invalid card index")
+    
+    def handle_finish_turn(self, player_index):
+        """Handle player finishing their turn"""
+        player = self.players[player_index]
+        
+        # Finish current player's turn
+        player.finish_turn()
+        
+        # Replace purchased cards in market
+        self.market.replace_purchased_cards()
+        
+        # Reset player's turn power
+        player.end_turn()
+        
+        # Check if game should end
+        if self.market.is_market_exhausted():
+            self.end_game()
+            return
+        
+        # Switch to next player
+        self.current_player_index = (self.current_player_index + 1) % 2
+        
+        # Broadcast turn change
+        msg = {
+            'type': 'turn_finished',
+            'finished_player': player_index,
+            'next_player': self.current_player_index,
+            'next_player_name': self.players[self.current_player_index].name
+        }
+        self.broadcast_to_all(msg)
+        self.send_game_state_to_all()
+        self.start_turn_timer()
+    
+    def start_turn_timer(self):
+        """Give the current player server.turn_time seconds, if there is a limit"""
+        self.stop_turn_timer()
+        self.turn_number += 1
+        if self.server.turn_time:
+            self.turn_timer = self.server.timers.schedule(
+                self.server.turn_time, self.actor.submit, self.turn_expired, self.turn_number)
+    
+    def stop_turn_timer(self):
+        if self.turn_timer is not None:
+            self.turn_timer.cancel()
+            self.turn_timer = None
+    
+    def turn_expired(self, turn_number):
+        """Turn deadline (on the actor): end the turn for a player who ran out of time"""
+        if turn_number != self.turn_number or not self.is_current_player(self.current_player_index):
+            return  # The turn ended on its own while this was queued
+        player_index = self.current_player_index
+        self.turn_timer = None
+        print(f"[room {self.room_id}] {self.players[player_index].name} ran out of time")
+        self.broadcast_to_all({
+            'type': 'turn_timeout',
+            'player_index': player_index,
+            'player_name': self.players[player_index].name
+        })
+        self.handle_finish_turn(player_index)
+    
+    def handle_draw_hand(self, player_index, hand_size):
+        """Handle player drawing cards"""
+        player = self.players[player_index]
+        player.draw_hand(hand_size)
+        
+        msg = {
+            'type': 'cards_drawn',
+            'player_index': player_index,
+            'hand_size': len(player.hand)
+        }
+        self.broadcast_to_all(msg)
+        self.send_game_state_to_all()
+    
+    def end_game(self):
+        """End the game and send final scores"""
+        self.game_ended = True
+        self.stop_turn_timer()
+        
+        # Calculate final scores
+        scores = []
+        for i, player in enumerate(self.players):
+            final_wp = player.calculate_total_wp()
+            scores.append({
+                'player_index': i,
+                'player_name': player.name,
+                'final_wp': final_wp
+            })
+        
+        # Determine winner
+        winner = max(scores, key=lambda x: x['final_wp'])
+        
+        end_game_msg = {
+            'type': 'game_end',
+            'scores': scores,
+            'winner': winner
+        }
+        self.broadcast_to_all(end_game_msg)
+        print(f"[room {self.room_id}] Game ended! Winner: {winner['player_name']} with {winner['final_wp']} WP")
+        
+        # Give clients time to process the end game message
+        self.server.schedule_room_close(self, 2.0)
+    
+    def send_game_state_to_all(self):
+        """Send current game state to all players and spectators"""
+        for i, client in enumerate(self.client_connections):
+            if client is not None:
+                self.send_game_status(client, i)
+        self.publish_public_state()
+    
+    def publish_public_state(self):
+        """Fan the public view out to every spectator.
+        
+        Spectators share one version sequence, so each state change becomes
+        a single patch (or full view for older clients) that the server
+        encodes once per wire format and sends as the same bytes to all.
+        """
+        if not self.spectators:
+            self.public_state = None  # A later spectator starts from a full view
+            return
+        
+        public_state = self.build_public_state()
+        previous = self.public_state
+        ops = diff_state(previous, public_state) if previous is not None else None
+        if ops == []:
+            return  # Nothing visible to spectators has changed
+        
+        self.public_version += 1
+        self.public_state = public_state
+        full = dict(public_state, version=self.public_version)
+        
+        # Patches build on the slotted market, so older spectators get full views
+        current = [spectator for spectator in self.spectators if spectator.protocol >= SLOT_PROTOCOL]
+        older = [spectator for spectator in self.spectators if spectator.protocol < SLOT_PROTOCOL]
+        if ops is None:
+            self.server.send_to_many(current, full)
+        else:
+            self.server.send_to_many(current, {
+                'type': 'game_state_patch',
+                'base': self.public_version - 1,
+                'version': self.public_version,
+                'ops': ops
+            })
+        if older:
+            self.server.send_to_many(older, self.without_empty_slots(full))
+    
+    def send_public_state(self, connection):
+        """Send one spectator the full public view they can patch from"""
+        if self.public_state is None:
+            self.public_state = self.build_public_state()
+        public_state = dict(self.public_state, version=self.public_version)
+        if connection.protocol < SLOT_PROTOCOL:
+            public_state = self.without_empty_slots(public_state)
+        self.send_to_client(connection, public_state)
+    
+    def send_game_status(self, connection, player_index, full=False):
+        """Send game status to a specific client.
+        
+        Clients speaking the delta protocol get a full snapshot only when
+        asked (full=True), on their first state or after losing sync; every
+        other update is a game_state_patch against the last version sent.
+        """
+        if player_index >= len(self.players):
+            return
+        
+        game_state = self.build_game_state(player_index)
+        if connection.protocol < SLOT_PROTOCOL:
+            game_state = self.without_empty_slots(game_state)
+        previous = connection.last_state
+        if full or previous is None or connection.protocol < DELTA_PROTOCOL:
+            message = dict(game_state, version=connection.state_version + 1)
+        else:
+            ops = diff_state(previous, game_state)
+            if not ops:
+                return  # Nothing this client can see has changed
+            message = {
+                'type': 'game_state_patch',
+                'base': connection.state_version,
+                'version': connection.state_version + 1,
+                'ops': ops
+            }
+        
+        connection.state_version += 1
+        connection.last_state = game_state
+        self.send_to_client(connection, message)
+    
+    def cached_view(self, section, owner, build):
+        """Built state section for owner (a Player or the Market), rebuilt only
+        when owner.version has moved since the last build.
+        
+        Unchanged sections come back as the very same object, so diff_state
+        skips them by identity and nothing is reserialized for them. Callers
+        must treat the result as read-only.
+        """
+        key = (section, owner)
+        cached = self.views.get(key)
+        if cached is None or cached[0] != owner.version:
+            cached = self.views[key] = (owner.version, build(owner))
+        return cached[1]
+    
+    def build_public_state(self):
+        """Build the spectator view: everything but the players' hands"""
+        return {
+            'type': 'spectator_state',
+            'room_id': self.room_id,
+            'game_started': self.game_started,
+            'current_player': self.current_player_index,
+            'players': [self.cached_view('public', player, self.build_public_player_state)
+                        for player in self.players],
+            'market': self.cached_view('market', self.market, self.build_market_state)
+        }
+    
+    def build_public_player_state(self, player):
+        """What anyone may see about a player"""
+        return {
+            'name': player.name,
+            'hand_size': len(player.hand),
+            'draw_pile_size': len(player.draw_pile),
+            'discard_pile_size': len(player.discard_pile),
+            'turn_power': player.turn_power,
+            'total_wp': player.calculate_total_wp()
+        }
+    
+    def build_market_state(self, market):
+        """Market slots and draw pile size, the same for everyone; an empty slot is None"""
+        market_data = []
+        for card in market.available_cards:
+            if card is None:
+                market_data.append(None)
+                continue
+            market_data.append({
+                'name': card.getName(),
+                'power': card.getPower(),
+                'cost': card.getCost(),
+                'wp': card.getWP(),
+                'ability': card.getAbility()
+            })
+        return {
+            'available_cards': market_data,
+            'market_draw_pile_size': len(market.market_draw_pile)
+        }
+    
+    def build_compact_market_state(self, market):
+        """The market for clients older than SLOT_PROTOCOL: filled slots only, in order"""
+        market_state = dict(self.cached_view('market', market, self.build_market_state))
+        market_state['available_cards'] = [card for card in market_state['available_cards'] if card is not None]
+        return market_state
+    
+    def without_empty_slots(self, state):
+        """A game or spectator state as clients older than SLOT_PROTOCOL read it"""
+        return dict(state, market=self.cached_view('compact_market', self.market, self.build_compact_market_state))
+    
+    def build_game_state(self, player_index):
+        """Build the game_state dict as seen by one player"""
+        player = self.players[player_index]
+        other_player = self.players[1 - player_index] if len(self.players) > 1 else None
+        
+        game_state = {
+            'type': 'game_state',
+            'room_id': self.room_id,
+            'current_player': self.current_player_index,
+            'is_your_turn': player_index == self.current_player_index,
+            'player': self.cached_view('private', player, self.build_private_player_state),
+            'opponent': self.cached_view('public', other_player, self.build_public_player_state) if other_player else {
+                'name': "Waiting...",
+                'hand_size': 0,
+                'draw_pile_size': 0,
+                'discard_pile_size': 0,
+                'turn_power': 0,
+                'total_wp': 0
+            },
+            'market': self.cached_view('market', self.market, self.build_market_state)
+        }
+        return game_state
+    
+    def build_private_player_state(self, player):
+        """What a player sees about themselves, hand included"""
+        # Prepare player's hand (only send to the player themselves)
+        hand_data = []
+        for card in player.hand:
+            hand_data.append({
+                'name': card.getName(),
+                'power': card.getPower(),
+                'cost': card.getCost(),
+                'wp': card.getWP(),
+                'ability': card.getAbility()
+            })
+        
+        return {
+            'name': player.name,
+            'hand': hand_data,
+            'hand_size': len(player.hand),
+            'draw_pile_size': len(player.draw_pile),
+            'discard_pile_size': len(player.discard_pile),
+            'turn_power': player.turn_power,
+            'total_wp': player.calculate_total_wp()
+        }
+    
+    def is_current_player(self, player_index):
+        """Check if it's the current player's turn"""
+        return player_index == self.current_player_index and self.game_started and not self.game_ended
+    
+    def send_to_client(self, connection, message):
+        """Send a message to one client through the hosting server"""
+        if connection is not None:
+            self.server.send_to_client(connection, message)
+    
+    def broadcast_to_all(self, message):
+        """Send a message to all connected clients in this room"""
+        for client in self.client_connections:
+            self.send_to_client(client, message)
+        if self.spectators:
+            self.server.send_to_many(self.spectators, message)
+    
+    def send_error(self, connection, error_message):
+        """Send an error message to a client"""
+        self.server.send_error(connection, error_message)
@@ -0,0 +1,386 @@
+"""
+Wire protocol shared by server.py and multiplayer_client.py
+
+Protocol 1 (legacy): bare JSON documents written back to back, one per send().
+Protocol 2 (framed): every message is a 4-byte big-endian payload length
+followed by that many bytes of UTF-8 JSON, so message boundaries no longer
+depend on how TCP happens to split or coalesce segments.
+
+Protocol 3 (delta): same framing, but after the first full 'game_state' the
+server sends 'game_state_patch' messages that only carry what changed since
+the version the client already has (see diff_state/apply_patch).
+
+Protocol 4 (market slots): same as 3, but the market is a fixed row of
+slots and an emptied slot is sent as null until it is restocked. Older
+clients get only the filled slots, in order, and their buy_card index
+counts filled slots, as it did before slots existed.
+
+A framed connection always starts with a length header whose first byte is
+0 (frames are far smaller than 16 MiB), while a legacy one starts with '{',
+so the server can tell them apart from the very first byte. Clients also
+announce the version they speak in the 'protocol' field of 'join' and the
+server answers with the negotiated version in 'join_success'. Framed
+connections may also ask for the compact binary 'encoding' (see codec.py).
+
+Compression: a framed client may also ask for 'compression': 'zlib' in its
+join, naming the dictionary it has ('compression_dict', the CRC-32 of
+compression_dictionary()). If the server has the same one, each direction
+from then on runs one persistent zlib stream primed with that dictionary:
+frames whose payload reaches COMPRESS_THRESHOLD are deflated and sync-
+flushed (the constant 00 00 FF FF tail is left off and restored by the
+reader, as in WebSocket permessage-deflate) and the top bit of their length
+header is set. Smaller frames stay raw and never enter the stream, so raw
+and compressed frames can be mixed freely. The server only starts after
+reading the join; the client, which can't know whether the server agreed
+before join_success arrives, decompresses from the moment it asks, and
+compresses its own frames once join_success confirms.
+"""
+
+import functools
+import json
+import os
+import re
+import struct
+import zlib
+from codec import JSON_ENCODING, decode_payload, encode_payload
+
+LEGACY_PROTOCOL = 1
+FRAMED_PROTOCOL = 2
+DELTA_PROTOCOL = 3
+SLOT_PROTOCOL = 4
+PROTOCOL_VERSION = SLOT_PROTOCOL  # Newest version this code speaks
+
+HEADER = struct.Struct('!I')  # Payload length, network byte order
+MAX_FRAME_SIZE = 1 << 20  # 1 MiB; anything larger is a broken or hostile peer
+RECV_SIZE = 65536
+
+COMPRESSION_ZLIB = 'zlib'
+COMPRESSED_FLAG = 0x80000000  # Set in the length header of a deflated frame
+COMPRESS_THRESHOLD = 128  # Payload bytes below which a frame is sent raw
+_SYNC_TAIL = b'\x00\x00\xff\xff'  # Ends every sync-flushed block
+_WINDOW_BITS = 13  # 8 KiB window: holds the dictionary, keeps each stream small
+_MEM_LEVEL = 5
+
+
+class ProtocolError(Exception):
+    """Raised when a peer sends data that can't be a valid frame"""
+    pass
+
+
+def negotiate_protocol(requested):
+    """Pick the highest protocol version both sides understand"""
+    try:
+        requested = int(requested)
+    except (TypeError, ValueError):
+        return LEGACY_PROTOCOL
+    return max(LEGACY_PROTOCOL, min(requested, PROTOCOL_VERSION))
+
+
+def is_legacy_stream(first_byte):
+    """Check if the first byte of a connection starts an unframed JSON message"""
+    return first_byte in b'{ \t\r\n'
+
+
+@functools.lru_cache(maxsize=None)
+def compression_dictionary(cards_file=None):
+    """Preset zlib dictionary: the JSON keys of state messages and every card
+    from cards.json serialized the way the server sends it, so even the first
+    game_state on a connection compresses well. Deflate looks for matches
+    nearest the end of the dictionary, so the commonest strings go last."""
+    if cards_file is None:
+        cards_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cards.json')
+    parts = [
+        b'"type":"game_state_patch","base":,"version":,"ops":[["set","ext","del","ins",',
+        b'{"type":"game_state","room_id":"","current_player":0,"is_your_turn":false,"player":{"name":"',
+        b'"hand":[],"hand_size":0,"draw_pile_size":0,"discard_pile_size":0,"turn_power":0,"total_wp":0},',
+        b'"opponent":{"name":"","market":{"available_cards":[],"market_draw_pile_size":',
+        b'"player.hand","player.turn_power","market.available_cards","is_your_turn":true,'
+    ]
+    try:
+        with open(cards_file, 'r') as file:
+            json_data = json.load(file)
+        cards_data = json_data["cards"] if "cards" in json_data else json_data
+        for card_data in cards_data:
+            card = {
+                'name': card_data['name'],
+                'power': card_data['power'],
+                'cost': card_data['cost'],
+                'wp': card_data['WP'],
+                'ability': card_data.get('ability', card_data.get('Ability', ''))
+            }
+            parts.append(json.dumps(card, separators=(',', ':')).encode('utf-8'))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Compression dictionary without cards ({cards_file}: {e})")
+    return b''.join(parts)[-(1 << _WINDOW_BITS):]
+
+
+def dictionary_id(zdict):
+    """Short name for a dictionary, so both ends can check they share it"""
+    return zlib.crc32(zdict)
+
+
+class FrameCompressor:
+    """Deflates the outgoing frames of one connection through a single zlib
+    stream, so each message can refer back to everything sent before it"""
+    def __init__(self, zdict, threshold=COMPRESS_THRESHOLD, level=6):
+        self.stream = zlib.compressobj(level, zlib.DEFLATED, _WINDOW_BITS, _MEM_LEVEL, zdict=zdict)
+        self.threshold = threshold
+    
+    def compress_frame(self, frame):
+        """Turn an encoded frame into what goes on the wire.
+        
+        Frames must pass through here in the order they are sent: once a
+        payload is in the stream, the peer needs it to decode later ones.
+        """
+        if len(frame) - HEADER.size < self.threshold:
+            return frame
+        payload = memoryview(frame)[HEADER.size:]
+        compressed = self.stream.compress(payload) + self.stream.flush(zlib.Z_SYNC_FLUSH)
+        compressed = compressed[:-len(_SYNC_TAIL)]
+        return HEADER.pack(len(compressed) | COMPRESSED_FLAG) + compressed
+
+
+def encode_frame(payload):
+    """Prefix a payload with its length header"""
+    return HEADER.pack(len(payload)) + payload
+
+
+def encode_message(message, protocol=PROTOCOL_VERSION, encoding=JSON_ENCODING):
+    """Serialize a message dict for the given protocol version and encoding"""
+    if protocol >= FRAMED_PROTOCOL:
+        return encode_frame(encode_payload(message, encoding))
+    return json.dumps(message, separators=(',', ':')).encode('utf-8')
+
+
+class StreamDecoder:
+    """Common part of the incremental decoders below.
+    
+    Received bytes (bytes, bytearray or memoryview) are appended to a single
+    bytearray and a read offset marks what has been consumed, so pulling a
+    message out only copies that message's payload instead of re-slicing the
+    whole backlog. Consumed bytes are dropped in one step, at the next feed,
+    once they make up most of the buffer.
+    
+    feed() returns a generator: the offset moves past each payload as it is
+    yielded, so a caller that stops early gets the rest from the next feed.
+    """
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.buffer = bytearray()
+        self.offset = 0
+        self.max_frame_size = max_frame_size
+        self.decompressor = None  # zlib stream for compressed frames, once negotiated
+    
+    def enable_compression(self, zdict):
+        """Accept compressed frames from now on (see the module docstring)"""
+        if self.decompressor is None:
+            self.decompressor = zlib.decompressobj(_WINDOW_BITS, zdict=zdict)
+    
+    def feed(self, data):
+        """Add received bytes and return a generator of complete payloads"""
+        self.compact()
+        self.buffer += data
+        return self.payloads()
+    
+    def messages(self, data):
+        """Add received bytes and yield each complete message decoded
+        (None for a payload that isn't a valid message)"""
+        for payload in self.feed(data):
+            yield decode_payload(payload)
+    
+    def payloads(self):
+        raise NotImplementedError
+    
+    def compact(self):
+        """Forget consumed bytes; returns how far the buffer shifted"""
+        consumed = self.offset
+        if consumed and (consumed == len(self.buffer) or consumed > len(self.buffer) // 2):
+            del self.buffer[:consumed]
+            self.offset = 0
+            return consumed
+        return 0
+    
+    def pending(self):
+        """Number of received bytes not yet returned as a payload"""
+        return len(self.buffer) - self.offset
+
+
+class FrameDecoder(StreamDecoder):
+    """Incremental decoder for length-prefixed frames"""
+    def payloads(self):
+        buffer = self.buffer
+        header_size = HEADER.size
+        while len(buffer) - self.offset >= header_size:
+            (length,) = HEADER.unpack_from(buffer, self.offset)
+            compressed = length & COMPRESSED_FLAG
+            length &= ~COMPRESSED_FLAG
+            if length > self.max_frame_size:
+                raise ProtocolError(f"Frame of {length} bytes exceeds limit of {self.max_frame_size}")
+            start = self.offset + header_size
+            end = start + length
+            if end > len(buffer):
+                return  # Wait for the rest of this frame
+            self.offset = end
+            if compressed:
+                yield self.inflate(buffer[start:end])
+            else:
+                yield buffer[start:end]
+    
+    def inflate(self, data):
+        if self.decompressor is None:
+            raise ProtocolError("Compressed frame on a connection that didn't negotiate compression")
+        try:
+            payload = self.decompressor.decompress(data + _SYNC_TAIL, self.max_frame_size)
+        except zlib.error as e:
+            raise ProtocolError(f"Corrupt compressed frame: {e}")
+        if self.decompressor.unconsumed_tail:
+            raise ProtocolError(f"Compressed frame inflates past the limit of {self.max_frame_size} bytes")
+        return payload
+
+
+# What the JSON scanner stops at outside and inside a string
+_JSON_STRUCTURE = re.compile(rb'[{}"]')
+_JSON_STRING = re.compile(rb'["\\]')
+
+
+class JsonStreamDecoder(StreamDecoder):
+    """Incremental decoder for protocol 1, JSON objects written back to back.
+    
+    Message boundaries are found by tracking brace depth outside strings.
+    The scan position, depth and in-string state survive between feeds, so
+    every byte is examined once however TCP splits or coalesces the objects,
+    and a regex jumps straight to the next brace, quote or backslash.
+    """
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        super().__init__(max_frame_size)
+        self.scan = 0  # Next byte to examine; offset is where the current object starts
+        self.depth = 0
+        self.in_string = False
+    
+    def compact(self):
+        shift = super().compact()
+        self.scan -= shift
+        return shift
+    
+    def payloads(self):
+        buffer = self.buffer
+        while True:
+            if self.in_string:
+                match = _JSON_STRING.search(buffer, self.scan)
+                if match is None:
+                    self.scan = len(buffer)
+                    break
+                position = match.start()
+                if buffer[position] == 0x5C:  # Backslash: skip the escaped byte too
+                    if position + 1 == len(buffer):
+                        self.scan = position  # Look at it again once the next byte is here
+                        break
+                    self.scan = position + 2
+                else:
+                    self.in_string = False
+                    self.scan = position + 1
+                continue
+            
+            match = _JSON_STRUCTURE.search(buffer, self.scan)
+            if match is None:
+                self.scan = len(buffer)
+                if self.depth == 0:
+                    self.offset = self.scan  # Only whitespace between objects
+                break
+            position = match.start()
+            self.scan = position + 1
+            byte = buffer[position]
+            if byte == 0x22:  # '"'
+                self.in_string = True
+            elif byte == 0x7B:  # '{'
+                if self.depth == 0:
+                    self.offset = position
+                self.depth += 1
+            elif self.depth == 0:
+                raise ProtocolError("Unbalanced '}' in JSON stream")
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    start = self.offset
+                    self.offset = self.scan
+                    yield buffer[start:self.scan]
+        
+        if self.scan - self.offset > self.max_frame_size:
+            raise ProtocolError(f"JSON message exceeds limit of {self.max_frame_size} bytes")
+
+
+def _join_path(path, key):
+    return f"{path}.{key}" if path else str(key)
+
+
+def diff_state(old, new, path='', ops=None):
+    """Describe how to turn the old state dict into the new one.
+    
+    Returns a list of [op, path, value] operations where path is a dotted
+    key path ('player.turn_power', 'market.available_cards.2'):
+      'set' - replace the value at path
+      'del' - remove index value from the list at path (a played card)
+      'ins' - insert value = [index, item] into the list at path (a restocked slot)
+      'ext' - append the value items to the list at path (drawn cards)
+    """
+    if ops is None:
+        ops = []
+    if old is new:
+        return ops
+    
+    if isinstance(old, dict) and isinstance(new, dict) and old.keys() == new.keys():
+        for key, value in new.items():
+            diff_state(old[key], value, _join_path(path, key), ops)
+    
+    elif isinstance(old, list) and isinstance(new, list):
+        if len(old) == len(new):
+            for i, value in enumerate(new):
+                diff_state(old[i], value, _join_path(path, i), ops)
+        elif len(new) == len(old) - 1:
+            # One item removed: find where the lists start to differ
+            i = 0
+            while i < len(new) and old[i] == new[i]:
+                i += 1
+            if old[i + 1:] == new[i:]:
+                ops.append(['del', path, i])
+            else:
+                ops.append(['set', path, new])
+        elif len(new) == len(old) + 1:
+            # One item inserted: find where it went
+            i = 0
+            while i < len(old) and old[i] == new[i]:
+                i += 1
+            if old[i:] == new[i + 1:]:
+                ops.append(['ins', path, [i, new[i]]])
+            else:
+                ops.append(['set', path, new])
+        elif len(new) > len(old) and new[:len(old)] == old:
+            ops.append(['ext', path, new[len(old):]])
+        else:
+            ops.append(['set', path, new])
+    
+    elif old != new:
+        ops.append(['set', path, new])
+    return ops
+
+
+def apply_patch(state, ops):
+    """Apply operations produced by diff_state to a state dict in place"""
+    for op, path, value in ops:
+        *parents, key = path.split('.')
+        target = state
+        for part in parents:
+            target = target[int(part)] if isinstance(target, list) else target[part]
+        if isinstance(target, list):
+            key = int(key)
+        
+        if op == 'set':
+            target[key] = value
+        elif op == 'del':
+            del target[key][value]
+        elif op == 'ins':
+            target[key].insert(value[0], value[1])
+        elif op == 'ext':
+            target[key].extend(value)
+        else:
+            raise ProtocolError(f"Unknown patch operation {op!r}")
+    return state
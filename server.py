@@ -1,457 +1,731 @@
+import asyncio
 import socket
 import threading
-import json
-import random
+import time
+import uuid
+from actor import AsyncRoomActor, RoomActor
+from connection import (
+    DEFAULT_QUEUE_LIMIT, OVERFLOW_COLLAPSE, OVERFLOW_POLICIES, STATE_MESSAGES,
+    SocketConnection, StreamConnection, write_batch
+)
+from objects.catalog import get_catalog, reload_catalogs
+from objects.market import MARKET_SLOTS
 from objects.player import Player
-from objects.market import Market
+from objects.room import Room
+from protocol import FRAMED_PROTOCOL, RECV_SIZE, ProtocolError, encode_message
+from stats import ServerStats, serve_stats
+from timers import TimerWheel
+
+# Message types clients send; anything else is counted as 'other' in the stats
+COMMAND_TYPES = ('join', 'play_card', 'buy_card', 'finish_turn', 'draw_hand', 'get_status', 'resync',
+                 'ping', 'pong')
+
+HEARTBEAT_INTERVAL = 15.0  # Seconds of silence before a client is pinged
+DEFAULT_IDLE_TIMEOUT = 60.0  # Seconds of silence before a client is disconnected
+CATALOG_CHECK_INTERVAL = 2.0  # Seconds between checks of cards.json for changes
+PARENT_CHECK_INTERVAL = 1.0  # Seconds between a worker's checks that its parent still runs
 
 class GameServer:
-    def __init__(self, host='localhost', port=8888):
+    """Threaded game server hosting any number of independent 2-player rooms"""
+    def __init__(self, host='localhost', port=8888, backlog=128,
+                 queue_limit=DEFAULT_QUEUE_LIMIT, overflow_policy=OVERFLOW_COLLAPSE,
+                 workers=None, worker_index=0, directory=None, advertise_host=None,
+                 stats_address=None, turn_time=None, idle_timeout=DEFAULT_IDLE_TIMEOUT, announce=False,
+                 market_slots=MARKET_SLOTS, check_totals=False):
         self.host = host
         self.port = port
+        self.backlog = backlog
+        self.queue_limit = queue_limit  # Outbound messages buffered per client
+        self.overflow_policy = overflow_policy  # What happens to a client past that limit
+        self.workers = workers  # WorkerGroup when this is one of several server processes
+        self.worker_index = worker_index
+        self.advertise_host = advertise_host  # Address clients reach this node at (for the directory)
+        self.directory = None  # DirectoryPublisher when registered with a room directory
+        self.announcer = None  # LanAnnouncer when answering LAN discovery
+        self.stats = ServerStats()
+        self.stats_address = stats_address  # (host, port) to serve /metrics on, if any
+        self.timers = TimerWheel()  # Heartbeats, idle reaping, turn deadlines, room shutdowns
+        self.turn_time = turn_time  # Seconds a player gets per turn before it is ended for them
+        self.idle_timeout = idle_timeout  # Seconds of silence before reaping a client (None: never)
+        self.market_slots = market_slots  # Cards on offer in each room's market
+        if check_totals:
+            Player.check_totals = True  # Debug: verify every player's running totals on each read
+        # Ping well before the timeout so a live client has time to answer
+        self.heartbeat_interval = min(HEARTBEAT_INTERVAL, (idle_timeout or HEARTBEAT_INTERVAL * 4) / 4)
+        if directory is not None:
+            from directory import DirectoryPublisher
+            self.directory = DirectoryPublisher(directory, self.node_info, self.load_report)
+        if announce and worker_index == 0:  # One answer per machine, even with several workers
+            from discovery import LanAnnouncer
+            self.announcer = LanAnnouncer(port, self.load_report, host if host != '0.0.0.0' else None)
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listeners = [self.socket]
         
-        # Game state
-        self.players = []  # List of Player objects
-        self.client_connections = []  # List of client socket connections
-        self.player_names = []  # List of player names
-        self.market = Market()
-        self.current_player_index = 0
-        self.game_started = False
-        self.game_ended = False
-        self.connected = True
+        if workers is not None:
+            # Every worker accepts on the shared port; redirected players come
+            # in through this worker's private port
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            worker_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            worker_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.listeners.append(worker_socket)
         
-        # Initialize market
-        self.initialize_market()
+        # Server state
+        self.rooms = {}  # room_id -> Room
+        self.matchmaking_room = None  # Open room that quick-match joins fill next
+        self.client_connections = []  # Every open client connection
+        self.connection_seats = {}  # client connection -> (Room, player_index)
+        self.rooms_lock = threading.Lock()
+        self.connected = True
+        self.shutdown_event = threading.Event()
     
-    def initialize_market(self):
-        """Initialize the market from cards.json"""
-        try:
-            self.market.load_market_cards_from_main_json("cards.json")
-            print("Market initialized on server")
-        except Exception as e:
-            print(f"Failed to initialize market: {e}")
+    def bind_listeners(self):
+        """Bind and listen on the server port (and the worker's private port)"""
+        self.socket.bind((self.host, self.port))
+        if self.workers is not None:
+            self.listeners[1].bind((self.host, self.workers.worker_port(self.worker_index)))
+        for listener in self.listeners:
+            listener.listen(self.backlog)
+        
+        if self.workers is None:
+            return f"{self.host}:{self.port}"
+        return (f"{self.host}:{self.port} as worker {self.worker_index} "
+                f"(private port {self.workers.worker_port(self.worker_index)})")
     
     def start_server(self):
         """Start the server and listen for connections"""
         try:
-            self.socket.bind((self.host, self.port))
-            self.socket.listen(2)  # Maximum 2 players
-            print(f"Game server started on {self.host}:{self.port}")
-            print("Waiting for players to connect...")
+            print(f"Game server started on {self.bind_listeners()}")
+            self.start_services()
+            print("Waiting for players to connect... Press Ctrl+C to stop server.")
             
-            while len(self.client_connections) < 2:
-                client_socket, address = self.socket.accept()
-                print(f"Player connected from {address}")
-                
-                # Handle client connection in a separate thread
-                client_thread = threading.Thread(
-                    target=self.handle_client, 
-                    args=(client_socket, len(self.client_connections))
-                )
-                client_thread.daemon = True
-                client_thread.start()
-                
-                self.client_connections.append(client_socket)
-                
-                print(f"{len(self.client_connections)}/2 players connected")
-            
-            # Keep server alive while game is running
-            print("Game is running! Press Ctrl+C to stop server.")
-            try:
-                while not self.game_ended and len(self.client_connections) > 0:
-                    import time
-                    time.sleep(1)  # Check every second
-            except KeyboardInterrupt:
-                print("\nServer interrupted by user")
-            
-            print("Game finished or all players disconnected")
+            for listener in self.listeners[1:]:
+                threading.Thread(target=self.accept_clients, args=(listener,), daemon=True).start()
+            self.accept_clients(self.socket)
                 
+        except KeyboardInterrupt:
+            print("\nServer interrupted by user")
         except Exception as e:
             print(f"Server error: {e}")
         finally:
             print("Server shutting down...")
-            for client in self.client_connections:
-                try:
-                    client.close()
-                except:
-                    pass
-            self.socket.close()
+            for client in list(self.client_connections):
+                client.close()
+            for listener in self.listeners:
+                listener.close()
+            if self.directory is not None:
+                self.directory.stop()
+            if self.announcer is not None:
+                self.announcer.stop()
+            self.shutdown_event.set()
+    
+    def accept_clients(self, listener):
+        """Accept connections on one listening socket until shutdown"""
+        while self.connected:
+            try:
+                client_socket, address = listener.accept()
+            except OSError:
+                break  # Listening socket was closed by shutdown_server
+            print(f"Client connected from {address}")
+            connection = SocketConnection(client_socket, address, **self.connection_options())
+            self.client_connections.append(connection)
+            self.watch_connection(connection)
+            
+            # Handle client connection in a separate thread
+            client_thread = threading.Thread(
+                target=self.handle_client, 
+                args=(connection,)
+            )
+            client_thread.daemon = True
+            client_thread.start()
     
-    def handle_client(self, client_socket, player_index):
+    def handle_client(self, connection):
         """Handle communication with a specific client"""
-        print(f"Starting handler for player {player_index}")
+        address = connection.address
+        client_socket = connection.socket
+        print(f"Starting handler for {address}")
         try:
-            while not self.game_ended:
+            while self.connected:
                 try:
-                    client_socket.settimeout(1.0)  # Set timeout for recv
-                    data = client_socket.recv(4096).decode('utf-8')
+                    # Blocks until data arrives; close() shuts the socket down to wake it
+                    data = client_socket.recv(RECV_SIZE)
                     if not data:
-                        print(f"Player {player_index} disconnected (no data)")
+                        print(f"Client {address} disconnected (no data)")
                         break
                     
-                    try:
-                        message = json.loads(data)
-                        self.process_client_message(client_socket, player_index, message)
-                    except json.JSONDecodeError:
-                        print(f"Invalid JSON from player {player_index}: {data}")
+                    # Everything these messages produce is flushed once per client
+                    with write_batch():
+                        self.handle_data(connection, data)
                         
-                except socket.timeout:
-                    # Timeout is normal, just continue
-                    continue
                 except ConnectionResetError:
-                    print(f"Player {player_index} disconnected (connection reset)")
+                    print(f"Client {address} disconnected (connection reset)")
+                    break
+                except ProtocolError as e:
+                    print(f"Protocol error from {address}: {e}")
                     break
                 except Exception as e:
-                    print(f"Network error with player {player_index}: {e}")
+                    print(f"Network error with {address}: {e}")
                     break
                     
         except Exception as e:
-            print(f"Error handling client {player_index}: {e}")
+            print(f"Error handling client {address}: {e}")
         finally:
-            print(f"Cleaning up connection for player {player_index}")
-            if client_socket in self.client_connections:
-                self.client_connections.remove(client_socket)
-            try:
-                client_socket.close()
-            except:
-                pass
+            print(f"Cleaning up connection for {address}")
+            self.drop_connection(connection)
+            connection.wait_closed()
+    
+    def connection_options(self):
+        """Outbound queue settings for a new client connection"""
+        return {
+            'queue_limit': self.queue_limit,
+            'overflow_policy': self.overflow_policy,
+            'on_state_dropped': self.resend_game_state,
+            'on_compressed': self.stats.record_compressed
+        }
+    
+    def resend_game_state(self, connection):
+        """Queue a full snapshot after a slow client's state updates were dropped"""
+        seat = self.connection_seats.get(connection)
+        if seat is None:
+            return
+        room, player_index = seat
+        if player_index is None:
+            room.actor.submit(room.send_public_state, connection)
+        else:
+            room.actor.submit(room.send_game_status, connection, player_index, True)
     
-    def process_client_message(self, client_socket, player_index, message):
+    def handle_data(self, connection, data):
+        """Decode received bytes and process every complete message in them"""
+        received = time.perf_counter()
+        messages = connection.feed(data)
+        self.stats.record_received(len(data), [self.command_label(message) for message in messages])
+        for message in messages:
+            self.process_client_message(connection, message, received)
+    
+    def command_label(self, message):
+        """Stats label for a client message (clients can't invent new ones)"""
+        msg_type = message.get('type')
+        return msg_type if msg_type in COMMAND_TYPES else 'other'
+    
+    def process_client_message(self, connection, message, received=None):
         """Process messages from clients"""
         msg_type = message.get('type')
+        if received is None:
+            received = time.perf_counter()
+        
+        if msg_type == 'pong':
+            connection.answers_heartbeats = True
+            return
+        if msg_type == 'ping':
+            self.send_to_client(connection, {'type': 'pong'})
+            return
         
         if msg_type == 'join':
-            self.handle_player_join(client_socket, player_index, message.get('name', f'Player{player_index+1}'))
+            self.handle_player_join(connection, message)
+            self.stats.record_handled('join', time.perf_counter() - received)
+            return
+        
+        seat = self.connection_seats.get(connection)
+        if seat is None:
+            self.send_error(connection, "Join a room first")
+            return
         
-        elif msg_type == 'play_card' and self.is_current_player(player_index):
-            self.handle_play_card(player_index, message.get('card_index'))
+        room, player_index = seat
+        room.actor.submit(self.apply_command, room, connection, player_index, message, received)
+    
+    def apply_command(self, room, connection, player_index, message, received):
+        """Run a player's command on the room's actor and time it from arrival"""
+        room.process_client_message(connection, player_index, message)
+        self.stats.record_handled(self.command_label(message), time.perf_counter() - received)
+    
+    def handle_player_join(self, connection, message):
+        """Seat a player in a room.
         
-        elif msg_type == 'buy_card' and self.is_current_player(player_index):
-            self.handle_buy_card(player_index, message.get('card_index'))
+        message['room'] picks the room: an existing room id, 'create' for a
+        new private room, or nothing for quick match with the next free seat.
+        With role 'spectator' the client watches an existing room instead.
+        """
+        if connection in self.connection_seats:
+            self.send_error(connection, "Already joined a room")
+            return
         
-        elif msg_type == 'finish_turn' and self.is_current_player(player_index):
-            self.handle_finish_turn(player_index)
+        connection.negotiate(message.get('protocol'), message.get('encoding'),
+                             message.get('compression'), message.get('compression_dict'))
         
-        elif msg_type == 'draw_hand' and self.is_current_player(player_index):
-            self.handle_draw_hand(player_index, message.get('hand_size', 5))
+        room_id = message.get('room')
+        spectating = message.get('role') == 'spectator'
+        if spectating and (not room_id or room_id == 'create'):
+            self.send_error(connection, "Spectators must name a room to watch")
+            return
         
-        elif msg_type == 'get_status':
-            self.send_game_status(client_socket, player_index)
-    
-    def handle_player_join(self, client_socket, player_index, player_name):
-        """Handle player joining the game"""
-        if len(self.players) <= player_index:
-            # Create new player
-            player = Player(player_name)
-            try:
-                player.load_starting_cards_from_json("cards.json")
-                print(f"Loaded starting cards for {player_name}")
-            except Exception as e:
-                print(f"Failed to load cards for {player_name}: {e}")
-            
-            self.players.append(player)
-            self.player_names.append(player_name)
-            
-            # Send confirmation to client
-            response = {
-                'type': 'join_success',
-                'player_index': player_index,
-                'player_name': player_name
-            }
-            self.send_to_client(client_socket, response)
-            
-            print(f"Player {player_name} joined as player {player_index}")
-            print(f"{len(self.players)}/2 players joined")
-            
-            # Start game when both players have joined
-            if len(self.players) == 2:
-                print("Both players joined! Starting game...")
-                self.start_game()
-    
-    def start_game(self):
-        """Start the game with both players"""
-        if len(self.players) == 2:
-            # Randomly select first player
-            self.current_player_index = random.randint(0, 1)
-            self.game_started = True
-            
-            print(f"Game starting with players: {[p.name for p in self.players]}")
-            
-            # Notify all players that game started
-            game_start_msg = {
-                'type': 'game_start',
-                'first_player': self.current_player_index,
-                'first_player_name': self.players[self.current_player_index].name,
-                'players': [player.name for player in self.players]
-            }
-            self.broadcast_to_all(game_start_msg)
+        owner = self.route_join(connection, room_id)
+        if owner is not None:
+            self.send_redirect(connection, owner, room_id)
+            return
+        
+        with self.rooms_lock:
+            if room_id == 'create':
+                room = self.create_room()
+            elif room_id:
+                room = self.rooms.get(str(room_id))
+                if room is None:
+                    self.send_error(connection, f"Room {room_id} not found")
+                    return
+                if spectating:
+                    self.connection_seats[connection] = (room, None)
+                    room.actor.submit(room.add_spectator, connection)
+                    return
+                if not room.is_open():
+                    self.send_error(connection, f"Room {room_id} is full")
+                    return
+            else:
+                if self.matchmaking_room is None or not self.matchmaking_room.is_open():
+                    self.matchmaking_room = self.create_room()
+                room = self.matchmaking_room
             
-            print(f"Game started! {self.players[self.current_player_index].name} goes first")
+            # The seat is taken right away so quick match never overfills a
+            # room; the player is added on the room's actor like any command
+            player_index = room.reserve_seat()
+            player_name = message.get('name') or f'Player{player_index + 1}'
+            self.connection_seats[connection] = (room, player_index)
+            room.actor.submit(room.add_player, connection, player_name)
             
-            # Send initial game state
-            self.send_game_state_to_all()
-        else:
-            print(f"Cannot start game - only {len(self.players)} players joined")
+            if room is self.matchmaking_room and not room.is_open() and self.workers is not None:
+                self.workers.advance_matchmaking(self.worker_index)
     
-    def handle_play_card(self, player_index, card_index):
-        """Handle player playing a card"""
-        player = self.players[player_index]
-        
-        if 0 <= card_index < len(player.hand):
-            success = player.play_card(card_index)
-            if success:
-                # Broadcast card played to all players
-                msg = {
-                    'type': 'card_played',
-                    'player_index': player_index,
-                    'player_name': player.name,
-                    'success': True
-                }
-                self.broadcast_to_all(msg)
-                self.send_game_state_to_all()
-            else:
-                self.send_error(self.client_connections[player_index], "Failed to play card")
+    def route_join(self, connection, room_id):
+        """Return the worker that should seat this join, or None for this process"""
+        if self.workers is None or room_id == 'create':
+            return None
+        if room_id:
+            owner = self.workers.room_owner(room_id)
         else:
-            self.send_error(self.client_connections[player_index], "Invalid card index")
-    
-    def handle_buy_card(self, player_index, card_index):
-        """Handle player buying a card from market"""
-        player = self.players[player_index]
+            owner = self.workers.matchmaking_worker()
         
-        if 0 <= card_index < len(self.market.available_cards):
-            success = player.buy_card(self.market, card_index)
-            if success:
-                msg = {
-                    'type': 'card_bought',
-                    'player_index': player_index,
-                    'player_name': player.name,
-                    'card_name': self.market.available_cards[card_index].getName() if card_index < len(self.market.available_cards) else "Unknown",
-                    'success': True
-                }
-                self.broadcast_to_all(msg)
-                self.send_game_state_to_all()
-            else:
-                self.send_error(self.client_connections[player_index], "Failed to buy card")
-        else:
-            self.send_error(self.client_connections[player_index], "Invalid card index")
+        # Legacy clients can't follow a redirect, so they are seated here
+        if owner == self.worker_index or connection.protocol < FRAMED_PROTOCOL:
+            return None
+        return owner
+    
+    def send_redirect(self, connection, worker_index, room_id):
+        """Tell a client to reconnect to the worker that owns its room and join again"""
+        redirect_msg = {
+            'type': 'redirect',
+            'room': room_id,
+            'worker': worker_index,
+            'port': self.workers.worker_port(worker_index)
+        }
+        self.send_to_client(connection, redirect_msg)
     
-    def handle_finish_turn(self, player_index):
-        """Handle player finishing their turn"""
-        player = self.players[player_index]
+    def create_room(self):
+        """Create a new empty room with a unique id (caller holds rooms_lock)"""
+        room_id = self.new_room_id()
+        while room_id in self.rooms:
+            room_id = self.new_room_id()
         
-        # Finish current player's turn
-        player.finish_turn()
+        room = Room(room_id, self, market_slots=self.market_slots)
+        room.actor = self.create_actor(room_id)
+        self.rooms[room_id] = room
+        self.publish({'type': 'room_opened', 'room': room_id})
+        print(f"Created room {room_id} ({len(self.rooms)} active rooms)")
+        return room
+    
+    def new_room_id(self):
+        """Random room id, tagged with this worker's index when sharded"""
+        room_id = uuid.uuid4().hex[:6]
+        if self.workers is not None:
+            room_id = self.workers.room_id(self.worker_index, room_id)
+        return room_id
+    
+    def create_actor(self, room_id):
+        """Start the executor that runs a new room's commands"""
+        return RoomActor(room_id)
+    
+    def close_room(self, room, only_if_empty=False):
+        """Remove a room and disconnect whoever is still in it (runs on the room's actor).
         
-        # Replace purchased cards in market
-        self.market.replace_purchased_cards()
+        With only_if_empty the room is kept if a player is in it or has a
+        seat reserved; that is checked under rooms_lock, where seats are
+        reserved, so no join can slip in between the check and the close.
+        """
+        with self.rooms_lock:
+            if only_if_empty and not room.is_empty():
+                return
+            if self.rooms.pop(room.room_id, None) is None:
+                return
+            if self.matchmaking_room is room:
+                self.matchmaking_room = None
+            connections = [client for client in room.client_connections if client is not None]
+            connections += room.spectators
+            for client in connections:
+                self.connection_seats.pop(client, None)
         
-        # Reset player's turn power
-        player.end_turn()
+        for client in connections:
+            client.close()
+        room.stop_turn_timer()
+        room.actor.stop()
+        self.publish({'type': 'room_closed', 'room': room.room_id})
+        print(f"Closed room {room.room_id} ({len(self.rooms)} active rooms)")
+    
+    def schedule_room_close(self, room, delay):
+        """Close a finished room after delay seconds"""
+        self.timers.schedule(delay, room.actor.submit, self.close_room, room)
+    
+    def watch_connection(self, connection):
+        """Start the heartbeat timer of a new client connection"""
+        connection.heartbeat = self.timers.schedule(self.heartbeat_interval, self.check_connection, connection)
+    
+    def check_connection(self, connection):
+        """Heartbeat timer: ping a quiet client, or reap one that stayed silent.
         
-        # Check if game should end
-        if self.market.is_market_exhausted():
-            self.end_game()
+        Only clients that are not in a room yet, or that have answered a
+        ping before, are reaped; older clients never answer and may well be
+        quietly waiting for their opponent. Turn deadlines cover those.
+        """
+        if connection.closed:
             return
-        
-        # Switch to next player
-        self.current_player_index = (self.current_player_index + 1) % 2
-        
-        # Broadcast turn change
-        msg = {
-            'type': 'turn_finished',
-            'finished_player': player_index,
-            'next_player': self.current_player_index,
-            'next_player_name': self.players[self.current_player_index].name
-        }
-        self.broadcast_to_all(msg)
-        self.send_game_state_to_all()
+        idle = time.monotonic() - connection.last_seen
+        reapable = connection.answers_heartbeats or connection not in self.connection_seats
+        if self.idle_timeout and idle >= self.idle_timeout and reapable:
+            print(f"Client {connection.address} silent for {idle:.0f}s; disconnecting")
+            connection.abort()
+            return
+        if idle >= self.heartbeat_interval:
+            self.send_to_client(connection, {'type': 'ping'})
+        connection.heartbeat = self.timers.schedule(self.heartbeat_interval, self.check_connection, connection)
     
-    def handle_draw_hand(self, player_index, hand_size):
-        """Handle player drawing cards"""
-        player = self.players[player_index]
-        player.draw_hand(hand_size)
-        
-        msg = {
-            'type': 'cards_drawn',
-            'player_index': player_index,
-            'hand_size': len(player.hand)
-        }
-        self.broadcast_to_all(msg)
-        self.send_game_state_to_all()
+    def check_catalogs(self):
+        """Timer: pick up edits to cards.json for the games started from now on"""
+        reload_catalogs()
+        self.timers.schedule(CATALOG_CHECK_INTERVAL, self.check_catalogs)
     
-    def end_game(self):
-        """End the game and send final scores"""
-        self.game_ended = True
-        
-        # Calculate final scores
-        scores = []
-        for i, player in enumerate(self.players):
-            final_wp = player.calculate_total_wp()
-            scores.append({
-                'player_index': i,
-                'player_name': player.name,
-                'final_wp': final_wp
-            })
-        
-        # Determine winner
-        winner = max(scores, key=lambda x: x['final_wp'])
+    def check_parent(self):
+        """Timer (workers only): shut down once the process that started the workers is gone"""
+        if not self.workers.parent_alive():
+            print(f"Worker {self.worker_index}: parent process exited; shutting down")
+            self.shutdown_server()
+            return
+        self.timers.schedule(PARENT_CHECK_INTERVAL, self.check_parent)
+    
+    def start_timers(self):
+        """Advance the timer wheel from a thread of its own"""
+        threading.Thread(target=self.run_timers, name="timers", daemon=True).start()
+    
+    def run_timers(self):
+        while self.connected:
+            time.sleep(self.timers.tick)
+            self.timers.advance()
+    
+    def drop_connection(self, connection):
+        """Forget a disconnected client and close its room once empty"""
+        if connection.heartbeat is not None:
+            connection.heartbeat.cancel()
+        with self.rooms_lock:
+            if connection in self.client_connections:
+                self.client_connections.remove(connection)
+            seat = self.connection_seats.pop(connection, None)
         
-        end_game_msg = {
-            'type': 'game_end',
-            'scores': scores,
-            'winner': winner
+        if seat is not None:
+            room, _ = seat
+            room.actor.submit(self.leave_room, room, connection)
+    
+    def leave_room(self, room, connection):
+        """Remove a disconnected player from a room (runs on the room's actor)"""
+        room.remove_connection(connection)
+        self.close_room(room, only_if_empty=True)
+    
+    def publish(self, message):
+        """Tell the room directory about a room event, if there is one"""
+        if self.directory is not None:
+            self.directory.publish(message)
+    
+    def node_info(self):
+        """How the room directory should list this server process"""
+        port = self.port
+        if self.workers is not None:
+            port = self.workers.worker_port(self.worker_index)  # Skip the redirect
+        with self.rooms_lock:
+            rooms = list(self.rooms)
+        return {'host': self.advertise_host, 'port': port, 'rooms': rooms}
+    
+    def load_report(self):
+        """Load figures the room directory balances new games with"""
+        matchmaking_room = self.matchmaking_room
+        return {
+            'room_count': len(self.rooms),
+            'connections': len(self.client_connections),
+            'waiting': matchmaking_room.seats_taken if matchmaking_room and matchmaking_room.is_open() else 0
         }
-        self.broadcast_to_all(end_game_msg)
-        print(f"Game ended! Winner: {winner['player_name']} with {winner['final_wp']} WP")
-        
-        # Give clients time to process the end game message
-        threading.Timer(2.0, self.shutdown_server).start()
-    
-    def send_game_state_to_all(self):
-        """Send current game state to all players"""
-        for i, client in enumerate(self.client_connections):
-            self.send_game_status(client, i)
-    
-    def send_game_status(self, client_socket, player_index):
-        """Send game status to a specific client"""
-        if player_index < len(self.players):
-            player = self.players[player_index]
-            other_player = self.players[1 - player_index] if len(self.players) > 1 else None
-            
-            # Prepare player's hand (only send to the player themselves)
-            hand_data = []
-            for card in player.hand:
-                hand_data.append({
-                    'name': card.getName(),
-                    'power': card.getPower(),
-                    'cost': card.getCost(),
-                    'wp': card.getWP(),
-                    'ability': card.getAbility()
-                })
-            
-            # Prepare market data
-            market_data = []
-            for card in self.market.available_cards:
-                market_data.append({
-                    'name': card.getName(),
-                    'power': card.getPower(),
-                    'cost': card.getCost(),
-                    'wp': card.getWP(),
-                    'ability': card.getAbility()
-                })
-            
-            game_state = {
-                'type': 'game_state',
-                'current_player': self.current_player_index,
-                'is_your_turn': player_index == self.current_player_index,
-                'player': {
-                    'name': player.name,
-                    'hand': hand_data,
-                    'hand_size': len(player.hand),
-                    'draw_pile_size': len(player.draw_pile),
-                    'discard_pile_size': len(player.discard_pile),
-                    'turn_power': player.turn_power,
-                    'total_wp': player.calculate_total_wp()
-                },
-                'opponent': {
-                    'name': other_player.name if other_player else "Waiting...",
-                    'hand_size': len(other_player.hand) if other_player else 0,
-                    'draw_pile_size': len(other_player.draw_pile) if other_player else 0,
-                    'discard_pile_size': len(other_player.discard_pile) if other_player else 0,
-                    'turn_power': other_player.turn_power if other_player else 0,
-                    'total_wp': other_player.calculate_total_wp() if other_player else 0
-                },
-                'market': {
-                    'available_cards': market_data,
-                    'market_draw_pile_size': len(self.market.market_draw_pile)
-                }
-            }
-            self.send_to_client(client_socket, game_state)
-    
-    def is_current_player(self, player_index):
-        """Check if it's the current player's turn"""
-        return player_index == self.current_player_index and self.game_started and not self.game_ended
-    
-    def send_to_client(self, client_socket, message):
+    
+    def start_services(self):
+        """Start the timer wheel and the optional helpers once the server is listening"""
+        get_catalog()  # Parse cards.json now rather than on the first join
+        self.timers.schedule(CATALOG_CHECK_INTERVAL, self.check_catalogs)
+        if self.workers is not None:
+            self.timers.schedule(PARENT_CHECK_INTERVAL, self.check_parent)
+        self.start_timers()
+        if self.directory is not None:
+            self.directory.start()
+        if self.announcer is not None:
+            self.announcer.start()
+        if self.stats_address is not None:
+            host, port = self.stats_address
+            if self.workers is not None:
+                port += self.worker_index  # One endpoint per worker process
+            try:
+                serve_stats(self.render_stats, host, port)
+            except OSError as e:
+                print(f"Could not start stats endpoint on {host}:{port}: {e}")
+    
+    def render_stats(self):
+        """Current metrics in Prometheus text format"""
+        connections = list(self.client_connections)
+        queues = [connection.queue_stats() for connection in connections]
+        actor_depths = [room.actor.queue_depth() for room in list(self.rooms.values())]
+        labels = {'worker': str(self.worker_index)} if self.workers is not None else {}
+        gauges = [
+            ('rdb_rooms', "Active rooms", [(labels, len(actor_depths))]),
+            ('rdb_connections', "Open client connections", [(labels, len(connections))]),
+            ('rdb_outbox_messages', "Messages waiting in client outbound queues",
+             [(labels, sum(queue['queue_depth'] for queue in queues))]),
+            ('rdb_outbox_bytes', "Bytes waiting in client outbound queues",
+             [(labels, sum(queue['queued_bytes'] for queue in queues))]),
+            ('rdb_outbox_depth_max', "Deepest client outbound queue",
+             [(labels, max((queue['queue_depth'] for queue in queues), default=0))]),
+            ('rdb_outbox_dropped_messages', "Messages dropped by full outbound queues of open connections",
+             [(labels, sum(queue['dropped_messages'] for queue in queues))]),
+            ('rdb_room_queue_commands', "Commands waiting in room actor queues", [(labels, sum(actor_depths))]),
+            ('rdb_room_queue_depth_max', "Deepest room actor queue", [(labels, max(actor_depths, default=0))])
+        ]
+        return self.stats.render(gauges)
+    
+    def send_to_client(self, connection, message):
         """Send a message to a specific client"""
         try:
-            client_socket.send(json.dumps(message).encode('utf-8'))
+            start = time.perf_counter()
+            nbytes = connection.send(message)
+            self.stats.record_sent(message.get('type'), nbytes, time.perf_counter() - start)
         except Exception as e:
             print(f"Failed to send message to client: {e}")
     
-    def broadcast_to_all(self, message):
-        """Send a message to all connected clients"""
-        for client in self.client_connections:
-            self.send_to_client(client, message)
+    def send_to_many(self, connections, message):
+        """Send one message to many clients, encoding it once per wire format.
+        
+        Every spectator of a room gets the very same bytes, so fanning a
+        state change out costs one encode rather than one per watcher.
+        """
+        if not connections:
+            return
+        msg_type = message.get('type')
+        is_state = msg_type in STATE_MESSAGES
+        frames = {}  # (protocol, encoding) -> encoded frame
+        encode_time = 0.0
+        sent_bytes = 0
+        for connection in connections:
+            key = (connection.protocol or FRAMED_PROTOCOL, connection.encoding)
+            data = frames.get(key)
+            if data is None:
+                start = time.perf_counter()
+                data = frames[key] = encode_message(message, *key)
+                encode_time += time.perf_counter() - start
+            try:
+                connection.queue(data, is_state)
+            except Exception as e:
+                print(f"Failed to send message to client: {e}")
+            sent_bytes += len(data)
+        self.stats.record_sent(msg_type, sent_bytes, encode_time, count=len(connections), encodes=len(frames))
     
-    def send_error(self, client_socket, error_message):
+    def send_error(self, connection, error_message):
         """Send an error message to a client"""
         error_msg = {
             'type': 'error',
             'message': error_message
         }
-        self.send_to_client(client_socket, error_msg)
+        self.send_to_client(connection, error_msg)
     
     def shutdown_server(self):
         """Shutdown the server gracefully"""
         print("Shutting down server...")
         self.connected = False
-        self.game_ended = True
+        for listener in self.listeners:
+            try:
+                listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
 
-def main():
+class AsyncGameServer(GameServer):
+    """GameServer running every connection on a single asyncio event loop.
+    
+    Idle connections cost nothing: each one is a coroutine parked in
+    reader.read() instead of a thread waking up on a recv timeout.
+    Shutdown is reported through an asyncio.Event instead of a sleep loop.
+    """
+    def __init__(self, host='localhost', port=8888, backlog=1024, **options):
+        super().__init__(host, port, backlog, **options)
+        self.loop = None
+        self.servers = []  # asyncio Server per listening socket
+    
+    def start_server(self):
+        """Start the server and run the event loop until shutdown"""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("\nServer interrupted by user")
+    
+    async def serve(self):
+        """Accept connections until shutdown_server is called"""
+        self.loop = asyncio.get_running_loop()
+        self.shutdown_event = asyncio.Event()
+        try:
+            address = self.bind_listeners()
+            for listener in self.listeners:
+                listener.setblocking(False)
+                self.servers.append(await asyncio.start_server(self.handle_connection, sock=listener))
+            print(f"Game server (asyncio) started on {address}")
+            self.start_services()
+            print("Waiting for players to connect... Press Ctrl+C to stop server.")
+            
+            await self.shutdown_event.wait()
+        
+        except Exception as e:
+            print(f"Server error: {e}")
+        finally:
+            print("Server shutting down...")
+            for client in list(self.client_connections):
+                client.close()
+            for server in self.servers:
+                server.close()
+                await server.wait_closed()
+            for listener in self.listeners:
+                listener.close()
+            if self.directory is not None:
+                self.directory.stop()
+            if self.announcer is not None:
+                self.announcer.stop()
+    
+    async def handle_connection(self, reader, writer):
+        """Handle communication with a specific client"""
+        connection = StreamConnection(reader, writer, **self.connection_options())
+        address = connection.address
+        self.client_connections.append(connection)
+        self.watch_connection(connection)
+        print(f"Client connected from {address}")
+        
+        try:
+            while self.connected:
+                data = await reader.read(RECV_SIZE)
+                if not data:
+                    print(f"Client {address} disconnected (no data)")
+                    break
+                
+                self.handle_data(connection, data)
+        
+        except ConnectionResetError:
+            print(f"Client {address} disconnected (connection reset)")
+        except ProtocolError as e:
+            print(f"Protocol error from {address}: {e}")
+        except Exception as e:
+            print(f"Error handling client {address}: {e}")
+        finally:
+            print(f"Cleaning up connection for {address}")
+            self.drop_connection(connection)
+            connection.close()
+    
+    def start_timers(self):
+        """Advance the timer wheel from a task, so callbacks run on the loop"""
+        self.loop.create_task(self.run_timers())
+    
+    async def run_timers(self):
+        while self.connected:
+            await asyncio.sleep(self.timers.tick)
+            self.timers.advance()
+    
+    def create_actor(self, room_id):
+        return AsyncRoomActor(room_id)
+    
+    def shutdown_server(self):
+        """Shutdown the server gracefully"""
+        print("Shutting down server...")
+        self.connected = False
+        self.shutdown_event.set()
+
+def main(argv=None):
     """Main server function"""
-    import sys
+    import argparse
     
+    parser = argparse.ArgumentParser(
+        description="Rogue Deck Builder game server",
+        epilog="Examples:\n"
+               "  python3 server.py                    # Bind to all interfaces on port 8888\n"
+               "  python3 server.py 10.1.2.100        # Bind to ZeroTier IP\n"
+               "  python3 server.py 192.168.1.100     # Bind to local WiFi IP\n"
+               "  python3 server.py 0.0.0.0 9999      # Bind to all interfaces on port 9999\n"
+               "  python3 server.py 0.0.0.0 8888 --async\n"
+               "  python3 server.py --announce         # Let clients on the LAN find the server\n"
+               "\nTip: Use 'python3 network_info.py' to see your available IPs",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
     # Default to bind to all interfaces for network access
-    host = '0.0.0.0'  # Allows connections from any IP on the network
-    port = 8888
-    
-    # Allow command line arguments
-    if len(sys.argv) > 1:
-        if sys.argv[1] in ['-h', '--help']:
-            print("Usage: python3 server.py [host] [port]")
-            print("  host: IP address to bind to (default: 0.0.0.0 for all interfaces)")
-            print("  port: Port to listen on (default: 8888)")
-            print("\nExamples:")
-            print("  python3 server.py                    # Bind to all interfaces on port 8888")
-            print("  python3 server.py 10.1.2.100        # Bind to ZeroTier IP")
-            print("  python3 server.py 192.168.1.100     # Bind to local WiFi IP")
-            print("  python3 server.py 0.0.0.0 9999      # Bind to all interfaces on port 9999")
-            print("\nTip: Use 'python3 network_info.py' to see your available IPs")
-            return
-        
-        host = sys.argv[1]
-        if len(sys.argv) > 2:
-            try:
-                port = int(sys.argv[2])
-            except ValueError:
-                print("Invalid port number, using default 8888")
-                port = 8888
+    parser.add_argument('host', nargs='?', default='0.0.0.0',
+                        help="IP address to bind to (default: 0.0.0.0 for all interfaces)")
+    parser.add_argument('port', nargs='?', type=int, default=8888,
+                        help="Port to listen on (default: 8888)")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Serve every connection from one asyncio event loop")
+    parser.add_argument('--queue-limit', type=int, default=DEFAULT_QUEUE_LIMIT,
+                        help=f"Outbound messages buffered per client (default: {DEFAULT_QUEUE_LIMIT})")
+    parser.add_argument('--overflow', choices=OVERFLOW_POLICIES, default=OVERFLOW_COLLAPSE,
+                        help="When a client's queue is full: collapse queued game_state "
+                             "updates into one snapshot, or disconnect (default: collapse)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Server processes sharing the port, one per core is a good start "
+                             "(default: 1). Worker i also accepts redirected players on port+1+i")
+    parser.add_argument('--directory', metavar='HOST:PORT',
+                        help="Register rooms and load with a room directory (see directory.py)")
+    parser.add_argument('--advertise', metavar='HOST',
+                        help="Address the directory hands out for this server "
+                             "(default: the one it sees the server connect from)")
+    parser.add_argument('--stats-port', type=int, metavar='PORT',
+                        help="Serve Prometheus metrics at http://127.0.0.1:PORT/metrics "
+                             "(worker i uses PORT+i)")
+    parser.add_argument('--stats-host', default='127.0.0.1',
+                        help="Address for the metrics endpoint (default: 127.0.0.1)")
+    parser.add_argument('--announce', action='store_true',
+                        help="Let clients on the LAN find this server (answers on UDP port 8887)")
+    parser.add_argument('--market-slots', type=int, default=MARKET_SLOTS, metavar='N',
+                        help=f"Cards on offer in each game's market (default: {MARKET_SLOTS})")
+    parser.add_argument('--check-totals', action='store_true',
+                        help="Debug: check players' running WP and card totals against a full recount on every read")
+    parser.add_argument('--turn-time', type=float, metavar='SECONDS',
+                        help="End a player's turn for them after this long (default: no limit)")
+    parser.add_argument('--idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT, metavar='SECONDS',
+                        help="Disconnect clients that stay silent this long, 0 to never "
+                             f"(default: {DEFAULT_IDLE_TIMEOUT:.0f}; clients are pinged every "
+                             f"{HEARTBEAT_INTERVAL:.0f}s)")
+    args = parser.parse_args(argv)
+    host = args.host
+    port = args.port
     
     print("🎮 === Rogue Deck Builder Server ===")
     print(f"Server will bind to: {host}:{port}")
     
     if host == '0.0.0.0':
         print("📡 Server accessible from any device on connected networks")
-        # Try to show available network interfaces
-        try:
-            import subprocess
-            result = subprocess.run(['hostname', '-I'], capture_output=True, text=True)
-            if result.returncode == 0:
-                local_ips = result.stdout.strip().split()
-                if local_ips:
-                    print("🔸 Available IP addresses:")
-                    for ip in local_ips:
-                        if not ip.startswith('127.'):
-                            # Try to identify ZeroTier IPs
-                            if ip.startswith('10.') or (ip.startswith('172.') and 16 <= int(ip.split('.')[1]) <= 31):
-                                print(f"   🚀 {ip} (likely ZeroTier/VPN)")
-                            else:
-                                print(f"   📶 {ip} (local network)")
-                    print(f"ℹ️  Run 'python3 network_info.py' for detailed network information")
-        except:
+        # Show available network interfaces
+        from network_info import get_network_interfaces
+        interfaces = get_network_interfaces()
+        if interfaces:
+            print("🔸 Available IP addresses:")
+            for interface in interfaces:
+                ip = interface['ip']
+                if interface['priority'] == 1 or ip.startswith('10.') or (
+                        ip.startswith('172.') and 16 <= int(ip.split('.')[1]) <= 31):
+                    print(f"   🚀 {ip} on {interface['name']} (likely ZeroTier/VPN)")
+                else:
+                    print(f"   📶 {ip} on {interface['name']} (local network)")
+            print(f"ℹ️  Run 'python3 network_info.py' for detailed network information")
+        else:
             print("ℹ️  Run 'python3 network_info.py' to see your available networks")
     else:
         print(f"🎯 Server accessible at: {host}:{port}")
@@ -459,11 +733,34 @@ def main():
             print("🚀 Using ZeroTier/VPN network - great for bypassing WiFi restrictions!")
     
     print("\n🚀 Starting server...")
-    print("   Waiting for 2 players to connect...")
+    print("   Every 2 players that join get their own room (game)")
     print("   Press Ctrl+C to stop server")
     print()
     
-    server = GameServer(host, port)
+    options = {
+        'queue_limit': args.queue_limit,
+        'overflow_policy': args.overflow,
+        'turn_time': args.turn_time,
+        'idle_timeout': args.idle_timeout,
+        'market_slots': args.market_slots
+    }
+    if args.announce:
+        options['announce'] = True
+    if args.check_totals:
+        options['check_totals'] = True
+    if args.stats_port:
+        options['stats_address'] = (args.stats_host, args.stats_port)
+    if args.directory:
+        from directory import parse_address
+        options['directory'] = parse_address(args.directory)
+        options['advertise_host'] = args.advertise or (host if host != '0.0.0.0' else None)
+    server_class = AsyncGameServer if args.use_async else GameServer
+    if args.workers > 1:
+        from workers import WorkerGroup, run_workers
+        run_workers(WorkerGroup(host, port, args.workers), server_class, options)
+        return
+    
+    server = server_class(host, port, **options)
     try:
         server.start_server()
     except KeyboardInterrupt:
@@ -0,0 +1,223 @@
+"""
+Server instrumentation and the Prometheus text endpoint
+
+GameServer records into a ServerStats as it works: how long each command
+type takes from arrival to being applied, how long encoding an outgoing
+message takes, and how many messages and bytes go each way. With
+--stats-port the numbers are served over HTTP (GET /metrics) in the
+Prometheus text exposition format, alongside gauges the server fills in at
+scrape time (rooms, connections, queue depths).
+"""
+
+import bisect
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)
+QUANTILES = (0.5, 0.95, 0.99)
+RATE_WINDOW = 10  # Seconds the per-second rates are averaged over
+
+
+class Histogram:
+    """Fixed-bucket histogram; percentiles are interpolated within a bucket"""
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+    
+    def percentile(self, q):
+        """Estimate the q-quantile (0..1) of everything observed"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+
+class RateMeter:
+    """Events per second over the last RATE_WINDOW whole seconds"""
+    def __init__(self, window=RATE_WINDOW):
+        self.window = window
+        self.slots = [0] * window
+        self.slot_seconds = [0] * window  # Which second each slot currently counts
+    
+    def add(self, amount=1, now=None):
+        second = int(now if now is not None else time.monotonic())
+        slot = second % self.window
+        if self.slot_seconds[slot] != second:
+            self.slot_seconds[slot] = second
+            self.slots[slot] = 0
+        self.slots[slot] += amount
+    
+    def rate(self, now=None):
+        second = int(now if now is not None else time.monotonic())
+        total = sum(amount for amount, slot_second in zip(self.slots, self.slot_seconds)
+                    if second - self.window <= slot_second < second)
+        return total / self.window
+
+
+class ServerStats:
+    """Everything GameServer measures about its own traffic"""
+    def __init__(self):
+        self.lock = threading.Lock()  # Recorded from handler, actor and writer threads
+        self.started = time.time()
+        self.handle_latency = {}  # msg_type -> Histogram, arrival to applied
+        self.encode_time = Histogram()
+        self.messages = {'in': {}, 'out': {}}  # direction -> msg_type -> count
+        self.bytes = {'in': 0, 'out': 0}
+        self.message_rates = {'in': RateMeter(), 'out': RateMeter()}
+        self.byte_rates = {'in': RateMeter(), 'out': RateMeter()}
+        self.compression_bytes = {'before': 0, 'after': 0}  # Outgoing bytes of compressed connections
+    
+    def record_received(self, nbytes, msg_types):
+        """Count one recv worth of bytes and the messages decoded from it"""
+        now = time.monotonic()
+        with self.lock:
+            self.bytes['in'] += nbytes
+            self.byte_rates['in'].add(nbytes, now)
+            counts = self.messages['in']
+            for msg_type in msg_types:
+                counts[msg_type] = counts.get(msg_type, 0) + 1
+            self.message_rates['in'].add(len(msg_types), now)
+    
+    def record_handled(self, msg_type, seconds):
+        """Time from a command arriving to the room having applied it"""
+        with self.lock:
+            histogram = self.handle_latency.get(msg_type)
+            if histogram is None:
+                histogram = self.handle_latency[msg_type] = Histogram()
+            histogram.observe(seconds)
+    
+    def record_sent(self, msg_type, nbytes, seconds, count=1, encodes=1):
+        """Count outgoing messages and how long encoding them took.
+        
+        A fan-out sends count copies of a message that was encoded only
+        encodes times; seconds is the total spent encoding.
+        """
+        now = time.monotonic()
+        with self.lock:
+            counts = self.messages['out']
+            counts[msg_type] = counts.get(msg_type, 0) + count
+            self.bytes['out'] += nbytes
+            self.message_rates['out'].add(count, now)
+            self.byte_rates['out'].add(nbytes, now)
+            for _ in range(encodes):
+                self.encode_time.observe(seconds / encodes)
+    
+    def record_compressed(self, before, after):
+        """Count one write on a compressed connection, before and after deflating"""
+        with self.lock:
+            self.compression_bytes['before'] += before
+            self.compression_bytes['after'] += after
+    
+    def render(self, gauges=()):
+        """Prometheus text exposition of everything recorded plus the given gauges.
+        
+        gauges is a list of (name, help, value) or (name, help, [(labels, value)]).
+        """
+        lines = []
+        with self.lock:
+            _metric(lines, 'rdb_uptime_seconds', 'gauge', "Seconds since the server started",
+                    [({}, time.time() - self.started)])
+            
+            _metric(lines, 'rdb_messages_total', 'counter', "Messages by direction and type",
+                    [({'direction': direction, 'msg_type': msg_type}, count)
+                     for direction, counts in self.messages.items()
+                     for msg_type, count in sorted(counts.items())])
+            _metric(lines, 'rdb_bytes_total', 'counter', "Bytes by direction",
+                    [({'direction': direction}, count) for direction, count in self.bytes.items()])
+            _metric(lines, 'rdb_compression_bytes_total', 'counter',
+                    "Outgoing bytes on compressed connections, before and after compression",
+                    [({'stage': stage}, count) for stage, count in self.compression_bytes.items()])
+            _metric(lines, 'rdb_messages_per_second', 'gauge',
+                    f"Messages per second over the last {RATE_WINDOW}s",
+                    [({'direction': direction}, meter.rate()) for direction, meter in self.message_rates.items()])
+            _metric(lines, 'rdb_bytes_per_second', 'gauge',
+                    f"Bytes per second over the last {RATE_WINDOW}s",
+                    [({'direction': direction}, meter.rate()) for direction, meter in self.byte_rates.items()])
+            
+            _histogram(lines, 'rdb_handle_seconds', "Time from a command arriving to it being applied",
+                       [({'msg_type': msg_type}, histogram)
+                        for msg_type, histogram in sorted(self.handle_latency.items())])
+            _metric(lines, 'rdb_handle_quantile_seconds', 'gauge', "Estimated command handling latency percentiles",
+                    [({'msg_type': msg_type, 'quantile': str(q)}, histogram.percentile(q))
+                     for msg_type, histogram in sorted(self.handle_latency.items())
+                     for q in QUANTILES])
+            
+            _histogram(lines, 'rdb_encode_seconds', "Time spent encoding one outgoing message",
+                       [({}, self.encode_time)])
+            _metric(lines, 'rdb_encode_quantile_seconds', 'gauge', "Estimated encode time percentiles",
+                    [({'quantile': str(q)}, self.encode_time.percentile(q)) for q in QUANTILES])
+        
+        for name, help_text, value in gauges:
+            samples = value if isinstance(value, list) else [({}, value)]
+            _metric(lines, name, 'gauge', help_text, samples)
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+
+def _metric(lines, name, kind, help_text, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels)} {value:.9g}")
+
+
+def _histogram(lines, name, help_text, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in samples:
+        cumulative = 0
+        for bound, count in zip(histogram.bounds + (float('inf'),), histogram.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else f'{bound:g}'
+            lines.append(f"{name}_bucket{_labels(dict(labels, le=le))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram.sum:.9g}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+
+def serve_stats(render, host='127.0.0.1', port=9100):
+    """Serve render() at /metrics from a background thread; returns the HTTP server"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Only servers with --stats-port pay for it
+    
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass  # Scrapes every few seconds would drown out the game log
+    
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="stats", daemon=True).start()
+    print(f"Stats endpoint at http://{host}:{port}/metrics")
+    return httpd
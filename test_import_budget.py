@@ -0,0 +1,36 @@
+"""
+Import-time budgets for every launcher mode
+
+Scripted client fleets start thousands of short-lived interpreters, so a
+heavy import on the client path costs them dearly. This fails when a module
+takes longer to import than launcher.IMPORT_BUDGETS allows, or does not
+import at all:
+
+    python3 -m unittest test_import_budget
+    IMPORT_BUDGET_SCALE=2 python3 -m unittest test_import_budget  # slow CI machines
+"""
+
+import os
+import unittest
+import launcher
+
+BUDGET_SCALE = float(os.environ.get('IMPORT_BUDGET_SCALE', 1))
+RUNS = 3  # Take the fastest of this many imports
+
+
+class ImportBudgetTest(unittest.TestCase):
+    def test_modes_import_within_budget(self):
+        for module, budget in launcher.IMPORT_BUDGETS.items():
+            with self.subTest(module=module):
+                milliseconds = min(launcher.import_time(module) for _ in range(RUNS)) / 1000
+                self.assertLessEqual(milliseconds, budget * BUDGET_SCALE,
+                                     f"importing {module} took {milliseconds:.1f} ms")
+    
+    def test_failed_import_is_an_error(self):
+        # A failed import still gets an importtime line; it must not pass as fast
+        with self.assertRaises(RuntimeError):
+            launcher.import_time('no_such_module')
+
+
+if __name__ == "__main__":
+    unittest.main()
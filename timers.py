@@ -0,0 +1,134 @@
+"""
+Hierarchical timer wheel for the server's timeouts
+
+Heartbeats, idle-connection reaping, turn deadlines and room shutdowns are
+all timers on one TimerWheel per server process instead of a sleeping
+thread (or a periodic scan over every connection and room) each.
+
+The wheel counts time in ticks of TICK seconds. Level 0 has one slot per
+tick for the next SLOTS ticks, level 1 one slot per SLOTS ticks, and so on;
+a timer lives in the slot of the lowest level its deadline fits in.
+Whenever level 0 wraps around, the next slot of level 1 is emptied and its
+timers are spread over level 0 (likewise further up). Scheduling and
+cancelling are O(1), a tick only touches the slots it empties, and every
+timer is moved at most LEVELS - 1 times before it fires. Deadlines are
+rounded up to the next tick, so a timer never fires early, and at most a
+tick late when the process keeps up.
+
+The wheel does not keep time itself: the server advances it from a thread
+or an asyncio task (see GameServer.run_timers) and callbacks run there, so
+they should be quick. Room callbacks submit to the room's actor.
+"""
+
+import math
+import threading
+import time
+
+TICK = 0.1  # Seconds per tick
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS  # 64 slots per level
+LEVELS = 4  # Covers 64**4 ticks, about 19 days; anything later waits at the top level
+
+
+class Timer:
+    """Handle for one scheduled callback"""
+    __slots__ = ('wheel', 'deadline', 'callback', 'args', 'slot')
+    
+    def __init__(self, wheel, deadline, callback, args):
+        self.wheel = wheel
+        self.deadline = deadline  # Tick the callback is due at
+        self.callback = callback
+        self.args = args
+        self.slot = None  # Set holding this timer while it is pending
+    
+    def cancel(self):
+        """Stop the callback from running; harmless if it already has"""
+        self.wheel.cancel(self)
+    
+    @property
+    def pending(self):
+        return self.slot is not None
+
+
+class TimerWheel:
+    """Timers bucketed by deadline over LEVELS wheels of SLOTS slots"""
+    def __init__(self, tick=TICK, now=None):
+        self.tick = tick
+        self.current = self.tick_at(time.monotonic() if now is None else now)  # Last tick processed
+        self.levels = [[set() for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self.lock = threading.Lock()  # Timers are scheduled from handler and actor threads
+        self.count = 0
+    
+    def tick_at(self, now):
+        return int(now / self.tick)
+    
+    def schedule(self, delay, callback, *args):
+        """Run callback(*args) after delay seconds; returns a Timer to cancel it with"""
+        due = time.monotonic() + delay
+        with self.lock:
+            deadline = max(self.current + 1, math.ceil(due / self.tick))
+            timer = Timer(self, deadline, callback, args)
+            self.place(timer)
+            self.count += 1
+        return timer
+    
+    def cancel(self, timer):
+        with self.lock:
+            if timer.slot is not None:
+                timer.slot.discard(timer)
+                timer.slot = None
+                self.count -= 1
+    
+    def place(self, timer):
+        """Put a timer in the slot its deadline falls in (lock held)"""
+        ticks = timer.deadline - self.current
+        for level in range(LEVELS):
+            if ticks < 1 << (SLOT_BITS * (level + 1)):
+                break
+        else:
+            # Too far out: park it in the last top-level slot, it is placed again from there
+            level = LEVELS - 1
+            ticks = (1 << (SLOT_BITS * LEVELS)) - 1
+        shift = SLOT_BITS * level
+        slot = self.levels[level][((self.current + ticks) >> shift) & (SLOTS - 1)]
+        slot.add(timer)
+        timer.slot = slot
+    
+    def advance(self, now=None):
+        """Process every tick up to now and run the callbacks that came due"""
+        target = self.tick_at(time.monotonic() if now is None else now)
+        while True:
+            with self.lock:
+                if self.current >= target:
+                    return
+                self.current += 1
+                due = self.expire_tick()
+            for timer in due:
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    print(f"Timer callback {getattr(timer.callback, '__name__', timer.callback)} failed: {e}")
+    
+    def expire_tick(self):
+        """Cascade higher levels as lower ones wrap, then empty the current
+        level-0 slot; returns its timers (lock held)"""
+        current = self.current
+        for level in range(1, LEVELS):
+            if current & ((1 << (SLOT_BITS * level)) - 1):
+                break
+            index = (current >> (SLOT_BITS * level)) & (SLOTS - 1)
+            timers = self.levels[level][index]
+            self.levels[level][index] = set()
+            for timer in timers:
+                self.place(timer)
+        
+        index = current & (SLOTS - 1)
+        due = self.levels[0][index]
+        self.levels[0][index] = set()
+        for timer in due:
+            timer.slot = None
+        self.count -= len(due)
+        return due
+    
+    def __len__(self):
+        return self.count
@@ -0,0 +1,107 @@
+"""
+Multi-process sharding for server.py --workers N
+
+Game logic and message encoding run under one interpreter lock, so a single
+server process only ever uses one core. With --workers the server forks N
+processes that all accept on the same port through SO_REUSEPORT (the kernel
+spreads new connections between them) and each owns its own rooms.
+
+Room ids name their owner ('3fa9c1-2' lives on worker 2). A player who
+lands on the wrong worker is sent a 'redirect' to that worker's private
+port (port + 1 + index), where only the owning worker accepts. Quick match
+fills one room at a time on whichever worker currently holds the shared
+matchmaking turn, which then passes to the next worker, so consecutive
+games are spread round-robin across all workers.
+
+Ctrl+C reaches every process of the group. SIGTERM, as sent by systemd,
+docker stop or kill, only reaches the parent, which then terminates and
+waits for its workers. A worker whose parent is gone anyway (SIGKILL, a
+crash) notices from its timer wheel and shuts itself down, so no worker
+is left holding the port.
+"""
+
+import multiprocessing
+import signal
+
+
+class WorkerGroup:
+    """Layout shared by every worker process of one server"""
+    def __init__(self, host, port, count):
+        self.host = host
+        self.port = port
+        self.count = count
+        self.matchmaking = multiprocessing.Value('i', 0)  # Worker whose room quick match fills next
+    
+    def worker_port(self, index):
+        """Private port on which only worker index accepts connections"""
+        return self.port + 1 + index
+    
+    def room_id(self, index, name):
+        """Tag a room name with the worker that owns it"""
+        return f"{name}-{index}"
+    
+    def room_owner(self, room_id):
+        """Worker index a room id belongs to, or None if it names no worker"""
+        _, separator, index = str(room_id).rpartition('-')
+        if not separator or not index.isdigit() or int(index) >= self.count:
+            return None
+        return int(index)
+    
+    def matchmaking_worker(self):
+        """Worker that should seat the next quick-match player"""
+        return self.matchmaking.value
+    
+    def parent_alive(self):
+        """Whether the process that started the workers still runs (call in a worker)"""
+        parent = multiprocessing.parent_process()  # Watches a pipe the parent holds open
+        return parent is None or parent.is_alive()
+    
+    def advance_matchmaking(self, index):
+        """Pass the matchmaking turn on once worker index has filled its room"""
+        with self.matchmaking.get_lock():
+            if self.matchmaking.value == index:
+                self.matchmaking.value = (index + 1) % self.count
+
+
+def serve_worker(group, index, server_class, options):
+    """Entry point of one worker process"""
+    server = server_class(group.host, group.port, workers=group, worker_index=index, **options)
+    server.start_server()
+
+
+def run_workers(group, server_class, options):
+    """Start one server process per worker and wait for all of them"""
+    processes = []
+    for index in range(group.count):
+        process = multiprocessing.Process(
+            target=serve_worker,
+            args=(group, index, server_class, options),
+            name=f"worker-{index}"
+        )
+        process.start()
+        processes.append(process)
+    print(f"Started {group.count} worker processes on port {group.port} "
+          f"(private ports {group.worker_port(0)}-{group.worker_port(group.count - 1)})")
+    
+    # Installed after the workers started, so they keep the default SIGTERM action
+    signal.signal(signal.SIGTERM, exit_on_sigterm)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Ctrl+C reaches the whole process group; give workers time to shut down
+        print("\nWaiting for workers to stop...")
+        for process in processes:
+            process.join(5)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+
+
+def exit_on_sigterm(signum, frame):
+    """SIGTERM in the parent: unwind run_workers so it stops the workers too"""
+    print("\nTerminated, stopping workers...")
+    raise SystemExit(128 + signum)